@@ -63,7 +63,7 @@ from utils.general import (
     strip_optimizer,
     xyxy2xywh,
 )
-from utils.torch_utils import select_device, smart_inference_mode
+from utils.torch_utils import select_device, set_inference_threads, smart_inference_mode
 
 
 @smart_inference_mode()
@@ -97,6 +97,9 @@ def run(
     half=False,  # use FP16 half-precision inference
     dnn=False,  # use OpenCV DNN for ONNX inference
     vid_stride=1,  # video frame-rate stride
+    intra_op_threads=None,  # torch intra-op threads per process (None = unchanged)
+    inter_op_threads=None,  # torch inter-op threads per process (None = unchanged)
+    cv_threads=None,  # OpenCV threads per process (None = unchanged)
 ):
     """Runs YOLOv5 detection inference on various sources like images, videos, directories, streams, etc.
 
@@ -132,6 +135,9 @@ def run(
         half (bool): If True, use FP16 half-precision inference. Default is False.
         dnn (bool): If True, use OpenCV DNN backend for ONNX inference. Default is False.
         vid_stride (int): Stride for processing video frames, to skip frames between processing. Default is 1.
+        intra_op_threads (int | None): Torch intra-op (and OpenMP) threads for this process. Default is None.
+        inter_op_threads (int | None): Torch inter-op threads for this process. Default is None.
+        cv_threads (int | None): OpenCV threads for this process. Default is None.
 
     Returns:
         None
@@ -160,6 +166,9 @@ def run(
     save_dir = increment_path(Path(project) / name, exist_ok=exist_ok)  # increment run
     (save_dir / "labels" if save_txt else save_dir).mkdir(parents=True, exist_ok=True)  # make dir
 
+    # Thread limits, set before the model runs so several detect processes do not oversubscribe the CPU
+    set_inference_threads(intra_op=intra_op_threads, inter_op=inter_op_threads, opencv=cv_threads)
+
     # Load model
     device = select_device(device)
     model = DetectMultiBackend(weights, device=device, dnn=dnn, data=data, fp16=half)
@@ -352,6 +361,9 @@ def parse_opt():
         --half (bool, 可选): 是否使用 FP16 半精度推理。默认值为 False。
         --dnn (bool, 可选): 是否使用 OpenCV DNN 进行 ONNX 推理。默认值为 False。
         --vid-stride (int, 可选): 视频帧率步长，决定连续帧之间跳过的帧数。默认值为 1。
+        --intra-op-threads (int, 可选): 每个进程的 PyTorch 算子内线程数（同时设置 OpenMP）。默认值为 None（不修改）。
+        --inter-op-threads (int, 可选): 每个进程的 PyTorch 算子间线程数。默认值为 None（不修改）。
+        --cv-threads (int, 可选): 每个进程的 OpenCV 线程数。默认值为 None（不修改）。
 
     返回:
         argparse.Namespace: 解析后的命令行参数，以 argparse.Namespace 对象形式返回。
@@ -397,6 +409,9 @@ def parse_opt():
     parser.add_argument("--half", action="store_true", help="use FP16 half-precision inference")
     parser.add_argument("--dnn", action="store_true", help="use OpenCV DNN for ONNX inference")
     parser.add_argument("--vid-stride", type=int, default=1, help="video frame-rate stride")
+    parser.add_argument("--intra-op-threads", type=int, default=None, help="torch intra-op threads per process")
+    parser.add_argument("--inter-op-threads", type=int, default=None, help="torch inter-op threads per process")
+    parser.add_argument("--cv-threads", type=int, default=None, help="OpenCV threads per process")
     opt = parser.parse_args()
     opt.imgsz *= 2 if len(opt.imgsz) == 1 else 1  # expand
     print_args(vars(opt))
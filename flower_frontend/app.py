@@ -5,33 +5,60 @@ import os
 import sys
 import base64
 import io
+import numpy as np
 from flask import Flask, request, jsonify, send_from_directory, g
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 
 # 导入图片EXIF信息提取所需模块
 from PIL import Image
 from PIL.ExifTags import TAGS
 import exifread
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderServiceError
 import time
+import threading
+import functools
+
+# 导入逆地理编码缓存
+from geocoding import GeocodingCache, AddressResolver, create_geocoding_provider
+
+# 导入跨请求微批处理推理队列
+from inference_queue import InferenceBatcher, InferenceBatcherClosed, InferenceQueueFull
+
+# 导入识别结果缓存
+from result_cache import RecognitionResultCache, make_result_cache_key
+
+# 导入相册图片衍生图（缩略图/中等尺寸图）生成
+from derivatives import DerivativeGenerator
+
+# 导入按内容寻址的图片存储
+from blob_store import BlobStore
+
+# 导入访问流量缓冲写入
+from traffic_buffer import TrafficBuffer
+
+# 导入游标分页
+from pagination import next_cursor
 
 # 导入数据库操作模块
 from db import (
     create_user, get_user_by_username, get_user_by_id, verify_password,
-    create_post, get_posts, get_post_by_id, update_post, delete_post,
+    create_post, get_posts, get_feed, get_home_timeline, get_post_by_id, update_post, delete_post,
     create_comment, get_comments_by_post_id, delete_comment,
     like_post, unlike_post, is_post_liked_by_user,
     follow_user, unfollow_user, is_following, get_user_following, get_user_followers,
-    check_user_permission,
+    get_user_access, get_permission_cache_stats,
     # 超级管理员端函数
-    create_system_log, get_system_logs, record_traffic, get_traffic_stats, get_traffic_by_endpoint,
+    create_system_log, get_system_logs, get_traffic_stats, get_traffic_by_endpoint,
     record_server_status, get_server_status, get_latest_server_metrics,
     record_admin_operation, get_admin_operations, get_all_admins, update_user_role, get_system_summary,
     # 用户端新功能
+    save_recognition_result,
     update_user_profile, get_user_recognition_history, delete_recognition_result,
     create_album, get_user_albums, get_album_by_id, update_album, delete_album,
     add_image_to_album, get_album_images, delete_album_image, get_album_categories,
+    update_image_derivatives, set_blob_release_handler, get_blob_stats, get_db_pool_stats,
+    begin_db_session, end_db_session, db_session, after_db_commit, record_traffic_batch, get_traffic_timeseries, prune_traffic_data,
+    get_schema_version, check_query_plans, run_exclusive,
     create_feedback, get_user_feedback, get_feedback_by_id, delete_feedback,
     get_all_feedback, respond_feedback,
     create_announcement, get_announcements, update_announcement, delete_announcement,
@@ -45,45 +72,142 @@ CORS(app)  # 启用CORS以允许前端访问
 # 定义静态文件目录
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# 将YOLOv5项目根目录加入模块搜索路径，以便复用utils/models中的代码
+YOLO_ROOT = os.path.dirname(BASE_DIR)
+if YOLO_ROOT not in sys.path:
+    sys.path.append(YOLO_ROOT)
+
+# 导入识别前的图片预处理（draft解码 + letterbox）
+from preprocess import preprocess_image
+
+# 导入模型注册表
+from model_registry import ModelRegistry, ModelManager, RegisteredModel
+
 # JWT配置
 app.config['SECRET_KEY'] = 'flower_recognition_secret_key'
 app.config['JWT_EXPIRATION_DELTA'] = 3600  # JWT过期时间（秒）
 
+# 模型配置
+# 识别模型权重，支持export.py导出的格式：.pt / .torchscript / .onnx / *_openvino_model目录 / .engine 等
+# 只有CPU的服务器上推荐使用ONNX Runtime（testflowers.onnx）或OpenVINO（testflowers_openvino_model）
+app.config['MODEL_WEIGHTS'] = os.path.join(YOLO_ROOT, 'testflowers.pt')
+app.config['MODEL_DEVICE'] = ''  # 推理设备，''表示自动选择（有GPU时使用GPU），也可设为'cpu'或'0'
+app.config['MODEL_WARMUP'] = True  # 加载后用空白图片预热一次
+app.config['MODEL_ROUTING_FILE'] = os.path.join(BASE_DIR, 'model_routing.json')  # 模型版本路由配置，各worker共享
+app.config['MODEL_CHECK_INTERVAL'] = 5  # 检查路由配置和权重文件变化的间隔（秒）
+
+# ASGI模式配置（uvicorn asgi:application）
+app.config['ASGI_CPU_WORKERS'] = 8  # 执行图片解码、结果组装等同步工作的线程数
+app.config['ASGI_DB_POOL_SIZE'] = 10  # 异步数据库连接池大小
+
+# 推理线程配置（每个worker进程），多个worker各自使用默认线程数会争抢CPU核心
+# 可用 python tune_threads.py 在样例图片上测试并推荐worker数和线程数
+app.config['INFERENCE_INTRA_OP_THREADS'] = int(os.getenv('FLOWER_INTRA_OP_THREADS', '0')) or None  # None: CPU核数/worker数
+app.config['INFERENCE_INTER_OP_THREADS'] = int(os.getenv('FLOWER_INTER_OP_THREADS', '1'))
+app.config['INFERENCE_OPENCV_THREADS'] = int(os.getenv('FLOWER_OPENCV_THREADS', '1'))
+
+# 识别配置
+app.config['DETECT_IMG_SIZE'] = 640  # 模型输入尺寸，图片按比例缩放后填充为正方形
+app.config['DETECT_BATCH_SIZE'] = 16  # 单次前向推理的最大图片数
+app.config['DETECT_BATCH_WINDOW_MS'] = 10  # 推理线程凑批的最长等待时间（毫秒）
+app.config['DETECT_QUEUE_SIZE'] = 256  # 推理队列最多排队的图片数，超出时返回503
+app.config['DETECT_TIMEOUT'] = 60  # 请求等待推理结果的超时时间（秒）
+
+# 上传配置
+app.config['MAX_CONTENT_LENGTH'] = 200 * 1024 * 1024  # 单个请求体最大字节数（Flask内置限制）
+app.config['DETECT_MAX_FILE_SIZE'] = 30 * 1024 * 1024  # 单张图片最大字节数
+app.config['DETECT_MAX_FILES'] = 50  # 单个请求最多上传的图片数
+app.config['UPLOAD_READ_CHUNK_SIZE'] = 256 * 1024  # 读取上传流的分块大小
+
+# 逆地理编码配置
+app.config['GEOCODER_PROVIDER'] = 'nominatim'  # nominatim: 在线服务; offline: 本地离线地点文件
+app.config['GEOCODER_OFFLINE_PLACES'] = os.path.join(BASE_DIR, 'offline_places.json')  # 离线模式使用的地点文件
+app.config['GEOCODER_TIMEOUT'] = 5  # 单次请求超时时间（秒）
+app.config['GEOCODER_GRID_METERS'] = 100  # 经纬度量化网格大小（米），同一网格内共用缓存
+app.config['GEOCODER_CACHE_SIZE'] = 4096  # 进程内LRU缓存条目数
+app.config['GEOCODER_CACHE_TTL'] = 30 * 86400  # 地址缓存有效期（秒）
+app.config['GEOCODER_NEGATIVE_TTL'] = 86400  # 查不到地址时的负缓存有效期（秒）
+app.config['GEOCODER_ERROR_TTL'] = 300  # 服务出错时的负缓存有效期（秒）
+app.config['GEOCODER_CACHE_DB'] = os.path.join(BASE_DIR, 'instance', 'geocode_cache.db')  # 持久化缓存SQLite文件
+app.config['GEOCODER_DEFERRED'] = True  # 识别接口不等待地址解析，客户端通过 /api/address/<job_id> 轮询
+app.config['GEOCODER_WORKERS'] = 4  # 后台地址解析线程数
+
+# 识别结果缓存配置
+app.config['RESULT_CACHE_MAX_BYTES'] = 64 * 1024 * 1024  # 内存缓存最大占用字节数
+app.config['RESULT_CACHE_TTL'] = 7 * 86400  # 缓存有效期（秒）
+app.config['RESULT_CACHE_DB'] = None  # 持久化缓存SQLite文件路径，为None时只使用内存缓存
+
+# 相册图片衍生图配置
+app.config['DERIVATIVE_FORMAT'] = 'webp'  # webp或jpeg，Pillow不支持WebP时自动使用jpeg
+app.config['DERIVATIVE_QUALITY'] = 80
+app.config['DERIVATIVE_SIZES'] = {'thumb': 256, 'medium': 1024}  # 衍生图名称 -> 最长边像素
+app.config['DERIVATIVE_WORKERS'] = 2  # 后台生成衍生图的线程数
+
+# 访问流量记录配置
+app.config['TRAFFIC_BATCH_SIZE'] = 500  # 每次批量写入的最大记录数
+app.config['TRAFFIC_FLUSH_INTERVAL'] = 2.0  # 后台写入间隔（秒）
+app.config['TRAFFIC_MAX_BUFFER'] = 50000  # 缓冲区最多保存的记录数，超出时丢弃
+app.config['TRAFFIC_RAW_RETENTION_DAYS'] = 7  # 原始访问记录保留天数
+app.config['TRAFFIC_MINUTE_RETENTION_DAYS'] = 2  # 分钟粒度汇总保留天数
+app.config['TRAFFIC_HOUR_RETENTION_DAYS'] = 90  # 小时粒度汇总保留天数（按天汇总永久保留）
+app.config['TRAFFIC_PRUNE_INTERVAL'] = 3600  # 清理过期数据的间隔（秒）
+
+# 帖子流配置
+app.config['FEED_MAX_COMMENTS'] = 20  # /api/feed 和 /api/timeline 每个帖子最多附带的评论数
+app.config['FEED_MAX_LIMIT'] = 100  # /api/feed 和 /api/timeline 每页最多返回的帖子数
+app.config['FEED_MAX_OFFSET'] = 1000  # offset分页的最大偏移量，更深的页需使用cursor
+
 # JWT相关导入
 import jwt
 from werkzeug.security import generate_password_hash, check_password_hash
 
 # 加载YOLOv5模型
 import torch
-
-# 使用正确路径加载模型
-flower_model = None
+from utils.torch_utils import set_inference_threads
+
+
+def configure_inference_threads():
+    """按worker数限制本进程的推理线程数，gunicorn fork出worker后会再次调用"""
+    workers = max(1, int(os.getenv('FLOWER_WORKERS', '1')))
+    intra_op = app.config['INFERENCE_INTRA_OP_THREADS'] or max(1, (os.cpu_count() or 1) // workers)
+    return set_inference_threads(
+        intra_op=intra_op,
+        inter_op=app.config['INFERENCE_INTER_OP_THREADS'],
+        opencv=app.config['INFERENCE_OPENCV_THREADS']
+    )
+
+
+inference_threads = configure_inference_threads()
+
+# 在导入时加载模型，使用gunicorn preload_app时由master进程加载一次，各worker共享权重
+model_registry = ModelRegistry(img_size=app.config['DETECT_IMG_SIZE'], device=app.config['MODEL_DEVICE'])
+model_manager = ModelManager(
+    model_registry,
+    conf=0.5,  # 提高置信度阈值，只保留高置信度结果
+    iou=0.5,   # 提高NMS IOU阈值，更严格地过滤重叠边界框
+    warmup=app.config['MODEL_WARMUP'],
+    routing_file=app.config['MODEL_ROUTING_FILE'],
+    check_interval=app.config['MODEL_CHECK_INTERVAL']
+)
 try:
-    # 使用BASE_DIR构建绝对路径
-    yolo_path = os.path.join(BASE_DIR, '..')
-    model_path = os.path.join(BASE_DIR, '..', 'testflowers.pt')
-    flower_model = torch.hub.load(yolo_path, 'custom', path=model_path, source='local', force_reload=True)
-    flower_model.conf = 0.5  # 提高置信度阈值，只保留高置信度结果
-    flower_model.iou = 0.5   # 提高NMS IOU阈值，更严格地过滤重叠边界框
-    print("成功加载YOLOv5花卉识别模型")
+    loaded_model = model_manager.start(app.config['MODEL_WEIGHTS'])
+    print(f"成功加载YOLOv5花卉识别模型 {loaded_model.version}"
+          f"（加载 {loaded_model.load_ms:.0f}ms，预热 {loaded_model.warmup_ms:.0f}ms）")
 except Exception as e:
     print(f"无法加载YOLOv5模型: {e}")
     print("使用模拟模型进行测试...")
     # 创建一个模拟模型类，用于测试
     class MockFlowerModel:
-        def __call__(self, image):
-            # 模拟返回结果
+        def __call__(self, images, size=640):
+            # 模拟返回结果，支持单张图片或图片列表
             class MockResults:
-                def pandas(self):
-                    class MockPandas:
-                        @property
-                        def xyxy(self):
-                            return [type('obj', (object,), {'to_dict': lambda self, orient: []})()]
-                    return MockPandas()
+                def numpy(self, i=0, k=None):
+                    return {'xyxy': [], 'confidence': [], 'class': [], 'name': []}
             return MockResults()
-    flower_model = MockFlowerModel()
-    flower_model.conf = 0.5
-    flower_model.iou = 0.5
+    mock_model = MockFlowerModel()
+    mock_model.conf = 0.5
+    mock_model.iou = 0.5
+    model_manager.set_active(RegisteredModel('mock', mock_model, None, 'mock', 0.0, 0.0, version='mock'))
 
 # JWT工具函数
 def generate_jwt(user_id, username):
@@ -130,6 +254,16 @@ def auth_required(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+# 管理员角色，按优先级排列
+ADMIN_ROLES = ('super_admin', 'admin')
+
+def primary_role(roles):
+    """从用户的角色集合中取优先级最高的角色"""
+    for role in ADMIN_ROLES:
+        if role in roles:
+            return role
+    return next(iter(sorted(roles)), 'user')
+
 # 权限验证中间件
 def permission_required(permission):
     """权限验证装饰器"""
@@ -148,9 +282,12 @@ def permission_required(permission):
             
             g.user_id = payload['user_id']
             g.username = payload['username']
-            g.role = payload.get('role', 'user')
             
-            if not check_user_permission(g.user_id, permission):
+            # 角色和权限从进程内缓存读取，未命中时才查询数据库
+            access = get_user_access(g.user_id)
+            g.role = primary_role(access['roles'])
+            
+            if permission not in access['permissions']:
                 return jsonify({'success': False, 'error': '权限不足'}), 403
             
             return f(*args, **kwargs)
@@ -174,10 +311,11 @@ def admin_required(f):
         
         g.user_id = payload['user_id']
         g.username = payload['username']
-        g.role = payload.get('role', 'user')
+        # JWT中不包含角色，角色从权限缓存读取，修改角色后无需重新登录即可生效
+        g.role = primary_role(get_user_access(g.user_id)['roles'])
         
         user_role = g.role
-        if user_role not in ['super_admin', 'admin']:
+        if user_role not in ADMIN_ROLES:
             return jsonify({'success': False, 'error': '需要管理员权限'}), 403
         
         return f(*args, **kwargs)
@@ -194,47 +332,139 @@ def serve_file(filename):
     """返回指定的文件"""
     return send_from_directory(BASE_DIR, filename)
 
+def get_optional_user_id():
+    """从请求头中解析可选的登录用户ID，未登录或令牌无效时返回None"""
+    return user_id_from_authorization(request.headers.get('Authorization'))
+
+
+def user_id_from_authorization(token):
+    """从Authorization请求头的值中解析用户ID，无效时返回None"""
+    if token:
+        if token.startswith('Bearer '):
+            token = token[7:]
+        payload = verify_jwt(token)
+        if payload:
+            return payload.get('user_id')
+    return None
+
+
+def read_stream_limited(stream, max_size):
+    """分块读取上传流，超过大小限制时立即中止"""
+    chunk_size = app.config['UPLOAD_READ_CHUNK_SIZE']
+    chunks = []
+    total = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_size:
+            raise RequestEntityTooLarge(f'单张图片不能超过 {max_size // (1024 * 1024)}MB')
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def check_upload_count(count):
+    """检查单个请求上传的图片数量"""
+    if count > app.config['DETECT_MAX_FILES']:
+        raise RequestEntityTooLarge(f"单次最多上传 {app.config['DETECT_MAX_FILES']} 张图片")
+
+
+def read_detect_request():
+    """解析识别请求，支持JSON(base64)、multipart/form-data和原始image/*请求体
+
+    返回 (图片数据列表, 是否为多图请求, 是否保存到相册)，没有图片时图片数据列表为None。
+    图片数据为base64字符串或原始字节，由decode_image_data统一处理。
+    """
+    max_file_size = app.config['DETECT_MAX_FILE_SIZE']
+    mimetype = request.mimetype or ''
+    
+    if mimetype == 'multipart/form-data':
+        # 文件分块直接读入内存，不经过base64编码
+        save_to_album = request.form.get('save_to_album', 'false').lower() in ('1', 'true', 'yes', 'on')
+        files = request.files.getlist('images')
+        is_batch = bool(files)
+        if not files:
+            files = request.files.getlist('image')[:1]
+        if not files:
+            return None, False, save_to_album
+        check_upload_count(len(files))
+        return [read_stream_limited(f.stream, max_file_size) for f in files], is_batch, save_to_album
+    
+    if mimetype.startswith('image/'):
+        # 原始图片请求体，保存到相册的参数通过查询字符串传递
+        save_to_album = request.args.get('save_to_album', 'false').lower() in ('1', 'true', 'yes', 'on')
+        if request.content_length and request.content_length > max_file_size:
+            raise RequestEntityTooLarge(f'单张图片不能超过 {max_file_size // (1024 * 1024)}MB')
+        image_bytes = read_stream_limited(request.stream, max_file_size)
+        return ([image_bytes] if image_bytes else None), False, save_to_album
+    
+    data = request.get_json()
+    save_to_album = data.get('save_to_album', False)
+    if 'image' in data:
+        return [data['image']], False, save_to_album
+    if 'images' in data:
+        check_upload_count(len(data['images']))
+        return data['images'], True, save_to_album
+    return None, False, save_to_album
+
+
 @app.route('/api/detect', methods=['POST'])
 def detect_flower():
     """花卉识别API接口"""
     try:
-        data = request.get_json()
-        
-        user_id = None
-        token = request.headers.get('Authorization')
-        if token:
-            if token.startswith('Bearer '):
-                token = token[7:]
-            payload = verify_jwt(token)
-            if payload:
-                user_id = payload.get('user_id')
+        user_id = get_optional_user_id()
+        images_data, is_batch, save_to_album = read_detect_request()
         
-        save_to_album = data.get('save_to_album', False)
+        if not images_data:
+            return jsonify({'success': False, 'error': '缺少图片数据'}), 400
         
-        if 'image' in data:
-            image_data = data['image']
-            results = process_single_image(image_data, user_id, save_to_album)
+        if not is_batch:
+            results = process_single_image(images_data[0], user_id, save_to_album)
             return jsonify({'success': True, 'results': results})
-        elif 'images' in data:
-            images_data = data['images']
-            all_results = []
-            
-            for i, image_data in enumerate(images_data):
-                results = process_single_image(image_data, user_id, save_to_album)
-                all_results.append({
-                    'image_index': i,
-                    'results': results
-                })
-            
-            return jsonify({'success': True, 'all_results': all_results})
-        else:
-            return jsonify({'success': False, 'error': '缺少图片数据'}), 400
-
+        
+        # 多张图片合并为批次推理，避免每张图片单独前向传播
+        batch_results = process_images(images_data, user_id, save_to_album)
+        all_results = [
+            {'image_index': i, 'results': results}
+            for i, results in enumerate(batch_results)
+        ]
+        
+        return jsonify({'success': True, 'all_results': all_results})
+
+    except RequestEntityTooLarge as e:
+        return jsonify({'success': False, 'error': e.description or '上传内容过大'}), 413
+    except InferenceQueueFull as e:
+        print(f"识别请求被拒绝: {str(e)}")
+        response = jsonify({'success': False, 'error': '服务器繁忙，请稍后重试'})
+        response.headers['Retry-After'] = '1'
+        return response, 503
     except Exception as e:
         print(f"识别过程中发生错误: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/address/<job_id>', methods=['GET'])
+def get_address_job(job_id):
+    """查询延迟解析的地址结果"""
+    try:
+        resolved, address = address_resolver.poll(job_id)
+        if not resolved:
+            return jsonify({'success': True, 'status': 'pending', 'formatted_address': "地址解析中"})
+        
+        return jsonify({
+            'success': True,
+            'status': 'resolved',
+            'formatted_address': format_address(address),
+            'address': address
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"查询地址解析结果时发生错误: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 def convert_to_decimal(coord, ref):
     """将EXIF格式的经纬度转换为十进制格式"""
     # coord通常是一个包含三个元素的列表：度、分、秒
@@ -275,32 +505,51 @@ def convert_to_decimal(coord, ref):
     return decimal
 
 
-def get_address_from_coordinates(lat, lon, max_retries=3):
+# 全局逆地理编码器，带进程内LRU缓存和SQLite持久化缓存
+geocoder = GeocodingCache(
+    create_geocoding_provider(
+        app.config['GEOCODER_PROVIDER'],
+        timeout=app.config['GEOCODER_TIMEOUT'],
+        places_file=app.config['GEOCODER_OFFLINE_PLACES']
+    ),
+    grid_meters=app.config['GEOCODER_GRID_METERS'],
+    ttl=app.config['GEOCODER_CACHE_TTL'],
+    negative_ttl=app.config['GEOCODER_NEGATIVE_TTL'],
+    error_ttl=app.config['GEOCODER_ERROR_TTL'],
+    memory_size=app.config['GEOCODER_CACHE_SIZE'],
+    persistent_path=app.config['GEOCODER_CACHE_DB']
+)
+
+
+# 后台地址解析器，识别接口不再同步等待逆地理编码
+address_resolver = AddressResolver(geocoder, app.config['SECRET_KEY'], max_workers=app.config['GEOCODER_WORKERS'])
+
+
+def get_address_from_coordinates(lat, lon):
     """
     通过经纬度获取地址信息
-    使用geopy和Nominatim服务进行逆地理编码
+    优先查询量化网格缓存，未命中时才请求逆地理编码服务
     """
-    geolocator = Nominatim(user_agent="flower_recognition_app", timeout=10)
-    
-    # 重试机制
-    for attempt in range(max_retries):
-        try:
-            location = geolocator.reverse((lat, lon), language='zh-CN')
-            if location:
-                return location.raw.get('address', {})
-            return None
-        except GeocoderTimedOut:
-            print(f"地理编码请求超时，第 {attempt + 1} 次尝试...")
-            time.sleep(1)
-        except GeocoderServiceError as e:
-            print(f"地理编码服务错误: {e}，第 {attempt + 1} 次尝试...")
-            time.sleep(1)
-        except Exception as e:
-            print(f"获取地址信息时出错: {e}")
-            break
+    return geocoder.lookup(lat, lon)
+
+
+def resolve_location_address(lat, lon):
+    """获取位置的地址信息，返回需要合并到location中的字段
+
+    延迟模式下缓存未命中时只提交后台解析任务，返回任务ID供客户端轮询。
+    """
+    if not app.config['GEOCODER_DEFERRED']:
+        return {
+            'formatted_address': format_address(get_address_from_coordinates(lat, lon)),
+            'address_status': 'resolved'
+        }
     
-    print("多次尝试后仍无法获取地址信息")
-    return None
+    job_id, resolved, address = address_resolver.submit(lat, lon)
+    return {
+        'formatted_address': format_address(address) if resolved else "地址解析中",
+        'address_status': 'resolved' if resolved else 'pending',
+        'address_job_id': job_id
+    }
 
 
 def format_address(address):
@@ -329,9 +578,10 @@ def format_address(address):
     return '，'.join(filter(None, address_parts))
 
 
-def process_single_image(image_data, user_id=None, save_to_album=False):
-    """处理单个图片的识别"""
-    saved_album_info = None
+def load_image_bytes(image_data):
+    """获取图片原始字节（base64字符串需先解码，原始字节直接返回）"""
+    if isinstance(image_data, (bytes, bytearray)):
+        return bytes(image_data)
     
     # 移除base64头部
     if image_data.startswith('data:image/'):
@@ -339,11 +589,46 @@ def process_single_image(image_data, user_id=None, save_to_album=False):
 
     # 解码base64图片数据
     image_bytes = base64.b64decode(image_data)
-    image = Image.open(io.BytesIO(image_bytes))
-    # 调整图片大小以提高处理速度
-    image = image.resize((640, 640))
+    if len(image_bytes) > app.config['DETECT_MAX_FILE_SIZE']:
+        raise RequestEntityTooLarge(f"单张图片不能超过 {app.config['DETECT_MAX_FILE_SIZE'] // (1024 * 1024)}MB")
+    return image_bytes
+
+
+def decode_image_data(image_data):
+    """解码图片数据（base64字符串或原始字节），返回原始字节和预处理后的图片"""
+    image_bytes = load_image_bytes(image_data)
+    # JPEG按接近模型输入的比例解码，再等比缩放填充，避免拉伸变形
+    image = preprocess_image(image_bytes, app.config['DETECT_IMG_SIZE'])
+    return image_bytes, image
+
+
+def exif_header_segment(image_bytes):
+    """截取JPEG中直到EXIF(APP1)段结束的头部数据，非JPEG或找不到EXIF段时返回完整数据"""
+    if image_bytes[:2] != b'\xff\xd8':
+        return image_bytes
     
-    # 提取图片EXIF信息
+    offset = 2
+    length = len(image_bytes)
+    while offset + 4 <= length and image_bytes[offset] == 0xFF:
+        marker = image_bytes[offset + 1]
+        # 遇到图像数据起始段(SOS)或非APPn段时EXIF已不可能出现
+        if marker == 0xDA or not 0xE0 <= marker <= 0xEF:
+            break
+        segment_length = int.from_bytes(image_bytes[offset + 2:offset + 4], 'big')
+        segment_end = offset + 2 + segment_length
+        if marker == 0xE1 and image_bytes[offset + 4:offset + 10] == b'Exif\x00\x00':
+            return image_bytes[:segment_end]
+        offset = segment_end
+    return image_bytes
+
+
+def read_exif_tags(image_bytes):
+    """在内存中解析EXIF标签，只读取头部段，跳过厂商注释和缩略图"""
+    return exifread.process_file(io.BytesIO(exif_header_segment(image_bytes)), details=False)
+
+
+def extract_image_info(image_bytes, image):
+    """提取图片EXIF信息（拍摄时间、相机信息、GPS位置）"""
     image_info = {
         'date_time': "未知",
         'location': {
@@ -364,22 +649,16 @@ def process_single_image(image_data, user_id=None, save_to_album=False):
     }
     
     try:
-        # 创建临时文件保存图片
-        temp_file_path = "temp_image.jpg"
-        with open(temp_file_path, "wb") as temp_file:
-            temp_file.write(image_bytes)
+        # 直接从内存解析EXIF，所有字段共用同一次解析结果
+        exif_tags = read_exif_tags(image_bytes)
         
-        # 使用exifread提取EXIF信息
-        with open(temp_file_path, 'rb') as f:
-            exif_tags = exifread.process_file(f)
-            
-            # 获取拍摄时间
-            if 'Image DateTime' in exif_tags:
-                image_info['date_time'] = str(exif_tags['Image DateTime'])
-            elif 'EXIF DateTimeOriginal' in exif_tags:
-                image_info['date_time'] = str(exif_tags['EXIF DateTimeOriginal'])
-            elif 'EXIF DateTimeDigitized' in exif_tags:
-                image_info['date_time'] = str(exif_tags['EXIF DateTimeDigitized'])
+        # 获取拍摄时间
+        if 'Image DateTime' in exif_tags:
+            image_info['date_time'] = str(exif_tags['Image DateTime'])
+        elif 'EXIF DateTimeOriginal' in exif_tags:
+            image_info['date_time'] = str(exif_tags['EXIF DateTimeOriginal'])
+        elif 'EXIF DateTimeDigitized' in exif_tags:
+            image_info['date_time'] = str(exif_tags['EXIF DateTimeDigitized'])
         
         # 获取相机信息
         if 'Image Make' in exif_tags:
@@ -401,16 +680,11 @@ def process_single_image(image_data, user_id=None, save_to_album=False):
                 dec_lat = convert_to_decimal(lat, lat_ref)
                 dec_lon = convert_to_decimal(lon, lon_ref)
                 
-                # 获取地址信息
-                address = get_address_from_coordinates(dec_lat, dec_lon)
-                formatted_address = format_address(address)
-                
                 # 更新位置信息
                 image_info['location'] = {
                     'has_location': True,
                     'latitude': dec_lat,
                     'longitude': dec_lon,
-                    'formatted_address': formatted_address,
                     'raw_gps': {
                         'lat_ref': lat_ref,
                         'lat': str(lat),
@@ -418,46 +692,231 @@ def process_single_image(image_data, user_id=None, save_to_album=False):
                         'lon': str(lon)
                     }
                 }
+                
+                # 获取地址信息（延迟模式下只返回解析任务ID）
+                image_info['location'].update(resolve_location_address(dec_lat, dec_lon))
             except Exception as e:
                 print(f"处理GPS信息时出错: {e}")
-        
-        # 删除临时文件
-        os.remove(temp_file_path)
     except Exception as e:
         print(f"提取图片EXIF信息失败: {e}")
 
-    # 使用YOLOv5模型进行花卉识别
-    model_results = flower_model(image)
-    
-    # 解析识别结果
-    results = []
-    for result in model_results.pandas().xyxy[0].to_dict(orient='records'):
-        results.append({
-            'name': result['name'],
-            'confidence': round(result['confidence'], 4),
-            'bbox': [
-                int(result['xmin']),
-                int(result['ymin']),
-                int(result['xmax']),
-                int(result['ymax'])
-            ]
-        })
-    
-    # 处理识别结果：只保留置信度最高的结果
+    return image_info
+
+
+def parse_detections(model_results, index=0, image=None):
+    """从模型输出中解析第index张图片的识别结果，只保留置信度最高的结果
+
+    传入预处理后的图片时，识别框会从letterbox坐标映射回原图坐标。
+    直接在检测张量上取置信度最高的一条结果，不再构造pandas DataFrame。
+    """
+    top = model_results.numpy(index, k=1)
     detection_results = []
-    if results:
-        # 按置信度降序排序
-        results.sort(key=lambda x: x['confidence'], reverse=True)
-        # 只添加置信度最高的结果
+    for box, confidence, name in zip(top['xyxy'], top['confidence'], top['name']):
+        box = [float(v) for v in box]
+        if image is not None:
+            box = image.scale_box(box)
         detection_results.append({
-            'name': results[0]['name'],
-            'confidence': float(results[0]['confidence']),
-            'bbox': results[0]['bbox']
+            'name': name,
+            'confidence': round(float(confidence), 4),
+            'bbox': [int(v) for v in box]
         })
+    
+    return detection_results
+
+
+def run_model_batch(model_entry, images):
+    """用指定版本的模型对一个批次的图片执行一次前向推理，返回每张图片的识别结果列表"""
+    start = time.perf_counter()
+    arrays = [image.array for image in images]
+    if model_entry.fixed_batch_size and len(arrays) < model_entry.fixed_batch_size:
+        # 导出时固定了批大小的ONNX/OpenVINO模型，不足的部分用空白图片补齐
+        arrays += [np.zeros_like(arrays[0])] * (model_entry.fixed_batch_size - len(arrays))
+    # AutoShape支持直接传入图片列表，一次前向传播完成整个批次
+    # 图片已完成letterbox，AutoShape不会再次缩放
+    model_results = model_entry.model(arrays, size=app.config['DETECT_IMG_SIZE'])
+    detections = [parse_detections(model_results, i, image) for i, image in enumerate(images)]
+    model_entry.record_batch((time.perf_counter() - start) * 1000, detections)
+    return detections
+
+
+# 识别结果缓存，重复上传的图片直接返回缓存结果
+result_cache = RecognitionResultCache(
+    max_bytes=app.config['RESULT_CACHE_MAX_BYTES'],
+    persistent_path=app.config['RESULT_CACHE_DB'],
+    ttl=app.config['RESULT_CACHE_TTL']
+)
+
+
+# 访问记录先写入内存缓冲区，由后台线程批量写入数据库
+def run_periodic_maintenance():
+    """由访问记录写入线程定期调用：清理过期的访问记录和本地缓存，一项失败不影响其他项
+
+    每个worker进程都有写入线程，数据库中的清理通过MySQL命名锁同一时间只在一个进程中执行，
+    并且所有进程合计每TRAFFIC_PRUNE_INTERVAL秒只执行一次。
+    """
+    tasks = [
+        ('访问记录', functools.partial(
+            run_exclusive,
+            'flower_traffic_maintenance',
+            prune_traffic_data,
+            app.config['TRAFFIC_RAW_RETENTION_DAYS'],
+            app.config['TRAFFIC_MINUTE_RETENTION_DAYS'],
+            app.config['TRAFFIC_HOUR_RETENTION_DAYS'],
+            min_interval=app.config['TRAFFIC_PRUNE_INTERVAL']
+        )),
+        ('地理编码缓存', geocoder.purge_expired),
+        ('识别结果缓存', result_cache.purge_expired),
+    ]
+    for name, task in tasks:
+        try:
+            task()
+        except Exception as e:
+            print(f"清理过期{name}失败: {e}")
+
+
+traffic_buffer = TrafficBuffer(
+    record_traffic_batch,
+    batch_size=app.config['TRAFFIC_BATCH_SIZE'],
+    flush_interval=app.config['TRAFFIC_FLUSH_INTERVAL'],
+    max_buffer=app.config['TRAFFIC_MAX_BUFFER'],
+    maintenance_fn=run_periodic_maintenance,
+    maintenance_interval=app.config['TRAFFIC_PRUNE_INTERVAL']
+)
+
+# 上传的图片按内容哈希去重保存，同一张照片只存一份
+blob_store = BlobStore(os.path.join(BASE_DIR, 'static', 'uploads', 'blobs'), '/static/uploads/blobs')
+
+# 相册图片的衍生图在后台生成，列表页返回缩略图而不是原图
+derivative_generator = DerivativeGenerator(
+    os.path.join(BASE_DIR, 'static', 'uploads', 'derivatives'),
+    '/static/uploads/derivatives',
+    sizes=app.config['DERIVATIVE_SIZES'],
+    fmt=app.config['DERIVATIVE_FORMAT'],
+    quality=app.config['DERIVATIVE_QUALITY'],
+    max_workers=app.config['DERIVATIVE_WORKERS']
+)
+
+
+def release_blob_files(blob_hash, blob_path):
+    """图片文件的最后一个引用被永久删除时，删除原图和衍生图"""
+    blob_store.remove(blob_path)
+    derivative_generator.remove(blob_store.shard_stem(blob_hash))
+
+
+set_blob_release_handler(release_blob_files)
+
+
+def store_derivative_paths(urls, album_image_id=None, recognition_result_id=None):
+    """衍生图生成完成后的回调：把路径写回数据库"""
+    try:
+        update_image_derivatives(urls.get('thumb'), urls.get('medium'), album_image_id, recognition_result_id)
+    except Exception as e:
+        print(f"保存衍生图路径失败: {str(e)}")
+
+
+def with_derivative_urls(rows):
+    """为相册图片或识别记录加上衍生图URL，衍生图尚未生成时使用原图"""
+    for row in rows:
+        row['thumbnail_url'] = row.get('thumbnail_path') or row.get('image_path')
+        row['medium_url'] = row.get('medium_path') or row.get('image_path')
+    return rows
+
+
+# 每个模型版本一个推理队列，由后台线程合并不同请求的图片进行批量推理
+inference_batchers = {}
+inference_batchers_lock = threading.Lock()
+
+
+def get_inference_batcher(model_entry):
+    """获取（必要时创建）指定模型版本的推理队列；模型已下线时抛出InferenceBatcherClosed"""
+    with inference_batchers_lock:
+        if model_entry.retired:
+            raise InferenceBatcherClosed(f'模型 {model_entry.version} 已下线')
+        batcher = inference_batchers.get(model_entry.version)
+        if batcher is None:
+            batcher = InferenceBatcher(
+                functools.partial(run_model_batch, model_entry),
+                max_batch_size=model_entry.fixed_batch_size or app.config['DETECT_BATCH_SIZE'],
+                batch_window_ms=app.config['DETECT_BATCH_WINDOW_MS'],
+                max_queue_size=app.config['DETECT_QUEUE_SIZE']
+            )
+            inference_batchers[model_entry.version] = batcher
+        return batcher
+
+
+def retire_inference_batcher(model_entry):
+    """模型下线时关闭其推理队列，已排队的图片仍会处理完"""
+    with inference_batchers_lock:
+        batcher = inference_batchers.pop(model_entry.version, None)
+    if batcher is not None:
+        batcher.close()
+
+
+model_manager.on_retire(retire_inference_batcher)
+
+
+def run_shadow_inference(images, shadow_entry, detections):
+    """把图片镜像给影子模型推理，不等待结果，只统计与线上结果是否一致"""
+    try:
+        futures = get_inference_batcher(shadow_entry).submit_many(images)
+    except (InferenceQueueFull, InferenceBatcherClosed):
+        return  # 影子流量不影响线上请求，队列满或影子模型已下线时直接丢弃
+    
+    def compare(future, expected):
+        if future.exception() is None:
+            result = future.result()
+            agreed = [d['name'] for d in result[:1]] == [d['name'] for d in expected[:1]]
+            shadow_entry.record_shadow_comparison(agreed)
+    
+    for future, expected in zip(futures, detections):
+        future.add_done_callback(functools.partial(compare, expected=expected))
+
+
+def save_detection_to_album(image_bytes, user_id, detection_results):
+    """将识别结果和原图保存到对应花卉分类的相册中"""
+    flower_name = detection_results[0]['name']
+    confidence = detection_results[0]['confidence']
+    
+    albums = get_user_albums(user_id, flower_name)
+    
+    if albums:
+        album = albums[0]
     else:
-        # 如果没有识别到任何结果，返回空列表
-        detection_results = []
+        album_id = create_album(user_id, f"{flower_name}相册", flower_name)
+        album = get_album_by_id(album_id, user_id)
+    
+    if not album:
+        return None
+    
+    blob_hash, relative_path = blob_store.locate(image_bytes)
+    
+    result_id = save_recognition_result(user_id, relative_path, flower_name, confidence, blob_hash, len(image_bytes))
     
+    album_image_id = add_image_to_album(album['id'], user_id, relative_path, flower_name, confidence, result_id,
+                                        blob_hash, len(image_bytes))
+    
+    # 引用登记提交后再写文件：请求回滚时不会留下没有记录引用的文件；
+    # 若同一内容的最后一个引用刚被永久删除，文件会在这里重新写入
+    after_db_commit(functools.partial(blob_store.put, image_bytes))
+    
+    # 衍生图在后台线程中用单独的连接写回路径，必须等记录提交后再生成，请求回滚时不生成
+    after_db_commit(functools.partial(
+        derivative_generator.submit,
+        image_bytes, blob_store.shard_stem(blob_hash),
+        functools.partial(store_derivative_paths, album_image_id=album_image_id, recognition_result_id=result_id)
+    ))
+    
+    return {
+        'album_id': album['id'],
+        'album_name': album['name'],
+        'category': album['category'],
+        'image_path': relative_path,
+        'image_id': album_image_id
+    }
+
+
+def build_image_result(image_bytes, image_info, detection_results, user_id=None, save_to_album=False):
+    """组装单张图片的返回结果，并按需保存到相册"""
     # 返回包含识别结果和EXIF信息的响应
     return_result = {
         'detections': detection_results,
@@ -466,40 +925,10 @@ def process_single_image(image_data, user_id=None, save_to_album=False):
     
     if save_to_album and user_id and detection_results:
         try:
-            flower_name = detection_results[0]['name']
-            confidence = detection_results[0]['confidence']
-            
-            albums = get_user_albums(user_id, flower_name)
-            
-            if albums:
-                album = albums[0]
-            else:
-                album_id = create_album(user_id, f"{flower_name}相册", flower_name)
-                album = get_album_by_id(album_id, user_id)
-            
-            if album:
-                timestamp = int(time.time())
-                image_filename = f"recognition_{user_id}_{timestamp}.jpg"
-                uploads_dir = os.path.join(BASE_DIR, 'static', 'uploads')
-                os.makedirs(uploads_dir, exist_ok=True)
-                image_path = os.path.join(uploads_dir, image_filename)
-                
-                with open(image_path, 'wb') as f:
-                    f.write(image_bytes)
-                
-                relative_path = f"/static/uploads/{image_filename}"
-                
-                result_id = save_recognition_result(user_id, relative_path, flower_name, confidence)
-                
-                add_image_to_album(album['id'], user_id, relative_path, flower_name, confidence, result_id)
-                
-                saved_album_info = {
-                    'album_id': album['id'],
-                    'album_name': album['name'],
-                    'category': album['category'],
-                    'image_path': relative_path
-                }
-                
+            # 以保存点隔离每张图片的保存：失败时只回滚这张图片写入的记录，其他图片的保存结果不受影响
+            with db_session():
+                saved_album_info = save_detection_to_album(image_bytes, user_id, detection_results)
+            if saved_album_info:
                 return_result['saved_to_album'] = saved_album_info
         except Exception as e:
             print(f"保存到相册失败: {e}")
@@ -507,6 +936,150 @@ def process_single_image(image_data, user_id=None, save_to_album=False):
     
     return return_result
 
+
+def refresh_cached_location(image_info):
+    """缓存中的地址可能仍处于解析中，命中缓存时重新查询一次地址状态"""
+    location = image_info.get('location', {})
+    if location.get('has_location') and location.get('address_status') == 'pending':
+        location.update(resolve_location_address(location['latitude'], location['longitude']))
+
+
+def prepare_images(images_data):
+    """识别第一阶段：选择模型版本、查询结果缓存，并解码预处理未命中缓存的图片
+
+    返回识别任务字典，供submit_inference和finish_images使用。
+    """
+    # 按路由配置选择处理本次请求的模型版本，影子模式下同时镜像给候选版本
+    model_entry, shadow_entry = model_manager.route()
+    # 单张图片解码失败只记录该图片的错误（errors: 图片序号 -> 异常），不影响同一请求中的其他图片
+    errors = {}
+    images_bytes = []
+    for i, image_data in enumerate(images_data):
+        try:
+            images_bytes.append(load_image_bytes(image_data))
+        except RequestEntityTooLarge:
+            raise
+        except Exception as e:
+            errors[i] = e
+            images_bytes.append(b'')
+    cache_keys = [
+        None if i in errors else
+        make_result_cache_key(image_bytes, model_entry.version, model_entry.model.conf, model_entry.model.iou)
+        for i, image_bytes in enumerate(images_bytes)
+    ]
+    
+    # 命中缓存的图片直接使用缓存中的识别结果和EXIF信息
+    cached = [None if key is None else result_cache.get(key) for key in cache_keys]
+    for i, entry in enumerate(cached):
+        if entry is not None:
+            refresh_cached_location(entry['exif_info'])
+    
+    miss_indexes, images, images_info = [], [], []
+    for i, entry in enumerate(cached):
+        if entry is not None or i in errors:
+            continue
+        try:
+            image = preprocess_image(images_bytes[i], app.config['DETECT_IMG_SIZE'])
+            image_info = extract_image_info(images_bytes[i], image)
+        except Exception as e:
+            errors[i] = e
+            continue
+        miss_indexes.append(i)
+        images.append(image)
+        images_info.append(image_info)
+    
+    return {
+        'model_entry': model_entry,
+        'shadow_entry': shadow_entry,
+        'images_bytes': images_bytes,
+        'cache_keys': cache_keys,
+        'cached': cached,
+        'miss_indexes': miss_indexes,
+        'images': images,
+        'images_info': images_info,
+        'errors': errors
+    }
+
+
+def submit_inference(job):
+    """识别第二阶段：将未命中缓存的图片提交到推理队列，返回Future列表"""
+    if not job['images']:
+        return []
+    for _ in range(3):
+        try:
+            return get_inference_batcher(job['model_entry']).submit_many(job['images'])
+        except InferenceBatcherClosed:
+            # 选择模型后该版本被热切换下线，改用当前的线上版本（结果缓存键随模型版本更新）
+            model_entry = job['model_entry'] = model_manager.route()[0]
+            for i in job['miss_indexes']:
+                job['cache_keys'][i] = make_result_cache_key(
+                    job['images_bytes'][i], model_entry.version, model_entry.model.conf, model_entry.model.iou
+                )
+    raise InferenceQueueFull('模型正在切换，请稍后重试')
+
+
+def finish_images(job, all_detections, user_id=None, save_to_album=False):
+    """识别第三阶段：写入结果缓存，按图片组装返回结果
+
+    all_detections中推理失败的图片为异常对象，这些图片和解码失败的图片返回 {'error': 错误信息}。
+    """
+    cached = job['cached']
+    errors = job['errors']
+    succeeded = [(image, detections) for image, detections in zip(job['images'], all_detections)
+                 if not isinstance(detections, Exception)]
+    if job['shadow_entry'] is not None and succeeded:
+        run_shadow_inference([image for image, _ in succeeded], job['shadow_entry'],
+                             [detections for _, detections in succeeded])
+    
+    for i, image_info, detection_results in zip(job['miss_indexes'], job['images_info'], all_detections):
+        if isinstance(detection_results, Exception):
+            errors[i] = detection_results
+            continue
+        cached[i] = {'detections': detection_results, 'exif_info': image_info}
+        result_cache.set(job['cache_keys'][i], cached[i])
+    
+    results = []
+    for i, (image_bytes, entry) in enumerate(zip(job['images_bytes'], cached)):
+        if i in errors:
+            print(f"第{i + 1}张图片识别失败: {errors[i]}")
+            results.append({'error': str(errors[i])})
+        else:
+            results.append(build_image_result(image_bytes, entry['exif_info'], entry['detections'], user_id, save_to_album))
+    return results
+
+
+def collect_detections(futures, timeout):
+    """等待推理结果，失败的图片以异常对象代替结果"""
+    all_detections = []
+    for future in futures:
+        try:
+            all_detections.append(future.result(timeout=timeout))
+        except Exception as e:
+            all_detections.append(e)
+    return all_detections
+
+
+def process_images(images_data, user_id=None, save_to_album=False):
+    """批量处理多张图片：先查结果缓存，未命中的图片解码后合并为批次进行一次模型推理，最后按图片拆分结果"""
+    job = prepare_images(images_data)
+    # 使用YOLOv5模型进行批量花卉识别
+    futures = submit_inference(job)
+    all_detections = collect_detections(futures, app.config['DETECT_TIMEOUT'])
+    return finish_images(job, all_detections, user_id, save_to_album)
+
+
+def process_single_image(image_data, user_id=None, save_to_album=False):
+    """处理单个图片的识别，识别失败时抛出异常"""
+    job = prepare_images([image_data])
+    all_detections = collect_detections(submit_inference(job), app.config['DETECT_TIMEOUT'])
+    for detections in all_detections:
+        if isinstance(detections, Exception):
+            raise detections
+    if job['errors']:
+        raise job['errors'][0]
+    return finish_images(job, all_detections, user_id, save_to_album)[0]
+
+
 # 认证相关API
 @app.route('/api/auth/register', methods=['POST'])
 def register():
@@ -570,13 +1143,56 @@ def get_posts_api():
     try:
         limit = int(request.args.get('limit', 20))
         offset = int(request.args.get('offset', 0))
+        page_cursor = request.args.get('cursor')
         
-        posts = get_posts(limit, offset)
-        return jsonify({'success': True, 'posts': posts})
+        posts = get_posts(limit, offset, page_cursor)
+        return jsonify({'success': True, 'posts': posts, 'next_cursor': next_cursor(posts, limit)})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         print(f"获取帖子列表时发生错误: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def read_feed_page_args():
+    """读取帖子流的分页参数，返回(limit, offset, cursor, 每个帖子的评论数)；参数超出范围时抛出ValueError"""
+    limit = int(request.args.get('limit', 20))
+    offset = int(request.args.get('offset', 0))
+    if not 1 <= limit <= app.config['FEED_MAX_LIMIT']:
+        raise ValueError(f"limit必须在1到{app.config['FEED_MAX_LIMIT']}之间")
+    if not 0 <= offset <= app.config['FEED_MAX_OFFSET']:
+        raise ValueError(f"offset必须在0到{app.config['FEED_MAX_OFFSET']}之间，更深的页请使用cursor")
+    comments_per_post = min(max(int(request.args.get('comments', 3)), 0), app.config['FEED_MAX_COMMENTS'])
+    return limit, offset, request.args.get('cursor'), comments_per_post
+
+@app.route('/api/feed', methods=['GET'])
+def get_feed_api():
+    """获取帖子流：一次返回帖子、作者、点赞和关注状态以及每个帖子的前几条评论，登录可选"""
+    try:
+        limit, offset, page_cursor, comments_per_post = read_feed_page_args()
+        
+        posts = get_feed(get_optional_user_id(), limit, offset, page_cursor, comments_per_post)
+        return jsonify({'success': True, 'posts': posts, 'next_cursor': next_cursor(posts, limit)})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"获取帖子流时发生错误: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/timeline', methods=['GET'])
+@auth_required
+def get_home_timeline_api():
+    """获取当前用户的首页时间线（自己和关注用户的帖子），返回格式与帖子流相同"""
+    try:
+        limit, offset, page_cursor, comments_per_post = read_feed_page_args()
+        
+        posts = get_home_timeline(g.user_id, limit, offset, page_cursor, comments_per_post)
+        return jsonify({'success': True, 'posts': posts, 'next_cursor': next_cursor(posts, limit)})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"获取首页时间线时发生错误: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/posts/<int:post_id>', methods=['GET'])
 def get_post_api(post_id):
     """获取帖子详情"""
@@ -647,7 +1263,7 @@ def delete_post_api(post_id):
         if not post:
             return jsonify({'success': False, 'error': '帖子不存在'}), 404
         
-        is_admin = g.role in ['super_admin', 'admin']
+        is_admin = primary_role(get_user_access(g.user_id)['roles']) in ADMIN_ROLES
         if post['user_id'] != g.user_id and not is_admin:
             return jsonify({'success': False, 'error': '无权限删除此帖子'}), 403
         
@@ -850,9 +1466,12 @@ def get_system_logs_api():
         module = request.args.get('module')
         start_time = request.args.get('start_time', type=int)
         end_time = request.args.get('end_time', type=int)
+        page_cursor = request.args.get('cursor')
         
-        logs = get_system_logs(limit, offset, log_level, module, start_time, end_time)
-        return jsonify({'success': True, 'logs': logs})
+        logs = get_system_logs(limit, offset, log_level, module, start_time, end_time, page_cursor)
+        return jsonify({'success': True, 'logs': logs, 'next_cursor': next_cursor(logs, limit)})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         print(f"获取系统日志时发生错误: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -889,6 +1508,45 @@ def get_traffic_by_endpoint_api():
         print(f"获取端点流量统计时发生错误: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/admin/system/traffic/timeseries', methods=['GET'])
+@auth_required
+@permission_required('view_traffic_stats')
+def get_traffic_timeseries_api():
+    """按分钟/小时/天获取流量趋势及响应时间分位数"""
+    try:
+        granularity = request.args.get('granularity', 'hour')
+        start_time = request.args.get('start_time', type=int)
+        end_time = request.args.get('end_time', type=int)
+        endpoint = request.args.get('endpoint')
+        method = request.args.get('method')
+        
+        if granularity not in ('minute', 'hour', 'day'):
+            return jsonify({'success': False, 'error': 'granularity只能为minute、hour或day'}), 400
+        
+        series = get_traffic_timeseries(granularity, start_time, end_time, endpoint, method)
+        return jsonify({'success': True, 'granularity': granularity, 'series': series})
+    except Exception as e:
+        print(f"获取流量趋势时发生错误: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/admin/system/query-plans', methods=['GET'])
+@auth_required
+@permission_required('monitor_server')
+def get_query_plans_api():
+    """对高频查询执行EXPLAIN，返回当前数据库结构版本、存在全表扫描的查询和执行计划需要检查的查询"""
+    try:
+        reports = check_query_plans()
+        return jsonify({
+            'success': True,
+            'schema_version': get_schema_version(),
+            'full_scan_queries': [report['name'] for report in reports if report['full_scan_tables']],
+            'flagged_queries': [report['name'] for report in reports if report['issues']],
+            'reports': reports
+        })
+    except Exception as e:
+        print(f"检查查询计划时发生错误: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/admin/server/status', methods=['GET'])
 @auth_required
 @permission_required('monitor_server')
@@ -911,11 +1569,91 @@ def get_latest_server_metrics_api():
     """获取最新服务器指标"""
     try:
         metrics = get_latest_server_metrics()
-        return jsonify({'success': True, 'metrics': metrics})
+        return jsonify({
+            'success': True,
+            'metrics': metrics,
+            'inference_queue': {version: batcher.get_stats() for version, batcher in list(inference_batchers.items())},
+            'geocoder': dict(geocoder.get_stats(), resolver=address_resolver.get_stats()),
+            'result_cache': result_cache.get_stats(),
+            'derivatives': derivative_generator.get_stats(),
+            'image_store': get_blob_stats(),
+            'db_pool': get_db_pool_stats(),
+            'permission_cache': get_permission_cache_stats(),
+            'traffic_buffer': traffic_buffer.get_stats(),
+            'models': model_manager.get_stats(),
+            'inference_threads': inference_threads
+        })
     except Exception as e:
         print(f"获取最新服务器指标时发生错误: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def resolve_model_weights(name):
+    """将管理接口传入的权重文件名解析为项目根目录下的路径，只允许加载根目录中已有的文件"""
+    if not name or os.path.basename(name) != name:
+        raise ValueError('权重文件名无效')
+    path = os.path.join(YOLO_ROOT, name)
+    if not (os.path.isfile(path) or (name.endswith('_openvino_model') and os.path.isdir(path))):
+        raise ValueError(f'权重文件不存在: {name}')
+    return path
+
+@app.route('/api/admin/models', methods=['GET'])
+@auth_required
+@permission_required('monitor_server')
+def get_models_api():
+    """获取当前模型版本、候选版本及各版本的推理统计"""
+    return jsonify({'success': True, 'models': model_manager.get_stats()})
+
+@app.route('/api/admin/models/routing', methods=['PUT'])
+@auth_required
+@permission_required('super_admin')
+def update_model_routing_api():
+    """更新模型路由：候选版本、分流比例、影子模式，新模型在后台加载预热后切换"""
+    try:
+        data = request.get_json() or {}
+        changes = {}
+        if 'active' in data:
+            changes['active'] = resolve_model_weights(data['active'])
+        if 'candidate' in data:
+            changes['candidate'] = resolve_model_weights(data['candidate']) if data['candidate'] else None
+        if 'candidate_percent' in data:
+            percent = float(data['candidate_percent'])
+            if not 0 <= percent <= 100:
+                raise ValueError('分流比例必须在0到100之间')
+            changes['candidate_percent'] = percent
+        if 'shadow' in data:
+            changes['shadow'] = bool(data['shadow'])
+        
+        config = model_manager.update_routing(**changes)
+        
+        record_admin_operation(g.user_id, g.username, 'update_model_routing', 'model', None,
+                               f"模型路由更新为 {config}", request.remote_addr)
+        return jsonify({'success': True, 'routing': config, 'models': model_manager.get_stats()})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"更新模型路由时发生错误: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/admin/models/promote', methods=['POST'])
+@auth_required
+@permission_required('super_admin')
+def promote_candidate_model_api():
+    """将候选版本提升为当前版本，所有流量切换到候选版本"""
+    try:
+        candidate = model_manager.candidate
+        if candidate is None:
+            return jsonify({'success': False, 'error': '没有已加载的候选模型'}), 400
+        
+        config = model_manager.update_routing(active=candidate.weights, candidate=None,
+                                              candidate_percent=0, shadow=False)
+        
+        record_admin_operation(g.user_id, g.username, 'promote_model', 'model', None,
+                               f"候选模型 {candidate.version} 提升为当前版本", request.remote_addr)
+        return jsonify({'success': True, 'routing': config, 'models': model_manager.get_stats()})
+    except Exception as e:
+        print(f"切换模型版本时发生错误: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/admin/admins', methods=['GET'])
 @auth_required
 @permission_required('manage_admins')
@@ -1021,13 +1759,18 @@ def get_recognition_history():
         limit = int(request.args.get('limit', 20))
         offset = int(request.args.get('offset', 0))
         
-        results, total = get_user_recognition_history(g.user_id, limit, offset)
+        page_cursor = request.args.get('cursor')
+        
+        results, total = get_user_recognition_history(g.user_id, limit, offset, page_cursor)
         
         return jsonify({
             'success': True,
-            'results': results,
-            'total': total
+            'results': with_derivative_urls(results),
+            'total': total,
+            'next_cursor': next_cursor(results, limit)
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         print(f"获取历史识别记录时发生错误: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1113,14 +1856,21 @@ def get_album_detail(album_id):
         if not album:
             return jsonify({'success': False, 'error': '相册不存在'}), 404
         
-        images, total = get_album_images(album_id, g.user_id)
+        limit = int(request.args.get('limit', 50))
+        offset = int(request.args.get('offset', 0))
+        page_cursor = request.args.get('cursor')
+        
+        images, total = get_album_images(album_id, g.user_id, limit, offset, page_cursor)
         
         return jsonify({
             'success': True,
             'album': album,
-            'images': images,
-            'total': total
+            'images': with_derivative_urls(images),
+            'total': total,
+            'next_cursor': next_cursor(images, limit)
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         print(f"获取相册详情时发生错误: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1177,7 +1927,10 @@ def add_image_to_album_api(album_id):
         if not album:
             return jsonify({'success': False, 'error': '相册不存在'}), 404
         
-        image_id = add_image_to_album(album_id, g.user_id, image_path, flower_name, confidence, recognition_result_id)
+        # 引用已上传的图片文件时登记引用，避免原记录被永久删除后文件被清理
+        blob_hash = blob_store.digest_from_url(image_path)
+        image_id = add_image_to_album(album_id, g.user_id, image_path, flower_name, confidence, recognition_result_id,
+                                      blob_hash)
         
         return jsonify({
             'success': True,
@@ -1264,13 +2017,18 @@ def get_feedback_list():
         limit = int(request.args.get('limit', 20))
         offset = int(request.args.get('offset', 0))
         
-        results, total = get_user_feedback(g.user_id, limit, offset)
+        page_cursor = request.args.get('cursor')
+        
+        results, total = get_user_feedback(g.user_id, limit, offset, page_cursor)
         
         return jsonify({
             'success': True,
             'feedback': results,
-            'total': total
+            'total': total,
+            'next_cursor': next_cursor(results, limit)
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         print(f"获取反馈列表时发生错误: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1467,13 +2225,18 @@ def get_recycle_bin():
         limit = int(request.args.get('limit', 50))
         offset = int(request.args.get('offset', 0))
         
-        results, total = get_recycle_bin_items(g.user_id, item_type, limit, offset)
+        page_cursor = request.args.get('cursor')
+        
+        results, total = get_recycle_bin_items(g.user_id, item_type, limit, offset, page_cursor)
         
         return jsonify({
             'success': True,
             'items': results,
-            'total': total
+            'total': total,
+            'next_cursor': next_cursor(results, limit, time_key='deleted_at')
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         print(f"获取回收站项目时发生错误: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1528,6 +2291,8 @@ def empty_recycle_bin_api():
 def before_request():
     """请求前记录访问日志"""
     g.start_time = time.time()
+    # 整个请求共用一个数据库连接和事务，在返回响应前统一提交
+    g.db_session = begin_db_session()
 
 @app.after_request
 def after_request(response):
@@ -1539,8 +2304,8 @@ def after_request(response):
         ip_address = request.remote_addr
         user_id = g.user_id if hasattr(g, 'user_id') else None
         
-        # 记录访问流量
-        record_traffic(endpoint, method, ip_address, user_id, response.status_code, response_time)
+        # 记录访问流量（写入缓冲区，由后台线程批量写入数据库）
+        traffic_buffer.record(endpoint, method, ip_address, user_id, response.status_code, response_time)
         
         # 记录系统日志（如果是错误响应）
         if response.status_code >= 400:
@@ -1551,6 +2316,30 @@ def after_request(response):
     
     return response
 
+@app.after_request
+def commit_db_session(response):
+    """提交请求的数据库会话，5xx响应回滚
+    
+    after_request按注册的相反顺序执行，本函数先于访问日志执行，访问日志不计入请求的事务。
+    """
+    token = g.pop('db_session', None)
+    try:
+        end_db_session(token, commit=response.status_code < 500)
+    except Exception as e:
+        print(f"提交请求事务时发生错误: {str(e)}")
+        response = jsonify({'success': False, 'error': str(e)})
+        response.status_code = 500
+    return response
+
+@app.teardown_request
+def close_db_session(exc):
+    """请求抛出未处理的异常时after_request不会执行，在这里回滚并归还连接"""
+    token = g.pop('db_session', None)
+    try:
+        end_db_session(token, commit=False)
+    except Exception as e:
+        print(f"回滚请求事务时发生错误: {str(e)}")
+
 if __name__ == '__main__':
     # 启动Flask服务器
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+ASGI服务模式
+
+识别接口和帖子流接口以异步方式实现，其余接口仍由Flask应用处理（通过WSGI适配挂载）：
+- 上传的请求体异步分块读取，慢速的移动端上传不占用线程；
+- 图片解码、EXIF解析、保存相册等同步工作放到线程池执行，等待推理时直接await推理队列的Future；
+- 帖子流接口通过aiomysql异步访问数据库；
+- 地址解析本来就在后台线程池中进行，识别接口只查询缓存，不等待外部地理编码服务。
+
+返回的JSON与Flask接口完全一致。在flower_frontend目录下运行：
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import contextlib
+import functools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import app as flask_module
+from app import app as flask_app
+from db import db_session
+from db_async import AsyncDatabase
+from inference_queue import InferenceQueueFull
+from pagination import next_cursor
+
+config = flask_app.config
+
+# 执行同步工作（图片解码、结果组装、写数据库）的线程池
+cpu_executor = ThreadPoolExecutor(max_workers=config['ASGI_CPU_WORKERS'], thread_name_prefix='asgi-worker')
+async_db = AsyncDatabase(maxsize=config['ASGI_DB_POOL_SIZE'])
+
+
+def json_response(payload, status=200, headers=None):
+    """使用Flask应用的JSON序列化方式，保证与jsonify的输出格式一致（如日期格式）"""
+    return Response(flask_app.json.dumps(payload), status_code=status, media_type='application/json',
+                    headers=headers)
+
+
+async def run_sync(fn, *args):
+    """在线程池中执行同步函数"""
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, functools.partial(fn, *args))
+
+
+def run_in_db_session(fn, *args):
+    """在一个数据库会话中执行同步函数，与Flask请求一样共用一个连接并只提交一次"""
+    with db_session():
+        return fn(*args)
+
+
+def parse_bool(value):
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+
+def log_request(endpoint, method, ip_address, user_id, status_code, response_time, user_agent):
+    """记录访问流量和错误日志，与Flask的after_request保持一致"""
+    try:
+        flask_module.traffic_buffer.record(endpoint, method, ip_address, user_id, status_code, response_time)
+        if status_code >= 400:
+            flask_module.create_system_log('ERROR', 'API', f'{method} {endpoint} 返回 {status_code}',
+                                           user_id, None, ip_address, user_agent)
+    except Exception as e:
+        print(f"记录访问日志时发生错误: {str(e)}")
+
+
+def traffic_logged(endpoint):
+    """为异步接口记录访问日志，endpoint与Flask视图函数名相同，便于合并统计"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            start = time.time()
+            response = await handler(request)
+            response_time = int((time.time() - start) * 1000)
+            user_id = flask_module.user_id_from_authorization(request.headers.get('Authorization'))
+            asyncio.get_running_loop().run_in_executor(
+                cpu_executor, log_request, endpoint, request.method,
+                request.client.host if request.client else None, user_id,
+                response.status_code, response_time, request.headers.get('User-Agent', '')
+            )
+            return response
+        return wrapper
+    return decorator
+
+
+async def read_body_limited(request, max_size):
+    """异步分块读取请求体，超过大小限制时立即中止"""
+    chunks = []
+    total = 0
+    async for chunk in request.stream():
+        total += len(chunk)
+        if total > max_size:
+            raise RequestEntityTooLarge(f'单张图片不能超过 {max_size // (1024 * 1024)}MB')
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+async def read_detect_request(request):
+    """解析识别请求，与app.read_detect_request支持相同的三种上传方式"""
+    max_file_size = config['DETECT_MAX_FILE_SIZE']
+    content_length = int(request.headers.get('Content-Length') or 0)
+    if content_length > config['MAX_CONTENT_LENGTH']:
+        raise RequestEntityTooLarge('上传内容过大')
+    mimetype = request.headers.get('Content-Type', '').split(';')[0].strip().lower()
+
+    if mimetype == 'multipart/form-data':
+        async with request.form() as form:
+            save_to_album = parse_bool(form.get('save_to_album', 'false'))
+            files = form.getlist('images')
+            is_batch = bool(files)
+            if not files:
+                files = form.getlist('image')[:1]
+            if not files:
+                return None, False, save_to_album
+            flask_module.check_upload_count(len(files))
+            images_data = []
+            for f in files:
+                data = await f.read(max_file_size + 1)
+                if len(data) > max_file_size:
+                    raise RequestEntityTooLarge(f'单张图片不能超过 {max_file_size // (1024 * 1024)}MB')
+                images_data.append(data)
+            return images_data, is_batch, save_to_album
+
+    if mimetype.startswith('image/'):
+        save_to_album = parse_bool(request.query_params.get('save_to_album', 'false'))
+        if content_length > max_file_size:
+            raise RequestEntityTooLarge(f'单张图片不能超过 {max_file_size // (1024 * 1024)}MB')
+        image_bytes = await read_body_limited(request, max_file_size)
+        return ([image_bytes] if image_bytes else None), False, save_to_album
+
+    data = json.loads(await read_body_limited(request, config['MAX_CONTENT_LENGTH']))
+    save_to_album = data.get('save_to_album', False)
+    if 'image' in data:
+        return [data['image']], False, save_to_album
+    if 'images' in data:
+        flask_module.check_upload_count(len(data['images']))
+        return data['images'], True, save_to_album
+    return None, False, save_to_album
+
+
+@traffic_logged('detect_flower')
+async def detect_flower(request):
+    """花卉识别API接口（异步）"""
+    try:
+        user_id = flask_module.user_id_from_authorization(request.headers.get('Authorization'))
+        images_data, is_batch, save_to_album = await read_detect_request(request)
+
+        if not images_data:
+            return json_response({'success': False, 'error': '缺少图片数据'}, 400)
+
+        job = await run_sync(flask_module.prepare_images, images_data)
+        futures = flask_module.submit_inference(job)
+        # 单张图片推理失败时以异常对象代替结果，批量请求中只有该图片返回错误
+        all_detections = await asyncio.wait_for(
+            asyncio.gather(*[asyncio.wrap_future(future) for future in futures], return_exceptions=True),
+            timeout=config['DETECT_TIMEOUT']
+        )
+
+        if not is_batch:
+            for error in list(job['errors'].values()) + [d for d in all_detections if isinstance(d, Exception)]:
+                raise error
+
+        batch_results = await run_sync(run_in_db_session, flask_module.finish_images, job, list(all_detections),
+                                       user_id, save_to_album)
+
+        if not is_batch:
+            return json_response({'success': True, 'results': batch_results[0]})
+
+        all_results = [
+            {'image_index': i, 'results': results}
+            for i, results in enumerate(batch_results)
+        ]
+        return json_response({'success': True, 'all_results': all_results})
+
+    except RequestEntityTooLarge as e:
+        return json_response({'success': False, 'error': e.description or '上传内容过大'}, 413)
+    except InferenceQueueFull as e:
+        print(f"识别请求被拒绝: {str(e)}")
+        return json_response({'success': False, 'error': '服务器繁忙，请稍后重试'}, 503, {'Retry-After': '1'})
+    except Exception as e:
+        print(f"识别过程中发生错误: {str(e)}")
+        return json_response({'success': False, 'error': str(e)}, 500)
+
+
+@traffic_logged('get_posts_api')
+async def get_posts_api(request):
+    """获取帖子列表（异步）"""
+    try:
+        limit = int(request.query_params.get('limit', 20))
+        offset = int(request.query_params.get('offset', 0))
+        page_cursor = request.query_params.get('cursor')
+
+        posts = await async_db.get_posts(limit, offset, page_cursor)
+        return json_response({'success': True, 'posts': posts, 'next_cursor': next_cursor(posts, limit)})
+    except ValueError as e:
+        return json_response({'success': False, 'error': str(e)}, 400)
+    except Exception as e:
+        print(f"获取帖子列表时发生错误: {str(e)}")
+        return json_response({'success': False, 'error': str(e)}, 500)
+
+
+@traffic_logged('get_post_api')
+async def get_post_api(request):
+    """获取帖子详情（异步）"""
+    try:
+        post = await async_db.get_post_by_id(request.path_params['post_id'])
+        if not post:
+            return json_response({'success': False, 'error': '帖子不存在'}, 404)
+
+        return json_response({'success': True, 'post': post})
+    except Exception as e:
+        print(f"获取帖子详情时发生错误: {str(e)}")
+        return json_response({'success': False, 'error': str(e)}, 500)
+
+
+@traffic_logged('get_comments_api')
+async def get_comments_api(request):
+    """获取帖子评论（异步）"""
+    try:
+        comments = await async_db.get_comments_by_post_id(request.path_params['post_id'])
+        return json_response({'success': True, 'comments': comments})
+    except Exception as e:
+        print(f"获取评论时发生错误: {str(e)}")
+        return json_response({'success': False, 'error': str(e)}, 500)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await async_db.close()
+    cpu_executor.shutdown(wait=False)
+
+
+# 同一路径的其他请求方法（如POST /api/posts）不会完全匹配异步路由，交给挂载的Flask应用处理
+application = Starlette(
+    routes=[
+        Route('/api/detect', detect_flower, methods=['POST']),
+        Route('/api/posts', get_posts_api, methods=['GET']),
+        Route('/api/posts/{post_id:int}', get_post_api, methods=['GET']),
+        Route('/api/posts/{post_id:int}/comments', get_comments_api, methods=['GET']),
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    middleware=[
+        # 与Flask-CORS的默认配置一致，允许前端跨域访问
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+    ],
+    lifespan=lifespan
+)
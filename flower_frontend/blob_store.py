@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+按内容寻址的图片存储
+
+上传的图片以内容的SHA-256命名，按哈希前缀分目录保存（如 blobs/3f/a2/3fa2....jpg），
+同一张照片无论上传多少次只保存一份。文件的引用计数记录在数据库的 image_blobs 表中，
+由 album_images 和 recognition_results 中引用该文件的记录（包括已移入回收站的记录）共同持有，
+见 db.py 中的 acquire/release 逻辑。
+"""
+import hashlib
+import os
+import uuid
+
+
+def sniff_extension(data):
+    """根据文件头判断图片扩展名，无法识别时按JPEG处理"""
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return '.png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return '.webp'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return '.gif'
+    if data.startswith(b'BM'):
+        return '.bmp'
+    return '.jpg'
+
+
+class BlobStore:
+    """以内容哈希为文件名、按哈希前缀分片保存的文件存储"""
+
+    def __init__(self, root_dir, url_prefix, shard_depth=2, shard_width=2):
+        self.root_dir = root_dir
+        self.url_prefix = url_prefix.rstrip('/')
+        self.shard_depth = shard_depth
+        self.shard_width = shard_width
+
+    @staticmethod
+    def digest(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def shard_stem(self, digest):
+        """返回不含扩展名的分片相对路径，如 3f/a2/3fa2..."""
+        shards = [digest[i * self.shard_width:(i + 1) * self.shard_width] for i in range(self.shard_depth)]
+        return '/'.join(shards + [digest])
+
+    def locate(self, data):
+        """返回 (哈希, 访问URL)，不写入文件"""
+        digest = self.digest(data)
+        return digest, f"{self.url_prefix}/{self.shard_stem(digest)}{sniff_extension(data)}"
+
+    def path_for_url(self, url):
+        """将访问URL转换为本地文件路径，不属于本存储的URL返回None"""
+        if not url or not url.startswith(self.url_prefix + '/'):
+            return None
+        relative = url[len(self.url_prefix) + 1:]
+        path = os.path.normpath(os.path.join(self.root_dir, *relative.split('/')))
+        if not path.startswith(os.path.normpath(self.root_dir) + os.sep):
+            return None
+        return path
+
+    def digest_from_url(self, url):
+        """返回本存储中文件URL对应的内容哈希，不属于本存储的URL返回None"""
+        if self.path_for_url(url) is None:
+            return None
+        digest = os.path.splitext(url.rsplit('/', 1)[-1])[0]
+        if len(digest) != 64 or url != f"{self.url_prefix}/{self.shard_stem(digest)}{os.path.splitext(url)[1]}":
+            return None
+        return digest
+
+    def put(self, data):
+        """保存文件（内容相同的文件已存在时直接复用），返回 (哈希, 访问URL)"""
+        digest, url = self.locate(data)
+        path = self.path_for_url(url)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"  # 并发写入同一内容时各自写临时文件再改名
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest, url
+
+    def remove(self, url):
+        """删除文件，返回是否删除成功"""
+        path = self.path_for_url(url)
+        if path is None:
+            return False
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
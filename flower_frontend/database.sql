@@ -10,6 +10,7 @@ CREATE TABLE IF NOT EXISTS users (
     username VARCHAR(50) UNIQUE NOT NULL,
     email VARCHAR(100) UNIQUE NOT NULL,
     password_hash VARCHAR(255) NOT NULL,
+    followers_count INT NOT NULL DEFAULT 0,
     created_at INT NOT NULL,
     updated_at INT NOT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -46,15 +47,27 @@ CREATE TABLE IF NOT EXISTS role_permissions (
     FOREIGN KEY (permission_id) REFERENCES permissions(id) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+-- 权限版本号表（单行，修改用户角色时递增，各进程据此清空权限缓存）
+CREATE TABLE IF NOT EXISTS permission_version (
+    id INT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+INSERT IGNORE INTO permission_version (id, version) VALUES (1, 0);
+
 -- 识别结果表
 CREATE TABLE IF NOT EXISTS recognition_results (
     id INT PRIMARY KEY AUTO_INCREMENT,
     user_id INT NOT NULL,
     image_path TEXT NOT NULL,
+    blob_hash CHAR(64),
     result VARCHAR(100) NOT NULL,
     confidence FLOAT NOT NULL,
+    thumbnail_path TEXT,
+    medium_path TEXT,
     created_at INT NOT NULL,
     deleted_at INT,
+    INDEX idx_recognition_results_blob (blob_hash),
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
@@ -66,9 +79,11 @@ CREATE TABLE IF NOT EXISTS posts (
     image_url TEXT,
     likes_count INT DEFAULT 0,
     comments_count INT DEFAULT 0,
+    fanned_out TINYINT NOT NULL DEFAULT 1,
     created_at INT NOT NULL,
     updated_at INT NOT NULL,
     deleted_at INT,
+    INDEX idx_posts_user_fanout (user_id, fanned_out, created_at),
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
@@ -105,6 +120,19 @@ CREATE TABLE IF NOT EXISTS follows (
     UNIQUE KEY unique_follow (follower_id, following_id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+-- 首页时间线表（发帖时写入作者粉丝的时间线，粉丝数超过阈值的作者的帖子在读取时合并）
+CREATE TABLE IF NOT EXISTS home_timeline (
+    user_id INT NOT NULL,
+    post_id INT NOT NULL,
+    author_id INT NOT NULL,
+    created_at INT NOT NULL,
+    PRIMARY KEY (user_id, post_id),
+    INDEX idx_home_timeline_user_created (user_id, created_at, post_id),
+    INDEX idx_home_timeline_user_author (user_id, author_id),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (post_id) REFERENCES posts(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 -- 系统日志表
 CREATE TABLE IF NOT EXISTS system_logs (
     id INT PRIMARY KEY AUTO_INCREMENT,
@@ -129,7 +157,34 @@ CREATE TABLE IF NOT EXISTS traffic_stats (
     user_id INT,
     response_status INT NOT NULL,
     response_time FLOAT NOT NULL,
-    created_at INT NOT NULL
+    created_at INT NOT NULL,
+    INDEX idx_traffic_stats_created (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 访问流量汇总表（分钟/小时/天粒度，h0-h11为响应时间直方图，区间上界见traffic_rollup.py）
+CREATE TABLE IF NOT EXISTS traffic_rollups (
+    id BIGINT PRIMARY KEY AUTO_INCREMENT,
+    granularity VARCHAR(10) NOT NULL,
+    bucket_start INT NOT NULL,
+    endpoint VARCHAR(255) NOT NULL,
+    method VARCHAR(10) NOT NULL,
+    response_status INT NOT NULL,
+    request_count INT NOT NULL DEFAULT 0,
+    error_count INT NOT NULL DEFAULT 0,
+    total_response_time DOUBLE NOT NULL DEFAULT 0,
+    h0 INT NOT NULL DEFAULT 0,
+    h1 INT NOT NULL DEFAULT 0,
+    h2 INT NOT NULL DEFAULT 0,
+    h3 INT NOT NULL DEFAULT 0,
+    h4 INT NOT NULL DEFAULT 0,
+    h5 INT NOT NULL DEFAULT 0,
+    h6 INT NOT NULL DEFAULT 0,
+    h7 INT NOT NULL DEFAULT 0,
+    h8 INT NOT NULL DEFAULT 0,
+    h9 INT NOT NULL DEFAULT 0,
+    h10 INT NOT NULL DEFAULT 0,
+    h11 INT NOT NULL DEFAULT 0,
+    UNIQUE KEY uk_traffic_rollups (granularity, bucket_start, endpoint, method, response_status)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- 每日流量汇总表
@@ -139,11 +194,19 @@ CREATE TABLE IF NOT EXISTS daily_traffic_summary (
     total_requests INT DEFAULT 0,
     unique_visitors INT DEFAULT 0,
     avg_response_time FLOAT DEFAULT 0,
+    total_response_time DOUBLE DEFAULT 0,
     error_count INT DEFAULT 0,
+    visitor_sketch BLOB,
     created_at INT NOT NULL,
     updated_at INT NOT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+-- 定期维护任务执行记录表（多个worker进程据此每个间隔只执行一次）
+CREATE TABLE IF NOT EXISTS maintenance_runs (
+    name VARCHAR(100) PRIMARY KEY,
+    last_run_at INT NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 -- 服务器状态表
 CREATE TABLE IF NOT EXISTS server_status (
     id INT PRIMARY KEY AUTO_INCREMENT,
@@ -214,13 +277,31 @@ CREATE TABLE IF NOT EXISTS album_images (
     id INT PRIMARY KEY AUTO_INCREMENT,
     album_id INT NOT NULL,
     user_id INT NOT NULL,
+    recognition_result_id INT,
     image_path TEXT NOT NULL,
+    blob_hash CHAR(64),
     image_name VARCHAR(255) NOT NULL,
     image_description TEXT,
+    flower_name VARCHAR(100),
+    confidence FLOAT,
+    thumbnail_path TEXT,
+    medium_path TEXT,
     created_at INT NOT NULL,
     deleted_at INT,
+    INDEX idx_album_images_blob (blob_hash),
     FOREIGN KEY (album_id) REFERENCES albums(id) ON DELETE CASCADE,
-    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (recognition_result_id) REFERENCES recognition_results(id) ON DELETE SET NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 图片文件表（按内容SHA-256去重存储，ref_count为album_images和recognition_results中的引用数）
+CREATE TABLE IF NOT EXISTS image_blobs (
+    sha256 CHAR(64) PRIMARY KEY,
+    blob_path VARCHAR(255) NOT NULL,
+    size_bytes BIGINT NOT NULL DEFAULT 0,
+    ref_count INT NOT NULL DEFAULT 0,
+    created_at INT NOT NULL,
+    updated_at INT NOT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- 回收站表
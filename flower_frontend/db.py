@@ -1,8 +1,21 @@
 import pymysql
 import time
 import os
+import contextlib
+import functools
+import contextvars
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from db_pool import ConnectionPool
+from hyperloglog import HyperLogLog
+from pagination import keyset_condition
+from migrations import MIGRATIONS, HOT_QUERIES, analyze_plan
+import queries
+from permission_cache import PermissionCache
+from traffic_rollup import (
+    GRANULARITIES, HISTOGRAM_COLUMNS, rollup_rows, summarize, date_to_timestamp
+)
+
 # MySQL数据库配置
 DB_CONFIG = {
     'host': 'localhost',
@@ -13,13 +26,210 @@ DB_CONFIG = {
     'cursorclass': pymysql.cursors.DictCursor
 }
 
+# 连接池配置
+DB_POOL_CONFIG = {
+    'min_size': 2,  # 每个进程首次访问数据库时预先建立的连接数
+    'max_size': int(os.getenv('FLOWER_DB_POOL_SIZE', '16')),  # 每个进程的最大连接数，不应小于请求线程数
+    'max_lifetime': 3600,  # 连接最长使用时间（秒），应小于MySQL的wait_timeout
+    'health_check_interval': 30,  # 空闲超过该时间（秒）的连接取出时先ping检查
+    'timeout': 10  # 连接全部被占用时的最长等待时间（秒）
+}
+
+# 用户权限缓存配置
+PERMISSION_CACHE_CONFIG = {
+    'ttl': int(os.getenv('FLOWER_PERMISSION_CACHE_TTL', '30')),  # 缓存有效期（秒），0为不缓存；读取权限版本号失败时其他worker进程修改角色后最多延迟这么久生效
+    'max_entries': 10000,  # 每个进程最多缓存的用户数
+    'version_check_interval': 1.0  # 读取共享权限版本号的间隔（秒），其他worker进程修改角色后最多延迟这么久生效
+}
+
+# 首页时间线配置
+TIMELINE_CONFIG = {
+    'fanout_threshold': int(os.getenv('FLOWER_TIMELINE_FANOUT_THRESHOLD', '1000')),  # 粉丝数超过该值的作者发帖时不写入粉丝的时间线，读取时再合并
+    'follow_backfill': 50,  # 关注用户后写入时间线的对方最近帖子数
+    'rebuild_per_author': 200  # 重建时间线时每个作者最多写入的帖子数
+}
+
 # SQL文件路径
 SCHEMA_SQL = 'database.sql'
 BACKUP_SQL = 'database_backup.sql'
 
+# 以这些关键字开头的语句只读取数据，执行前不需要设置保存点
+READ_ONLY_STATEMENTS = ('SELECT', 'SHOW', 'EXPLAIN', 'DESC', 'DESCRIBE')
+
+
+def is_write_statement(query):
+    """判断SQL语句是否可能修改数据，无法判断时按写语句处理"""
+    words = query.split(None, 1)
+    return not words or words[0].upper() not in READ_ONLY_STATEMENTS
+
+
+class Savepoint:
+    """会话中的保存点，登记时只记录状态，在其后的第一条写语句执行前才在数据库中设置"""
+    __slots__ = ('name', 'pending_commits', 'callbacks')
+    
+    def __init__(self, pending_commits, callbacks):
+        self.name = None  # 尚未在数据库中设置
+        self.pending_commits = pending_commits
+        self.callbacks = callbacks
+
+
+class SessionCursor:
+    """会话连接的游标：执行写语句前设置尚未设置的保存点，只读查询不产生额外的往返"""
+    
+    def __init__(self, session, cursor):
+        self._session = session
+        self._cursor = cursor
+    
+    def execute(self, query, args=None):
+        if is_write_statement(query):
+            self._session.before_write()
+        return self._cursor.execute(query, args)
+    
+    def executemany(self, query, args):
+        if is_write_statement(query):
+            self._session.before_write()
+        return self._cursor.executemany(query, args)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._cursor.close()
+    
+    def __iter__(self):
+        return iter(self._cursor)
+    
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class SessionConnection:
+    """会话中交给各方法使用的连接：commit和close推迟到会话结束，rollback只回滚到取得连接时登记的保存点
+    
+    这样一个方法失败回滚不会撤销同一请求中其他已成功（并已向调用方报告成功）的操作。
+    """
+    
+    def __init__(self, session, savepoint):
+        self._session = session
+        self._savepoint = savepoint
+    
+    def cursor(self, *args, **kwargs):
+        return SessionCursor(self._session, self._session.conn.cursor(*args, **kwargs))
+    
+    def commit(self):
+        self._session.pending_commits += 1
+    
+    def rollback(self):
+        self._session.rollback_to(self._savepoint)
+    
+    def after_commit(self, callback):
+        """会话提交后调用callback；回滚到保存点时一并撤销"""
+        self._session.after_commit.append(callback)
+    
+    def close(self):
+        self._session.release(self._savepoint)
+    
+    def __getattr__(self, name):
+        return getattr(self._session.conn, name)
+
+
+class DatabaseSession:
+    """请求级别的工作单元：会话内的所有数据库操作共用一个连接和事务，结束时只提交一次
+    
+    连接在第一次访问数据库时才从连接池取出，不访问数据库的请求不占用连接。
+    每次取得连接时登记一个保存点，操作失败时只回滚该操作自己的修改；保存点在第一条写语句
+    执行前才真正设置，连续登记的多个保存点共用一个，只读的操作不会产生额外的往返。
+    无法回滚到保存点时（如死锁导致整个事务已被回滚），整个会话在结束时回滚。
+    """
+    
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+        self.failed = False
+        self.pending_commits = 0
+        self.after_commit = []  # 提交成功后依次调用的回调
+        self._savepoint_seq = 0
+        self._unset_savepoints = []  # 已登记但尚未在数据库中设置的保存点
+    
+    def connection(self):
+        if self.conn is None:
+            self.conn = self.pool.acquire()
+        return SessionConnection(self, self.savepoint())
+    
+    def savepoint(self):
+        """登记保存点，返回用于rollback_to和release的Savepoint"""
+        savepoint = Savepoint(self.pending_commits, len(self.after_commit))
+        self._unset_savepoints.append(savepoint)
+        return savepoint
+    
+    def before_write(self):
+        """执行写语句前调用：在数据库中设置所有已登记但尚未设置的保存点"""
+        if not self._unset_savepoints or self.failed:
+            return
+        self._savepoint_seq += 1
+        name = f'sp_{self._savepoint_seq}'
+        with self.conn.cursor() as cursor:
+            cursor.execute(f'SAVEPOINT {name}')
+        # 这些保存点登记之后还没有执行过写语句，位置相同，共用一个
+        for savepoint in self._unset_savepoints:
+            savepoint.name = name
+        self._unset_savepoints = []
+    
+    def release(self, savepoint):
+        """不再需要回滚到该保存点；尚未设置的保存点直接取消登记"""
+        if savepoint.name is None:
+            self._unset_savepoints = [sp for sp in self._unset_savepoints if sp is not savepoint]
+    
+    def rollback_to(self, savepoint):
+        """回滚到保存点，同时撤销保存点之后登记的提交和提交后回调"""
+        if self.failed:
+            return
+        if savepoint.name is not None:
+            try:
+                with self.conn.cursor() as cursor:
+                    cursor.execute(f'ROLLBACK TO SAVEPOINT {savepoint.name}')
+            except Exception:
+                self.fail()
+                return
+        # 保存点尚未设置说明其后没有写语句，数据库中无需回滚
+        self.pending_commits = savepoint.pending_commits
+        del self.after_commit[savepoint.callbacks:]
+    
+    def fail(self):
+        self.failed = True
+        self._unset_savepoints = []
+        if self.conn is not None:
+            self.conn.rollback()
+    
+    def finish(self, commit=True):
+        """结束会话：commit为True且没有操作失败时提交，否则回滚；然后归还连接"""
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        try:
+            if commit and not self.failed and self.pending_commits:
+                conn.commit()
+                for callback in self.after_commit:
+                    try:
+                        callback()
+                    except Exception as e:
+                        # 事务已经提交，回调失败不影响请求结果
+                        print(f"事务提交后的回调执行失败: {e}")
+            else:
+                conn.rollback()
+        finally:
+            conn.close()
+
+
 class SQLDatabaseManager:
-    def __init__(self, db_config=DB_CONFIG):
+    def __init__(self, db_config=DB_CONFIG, pool_config=DB_POOL_CONFIG, permission_cache_config=PERMISSION_CACHE_CONFIG,
+                 timeline_config=TIMELINE_CONFIG):
         self.db_config = db_config
+        self.timeline_config = timeline_config
+        self.pool = ConnectionPool(lambda: pymysql.connect(**self.db_config), **pool_config)
+        self.permission_cache = PermissionCache(version_fn=self.get_permission_version, **permission_cache_config)
+        self._session = contextvars.ContextVar('db_session', default=None)
+        self.blob_release_handler = None  # 图片文件的最后一个引用被删除时调用，参数为(哈希, 文件路径)
         self.ensure_database_exists()
     
     def ensure_database_exists(self):
@@ -36,6 +246,7 @@ class SQLDatabaseManager:
         
         # 初始化表结构
         self.initialize_from_sql(SCHEMA_SQL)
+        self.apply_migrations()
     
     def create_database(self):
         """创建数据库"""
@@ -82,6 +293,118 @@ class SQLDatabaseManager:
         finally:
             conn.close()
     
+    def _column_exists(self, cursor, table, column):
+        cursor.execute(
+            "SELECT 1 FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+            (table, column)
+        )
+        return cursor.fetchone() is not None
+    
+    def _index_exists(self, cursor, table, index_name):
+        cursor.execute(
+            "SELECT 1 FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+            (table, index_name)
+        )
+        return cursor.fetchone() is not None
+    
+    def _apply_migration_operation(self, cursor, operation):
+        """执行单个迁移操作，字段或索引已存在时跳过"""
+        kind = operation[0]
+        if kind == 'sql':
+            cursor.execute(operation[1])
+        elif kind == 'column':
+            _, table, column, definition = operation
+            if not self._column_exists(cursor, table, column):
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        elif kind == 'index':
+            _, table, index_name, columns = operation
+            if not self._index_exists(cursor, table, index_name):
+                cursor.execute(f"CREATE INDEX {index_name} ON {table} ({', '.join(columns)})")
+        else:
+            raise ValueError(f'未知的迁移操作: {kind}')
+    
+    def get_schema_version(self):
+        """返回已执行的最高迁移版本号"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute("SELECT MAX(version) as version FROM schema_migrations")
+            return cursor.fetchone()['version'] or 0
+        finally:
+            conn.close()
+    
+    def apply_migrations(self, migrations=MIGRATIONS):
+        """按版本号顺序执行未完成的迁移，返回本次执行的版本号列表
+        
+        通过MySQL命名锁保证多个进程同时启动时只有一个在执行迁移。
+        DDL语句会隐式提交，因此每个操作都先检查是否已完成，迁移中途失败后重新执行是安全的。
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                description VARCHAR(255) NOT NULL,
+                applied_at INT NOT NULL
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+            ''')
+            cursor.execute("SELECT GET_LOCK('flower_schema_migrations', 60) as locked")
+            if not cursor.fetchone()['locked']:
+                raise Exception('等待迁移锁超时')
+            try:
+                cursor.execute("SELECT version FROM schema_migrations")
+                done = {row['version'] for row in cursor.fetchall()}
+                applied = []
+                for version, description, operations in sorted(migrations, key=lambda m: m[0]):
+                    if version in done:
+                        continue
+                    for operation in operations:
+                        self._apply_migration_operation(cursor, operation)
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, description, applied_at) VALUES (%s, %s, %s)",
+                        (version, description, int(time.time()))
+                    )
+                    conn.commit()
+                    applied.append(version)
+                    print(f"已执行数据库迁移 {version}: {description}")
+                return applied
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK('flower_schema_migrations')")
+        except Exception as e:
+            conn.rollback()
+            raise Exception(f'执行数据库迁移失败: {str(e)}')
+        finally:
+            conn.close()
+    
+    def check_query_plans(self, queries=HOT_QUERIES):
+        """对登记的高频查询执行EXPLAIN，返回每个查询的执行计划和需要关注的表
+        
+        issues 为 [(表名, 说明)]，包括全表扫描（type为ALL）、全索引扫描（type为index）
+        以及Extra中的文件排序（Using filesort）和临时表（Using temporary）。
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            reports = []
+            for name, (sql, params) in queries.items():
+                cursor.execute(f"EXPLAIN {sql}", params)
+                plan = [dict(row) for row in cursor.fetchall()]
+                reports.append({
+                    'name': name,
+                    'full_scan_tables': [row['table'] for row in plan if row.get('type') == 'ALL'],
+                    'issues': analyze_plan(plan),
+                    'plan': plan
+                })
+            return reports
+        except Exception as e:
+            raise Exception(f'检查查询计划失败: {str(e)}')
+        finally:
+            conn.close()
+    
     def delete_database(self):
         """删除数据库"""
         config = self.db_config.copy()
@@ -170,9 +493,104 @@ class SQLDatabaseManager:
         return True
     
     def get_connection(self):
-        """获取数据库连接"""
-        conn = pymysql.connect(**self.db_config)
-        return conn
+        """获取数据库连接，使用完后调用close()归还
+        
+        当前处于会话中时返回会话的连接，否则从连接池取出一个连接单独使用。
+        """
+        session = self._session.get()
+        if session is not None:
+            return session.connection()
+        return self.pool.acquire()
+    
+    def begin_session(self):
+        """开始请求级别的会话，返回用于end_session的令牌；已处于会话中时返回None（并入外层会话）"""
+        if self._session.get() is not None:
+            return None
+        return self._session.set(DatabaseSession(self.pool))
+    
+    def end_session(self, token, commit=True):
+        """结束begin_session开始的会话，提交失败时抛出异常"""
+        if token is None:
+            return
+        session = self._session.get()
+        self._session.reset(token)
+        try:
+            session.finish(commit)
+        except Exception as e:
+            raise Exception(f'提交事务失败: {str(e)}')
+    
+    @contextlib.contextmanager
+    def session(self):
+        """以with语句使用的会话，代码块抛出异常时回滚
+        
+        已处于会话中时以保存点隔离代码块：代码块抛出异常时只回滚代码块内的修改，外层会话继续。
+        """
+        outer = self._session.get()
+        if outer is not None:
+            savepoint = outer.savepoint()
+            try:
+                yield
+            except BaseException:
+                outer.rollback_to(savepoint)
+                raise
+            finally:
+                outer.release(savepoint)
+            return
+        token = self.begin_session()
+        try:
+            yield
+        except BaseException:
+            self.end_session(token, commit=False)
+            raise
+        self.end_session(token)
+    
+    def get_pool_stats(self):
+        """获取连接池统计"""
+        return self.pool.get_stats()
+    
+    def run_exclusive(self, lock_name, fn, *args, min_interval=None, **kwargs):
+        """在MySQL命名锁内执行fn，返回(是否执行, 结果)；锁已被其他进程持有时直接跳过
+        
+        用于每个worker进程都会定期触发的维护任务，同一时间只有一个进程执行，不会互相争抢行锁。
+        传入min_interval时还会在maintenance_runs表中记录执行时间，距上次执行（任何进程）
+        不足min_interval秒时跳过，所有worker合计每个间隔只执行一次。
+        命名锁属于连接，这里单独从连接池取出连接持有锁，不使用请求会话的连接。
+        """
+        conn = self.pool.acquire()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, 0) as locked", (lock_name,))
+            if not cursor.fetchone()['locked']:
+                return False, None
+            try:
+                now = int(time.time())
+                if min_interval:
+                    cursor.execute("SELECT last_run_at FROM maintenance_runs WHERE name = %s", (lock_name,))
+                    row = cursor.fetchone()
+                    if row and now - row['last_run_at'] < min_interval:
+                        return False, None
+                result = fn(*args, **kwargs)
+                if min_interval:
+                    cursor.execute(
+                        "INSERT INTO maintenance_runs (name, last_run_at) VALUES (%s, %s) "
+                        "ON DUPLICATE KEY UPDATE last_run_at = VALUES(last_run_at)",
+                        (lock_name, now)
+                    )
+                    conn.commit()
+                return True, result
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (lock_name,))
+        finally:
+            conn.close()
+    
+    def _after_commit(self, callback):
+        """处于会话中时在会话提交后调用callback，否则立即调用"""
+        session = self._session.get()
+        if session is not None:
+            session.after_commit.append(callback)
+        else:
+            callback()
     
     # 用户相关操作
     def create_user(self, username, email, password):
@@ -280,28 +698,152 @@ class SQLDatabaseManager:
         finally:
             conn.close()
     
-    def check_user_permission(self, user_id, permission_name):
-        """检查用户是否有指定权限"""
+    def _load_user_access(self, user_id):
+        """一次查询用户的角色名和权限名集合"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
             cursor.execute('''
-            SELECT COUNT(*) FROM permissions p
-            JOIN role_permissions rp ON p.id = rp.permission_id
-            JOIN user_roles ur ON rp.role_id = ur.role_id
-            WHERE ur.user_id = %s AND p.name = %s
-            ''', (user_id, permission_name))
-            count = cursor.fetchone()[0]
-            return count > 0
+            SELECT r.name as role_name, p.name as permission_name FROM user_roles ur
+            JOIN roles r ON ur.role_id = r.id
+            LEFT JOIN role_permissions rp ON rp.role_id = ur.role_id
+            LEFT JOIN permissions p ON rp.permission_id = p.id
+            WHERE ur.user_id = %s
+            ''', (user_id,))
+            rows = cursor.fetchall()
+            return {
+                'roles': frozenset(row['role_name'] for row in rows),
+                'permissions': frozenset(row['permission_name'] for row in rows if row['permission_name'])
+            }
+        except Exception as e:
+            raise Exception(f'获取用户权限失败: {str(e)}')
+        finally:
+            conn.close()
+    
+    def get_user_access(self, user_id):
+        """获取用户的角色名和权限名集合（带进程内缓存），返回 {'roles': frozenset, 'permissions': frozenset}"""
+        return self.permission_cache.get_or_load(user_id, self._load_user_access)
+    
+    def get_permission_version(self):
+        """读取共享的权限版本号，修改任何用户的角色时递增"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('SELECT version FROM permission_version WHERE id = 1')
+            row = cursor.fetchone()
+            return row['version'] if row else 0
         except Exception as e:
-            raise Exception(f'检查用户权限失败: {str(e)}')
+            raise Exception(f'获取权限版本号失败: {str(e)}')
         finally:
             conn.close()
     
+    def invalidate_user_access(self, user_id=None):
+        """使用户的权限缓存失效；处于会话中时在提交后再失效一次，避免其他请求在提交前重新缓存旧权限"""
+        self.permission_cache.invalidate(user_id)
+        self._after_commit(lambda: self.permission_cache.invalidate(user_id))
+    
+    def check_user_permission(self, user_id, permission_name):
+        """检查用户是否有指定权限"""
+        return permission_name in self.get_user_access(user_id)['permissions']
+    
     # 花卉识别结果相关操作
-    def save_recognition_result(self, user_id, image_path, result, confidence):
-        """保存花卉识别结果"""
+    # 图片文件引用计数
+    # album_images和recognition_results中引用同一图片文件的每条记录各持有一个引用，
+    # 软删除（移入回收站）的记录仍持有引用，永久删除记录时才释放
+    def _acquire_blob(self, cursor, blob_hash, blob_path=None, size_bytes=None):
+        """为图片文件增加一个引用；未提供文件路径时只能引用已存在的文件"""
+        now = int(time.time())
+        if blob_path is None:
+            cursor.execute(
+                "UPDATE image_blobs SET ref_count = ref_count + 1, updated_at = %s WHERE sha256 = %s",
+                (now, blob_hash)
+            )
+            if cursor.rowcount == 0:
+                raise Exception('图片文件不存在或已被删除')
+            return
+        cursor.execute('''
+        INSERT INTO image_blobs (sha256, blob_path, size_bytes, ref_count, created_at, updated_at)
+        VALUES (%s, %s, %s, 1, %s, %s)
+        ON DUPLICATE KEY UPDATE ref_count = ref_count + 1, updated_at = VALUES(updated_at)
+        ''', (blob_hash, blob_path, size_bytes or 0, now, now))
+    
+    def _release_blob(self, conn, cursor, blob_hash):
+        """释放图片文件的一个引用，最后一个引用释放时删除文件记录，事务提交后再删除文件
+        
+        事务回滚时文件记录和引用它的记录都会恢复，因此不能在提交前删除文件。
+        """
+        cursor.execute(
+            "SELECT blob_path, ref_count FROM image_blobs WHERE sha256 = %s FOR UPDATE",
+            (blob_hash,)
+        )
+        blob = cursor.fetchone()
+        if not blob:
+            return
+        if blob['ref_count'] > 1:
+            cursor.execute(
+                "UPDATE image_blobs SET ref_count = ref_count - 1, updated_at = %s WHERE sha256 = %s",
+                (int(time.time()), blob_hash)
+            )
+            return
+        cursor.execute("DELETE FROM image_blobs WHERE sha256 = %s", (blob_hash,))
+        conn.after_commit(functools.partial(self._remove_released_blob, blob_hash, blob['blob_path']))
+    
+    def _remove_released_blob(self, blob_hash, blob_path):
+        """文件记录删除并提交后调用blob_release_handler删除文件
+        
+        删除前在新事务中锁定该哈希（记录不存在时为间隙锁，会阻塞同一内容的新登记）并确认没有被重新登记；
+        已被重新登记时保留文件，由新的上传者负责写入。
+        """
+        if not self.blob_release_handler:
+            return
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute("SELECT sha256 FROM image_blobs WHERE sha256 = %s FOR UPDATE", (blob_hash,))
+            if cursor.fetchone() is None:
+                self.blob_release_handler(blob_hash, blob_path)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"删除图片文件失败 ({blob_hash}): {str(e)}")
+        finally:
+            conn.close()
+    
+    def _delete_item(self, conn, cursor, item_type, original_id):
+        """物理删除回收站项目对应的原记录，并释放其引用的图片文件"""
+        if item_type == 'post':
+            cursor.execute("DELETE FROM posts WHERE id = %s", (original_id,))
+            return
+        table = {'image': 'album_images', 'recognition': 'recognition_results'}.get(item_type)
+        if not table:
+            return
+        cursor.execute(f"SELECT blob_hash FROM {table} WHERE id = %s", (original_id,))
+        row = cursor.fetchone()
+        cursor.execute(f"DELETE FROM {table} WHERE id = %s", (original_id,))
+        if row and row['blob_hash']:
+            self._release_blob(conn, cursor, row['blob_hash'])
+    
+    def get_blob_stats(self):
+        """获取图片文件存储统计（去重后的文件数、总字节数、引用数）"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(
+                "SELECT COUNT(*) as blobs, COALESCE(SUM(size_bytes), 0) as size_bytes, COALESCE(SUM(ref_count), 0) as refs FROM image_blobs"
+            )
+            stats = cursor.fetchone()
+            return {key: int(value) for key, value in stats.items()}
+        except Exception as e:
+            raise Exception(f'获取图片存储统计失败: {str(e)}')
+        finally:
+            conn.close()
+    
+    def save_recognition_result(self, user_id, image_path, result, confidence, blob_hash=None, blob_size=None):
+        """保存花卉识别结果，blob_hash不为空时登记对图片文件的引用"""
         current_time = int(time.time())
         
         conn = self.get_connection()
@@ -309,11 +851,14 @@ class SQLDatabaseManager:
         
         try:
             cursor.execute('''
-            INSERT INTO recognition_results (user_id, image_path, result, confidence, created_at)
-            VALUES (%s, %s, %s, %s, %s)
-            ''', (user_id, image_path, result, confidence, current_time))
+            INSERT INTO recognition_results (user_id, image_path, blob_hash, result, confidence, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ''', (user_id, image_path, blob_hash, result, confidence, current_time))
+            result_id = cursor.lastrowid
+            if blob_hash:
+                self._acquire_blob(cursor, blob_hash, image_path, blob_size)
             conn.commit()
-            return cursor.lastrowid
+            return result_id
         except Exception as e:
             conn.rollback()
             raise Exception(f'保存识别结果失败: {str(e)}')
@@ -353,6 +898,7 @@ class SQLDatabaseManager:
             ''', (user_id, content, image_url, 0, 0, current_time, current_time))
             
             post_id = cursor.lastrowid
+            self._fan_out_post(cursor, post_id, user_id, current_time)
             conn.commit()
             return post_id
         except Exception as e:
@@ -361,19 +907,15 @@ class SQLDatabaseManager:
         finally:
             conn.close()
     
-    def get_posts(self, limit=20, offset=0):
-        """获取帖子列表（排除已删除的）"""
+    def get_posts(self, limit=20, offset=0, page_cursor=None):
+        """获取帖子列表（排除已删除的），传入page_cursor时从游标位置继续，忽略offset"""
+        keyset, keyset_params = keyset_condition(page_cursor, 'p.created_at', 'p.id')
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-            SELECT p.*, u.username FROM posts p
-            JOIN users u ON p.user_id = u.id
-            WHERE p.deleted_at IS NULL
-            ORDER BY p.created_at DESC
-            LIMIT %s OFFSET %s
-            ''', (limit, offset))
+            cursor.execute(queries.POSTS_PAGE.format(keyset=keyset),
+                           (*keyset_params, limit, 0 if page_cursor else offset))
             posts = cursor.fetchall()
             return [dict(post) for post in posts]
         except Exception as e:
@@ -381,6 +923,161 @@ class SQLDatabaseManager:
         finally:
             conn.close()
     
+    def get_feed(self, viewer_id=None, limit=20, offset=0, page_cursor=None, comments_per_post=3):
+        """获取组装好的帖子流：帖子及作者、当前用户的点赞和关注状态、每个帖子最早的几条评论
+        
+        无论帖子数量多少都只执行固定的4条查询（帖子、点赞、关注、评论），共用一个连接。
+        未登录（viewer_id为None）时 is_liked 和 is_following_author 均为False。
+        """
+        keyset, keyset_params = keyset_condition(page_cursor, 'p.created_at', 'p.id')
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(queries.POSTS_PAGE.format(keyset=keyset),
+                           (*keyset_params, limit, 0 if page_cursor else offset))
+            posts = [dict(post) for post in cursor.fetchall()]
+            self._attach_feed_state(cursor, posts, viewer_id, comments_per_post)
+            return posts
+        except Exception as e:
+            raise Exception(f'获取帖子流失败: {str(e)}')
+        finally:
+            conn.close()
+    
+    def _attach_feed_state(self, cursor, posts, viewer_id, comments_per_post):
+        """为一页帖子批量补充 is_liked、is_following_author 和 comments 字段"""
+        if not posts:
+            return
+        post_ids = [post['id'] for post in posts]
+        post_marks = ', '.join(['%s'] * len(post_ids))
+        
+        liked, following = set(), set()
+        if viewer_id is not None:
+            cursor.execute(queries.FEED_LIKED_POSTS.format(post_marks=post_marks), (viewer_id, *post_ids))
+            liked = {row['post_id'] for row in cursor.fetchall()}
+            
+            author_ids = sorted({post['user_id'] for post in posts})
+            author_marks = ', '.join(['%s'] * len(author_ids))
+            cursor.execute(queries.FEED_FOLLOWED_AUTHORS.format(author_marks=author_marks), (viewer_id, *author_ids))
+            following = {row['following_id'] for row in cursor.fetchall()}
+        
+        comments = {post_id: [] for post_id in post_ids}
+        if comments_per_post > 0:
+            # 按帖子分组编号，每个帖子只取最早的comments_per_post条
+            cursor.execute(queries.FEED_FIRST_COMMENTS.format(post_marks=post_marks), (*post_ids, comments_per_post))
+            for row in cursor.fetchall():
+                comments[row['post_id']].append(dict(row))
+        
+        for post in posts:
+            post['is_liked'] = post['id'] in liked
+            post['is_following_author'] = post['user_id'] in following
+            post['comments'] = comments[post['id']]
+    
+    # 首页时间线
+    # 普通作者发帖时写入粉丝的时间线（写扩散）；粉丝数超过fanout_threshold的作者只写入自己的时间线，
+    # 并把帖子标记为未扩散（posts.fanned_out = 0），粉丝读取时间线时从posts表查询合并（读扩散）。
+    # 是否扩散在发帖时决定并保存在帖子上，作者粉丝数之后跨过阈值也不会让已发的帖子从时间线中消失
+    def _fan_out_post(self, cursor, post_id, author_id, created_at):
+        """把新帖子写入作者自己的时间线，作者粉丝数不超过阈值时同时写入所有粉丝的时间线，否则标记为未扩散"""
+        cursor.execute(
+            'INSERT INTO home_timeline (user_id, post_id, author_id, created_at) VALUES (%s, %s, %s, %s)',
+            (author_id, post_id, author_id, created_at)
+        )
+        cursor.execute('SELECT followers_count FROM users WHERE id = %s', (author_id,))
+        author = cursor.fetchone()
+        if author and author['followers_count'] <= self.timeline_config['fanout_threshold']:
+            cursor.execute('''
+            INSERT IGNORE INTO home_timeline (user_id, post_id, author_id, created_at)
+            SELECT follower_id, %s, %s, %s FROM follows WHERE following_id = %s
+            ''', (post_id, author_id, created_at, author_id))
+        else:
+            cursor.execute("UPDATE posts SET fanned_out = 0 WHERE id = %s", (post_id,))
+    
+    def get_home_timeline(self, user_id, limit=20, offset=0, page_cursor=None, comments_per_post=3):
+        """获取用户的首页时间线（自己和关注用户的帖子，按时间倒序），帖子字段与get_feed相同
+        
+        传入page_cursor时从游标位置继续，忽略offset。
+        """
+        fetch = limit if page_cursor else offset + limit
+        materialized_keyset, materialized_params = keyset_condition(page_cursor, 'ht.created_at', 'ht.post_id')
+        pulled_keyset, pulled_params = keyset_condition(page_cursor, 'p.created_at', 'p.id')
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(queries.HOME_TIMELINE_MATERIALIZED.format(keyset=materialized_keyset),
+                           (user_id, *materialized_params, fetch))
+            posts = {post['id']: dict(post) for post in cursor.fetchall()}
+            
+            # 关注用户未扩散的帖子没有写入时间线，查询后合并
+            cursor.execute(queries.HOME_TIMELINE_PULLED.format(keyset=pulled_keyset),
+                           (user_id, *pulled_params, fetch))
+            for post in cursor.fetchall():
+                posts.setdefault(post['id'], dict(post))
+            
+            merged = sorted(posts.values(), key=lambda post: (post['created_at'], post['id']), reverse=True)
+            page = merged[0 if page_cursor else offset:][:limit]
+            self._attach_feed_state(cursor, page, user_id, comments_per_post)
+            return page
+        except Exception as e:
+            raise Exception(f'获取首页时间线失败: {str(e)}')
+        finally:
+            conn.close()
+    
+    def rebuild_home_timelines(self, user_id=None, per_author=None):
+        """重建时间线：重新统计粉丝数并按当前阈值重新标记帖子是否扩散，再为指定用户（None为全部用户）重新写入自己和关注用户的最近帖子
+        
+        用于上线时回填已有数据，或调整fanout_threshold后修正时间线。每个用户单独提交一次，
+        返回 {'users': 重建的用户数, 'rows': 写入的记录数}。
+        """
+        per_author = per_author or self.timeline_config['rebuild_per_author']
+        threshold = self.timeline_config['fanout_threshold']
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            if user_id is None:
+                cursor.execute(
+                    'UPDATE users u SET followers_count = (SELECT COUNT(*) FROM follows f WHERE f.following_id = u.id)'
+                )
+                cursor.execute(
+                    'UPDATE posts p JOIN users u ON p.user_id = u.id SET p.fanned_out = (u.followers_count <= %s)',
+                    (threshold,)
+                )
+                conn.commit()
+                cursor.execute('SELECT id FROM users ORDER BY id')
+                user_ids = [row['id'] for row in cursor.fetchall()]
+            else:
+                user_ids = [user_id]
+            
+            rows = 0
+            for uid in user_ids:
+                cursor.execute('DELETE FROM home_timeline WHERE user_id = %s', (uid,))
+                cursor.execute('''
+                INSERT IGNORE INTO home_timeline (user_id, post_id, author_id, created_at)
+                SELECT %s, id, user_id, created_at FROM (
+                    SELECT p.id, p.user_id, p.created_at,
+                           ROW_NUMBER() OVER (PARTITION BY p.user_id ORDER BY p.created_at DESC, p.id DESC) as row_num
+                    FROM posts p
+                    JOIN users u ON p.user_id = u.id
+                    WHERE p.deleted_at IS NULL AND (
+                        p.user_id = %s OR (
+                            p.fanned_out = 1
+                            AND p.user_id IN (SELECT following_id FROM follows WHERE follower_id = %s)
+                        )
+                    )
+                ) recent
+                WHERE row_num <= %s
+                ''', (uid, uid, uid, per_author))
+                rows += cursor.rowcount
+                conn.commit()
+            return {'users': len(user_ids), 'rows': rows}
+        except Exception as e:
+            conn.rollback()
+            raise Exception(f'重建首页时间线失败: {str(e)}')
+        finally:
+            conn.close()
+    
     def get_post_by_id(self, post_id):
         """获取单个帖子详情"""
         conn = self.get_connection()
@@ -654,6 +1351,16 @@ class SQLDatabaseManager:
             INSERT INTO follows (follower_id, following_id, created_at)
             VALUES (%s, %s, %s)
             ''', (follower_id, following_id, current_time))
+            cursor.execute('UPDATE users SET followers_count = followers_count + 1 WHERE id = %s', (following_id,))
+            
+            # 写入对方最近的已扩散帖子，未扩散的帖子在读取时合并
+            cursor.execute('''
+            INSERT IGNORE INTO home_timeline (user_id, post_id, author_id, created_at)
+            SELECT %s, id, user_id, created_at FROM posts
+            WHERE user_id = %s AND fanned_out = 1 AND deleted_at IS NULL
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+            ''', (follower_id, following_id, self.timeline_config['follow_backfill']))
             
             conn.commit()
             return True
@@ -673,8 +1380,15 @@ class SQLDatabaseManager:
         
         try:
             cursor.execute('DELETE FROM follows WHERE follower_id = %s AND following_id = %s', (follower_id, following_id))
+            removed = cursor.rowcount > 0
+            if removed:
+                cursor.execute(
+                    'UPDATE users SET followers_count = followers_count - 1 WHERE id = %s AND followers_count > 0',
+                    (following_id,)
+                )
+                cursor.execute('DELETE FROM home_timeline WHERE user_id = %s AND author_id = %s', (follower_id, following_id))
             conn.commit()
-            return cursor.rowcount > 0
+            return removed
         except Exception as e:
             conn.rollback()
             raise Exception(f'取消关注失败: {str(e)}')
@@ -762,13 +1476,15 @@ class SQLDatabaseManager:
         finally:
             conn.close()
     
-    def get_system_logs(self, limit=100, offset=0, log_level=None, module=None, start_time=None, end_time=None):
-        """获取系统日志"""
+    def get_system_logs(self, limit=100, offset=0, log_level=None, module=None, start_time=None, end_time=None,
+                        page_cursor=None):
+        """获取系统日志，传入page_cursor时从游标位置继续，忽略offset"""
+        keyset, keyset_params = keyset_condition(page_cursor)
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            query = 'SELECT * FROM system_logs WHERE 1=1'
+            query = queries.SYSTEM_LOGS_SELECT
             params = []
             
             if log_level:
@@ -783,9 +1499,11 @@ class SQLDatabaseManager:
             if end_time:
                 query += ' AND created_at <= %s'
                 params.append(end_time)
+            query += keyset
+            params.extend(keyset_params)
             
-            query += ' ORDER BY created_at DESC LIMIT %s OFFSET %s'
-            params.extend([limit, offset])
+            query += queries.SYSTEM_LOGS_ORDER
+            params.extend([limit, 0 if page_cursor else offset])
             
             cursor.execute(query, params)
             logs = cursor.fetchall()
@@ -796,62 +1514,83 @@ class SQLDatabaseManager:
             conn.close()
     
     def record_traffic(self, endpoint, method, ip_address=None, user_id=None, response_status=200, response_time=0):
-        """记录访问流量"""
+        """记录一条访问流量（请求处理中应使用traffic_buffer批量写入）"""
+        now = time.time()
+        local = time.localtime(now)
+        self.record_traffic_batch([(time.strftime('%Y-%m-%d', local), local.tm_hour, endpoint or '', method, ip_address,
+                                    user_id, response_status, response_time, int(now))])
+    
+    def record_traffic_batch(self, rows):
+        """批量写入访问流量并增量更新每日汇总
+        
+        rows中每一项为 (date, hour, endpoint, method, ip_address, user_id, response_status, response_time, created_at)。
+        每日汇总按批次累加请求数、错误数和总响应时间，独立访客数由HyperLogLog草图合并后估计；
+        分钟/小时/天粒度的端点汇总（含响应时间直方图）以计数器累加的方式写入traffic_rollups。
+        """
+        if not rows:
+            return 0
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            current_time = int(time.time())
-            date_str = time.strftime('%Y-%m-%d')
-            hour = int(time.strftime('%H'))
-            
-            cursor.execute('''
+            cursor.executemany('''
             INSERT INTO traffic_stats (date, hour, endpoint, method, ip_address, user_id, response_status, response_time, created_at)
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ''', (date_str, hour, endpoint, method, ip_address, user_id, response_status, response_time, current_time))
-            conn.commit()
-            
-            self._update_daily_traffic_summary(date_str)
-            
-            return cursor.lastrowid
-        except Exception as e:
-            raise Exception(f'记录访问流量失败: {str(e)}')
-        finally:
-            conn.close()
-    
-    def _update_daily_traffic_summary(self, date_str):
-        """更新每日流量汇总"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-            SELECT 
-                COUNT(*) as total_requests,
-                COUNT(DISTINCT ip_address) as unique_visitors,
-                AVG(response_time) as avg_response_time,
-                SUM(CASE WHEN response_status >= 400 THEN 1 ELSE 0 END) as error_count
-            FROM traffic_stats
-            WHERE date = %s
-            ''', (date_str,))
-            
-            result = cursor.fetchone()
-            current_time = int(time.time())
+            ''', rows)
             
-            cursor.execute('''
-            INSERT INTO daily_traffic_summary (date, total_requests, unique_visitors, avg_response_time, error_count, created_at, updated_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            histogram_columns = ', '.join(HISTOGRAM_COLUMNS)
+            cursor.executemany(f'''
+            INSERT INTO traffic_rollups (granularity, bucket_start, endpoint, method, response_status,
+                request_count, error_count, total_response_time, {histogram_columns})
+            VALUES ({', '.join(['%s'] * (8 + len(HISTOGRAM_COLUMNS)))})
             ON DUPLICATE KEY UPDATE
-                total_requests = VALUES(total_requests),
-                unique_visitors = VALUES(unique_visitors),
-                avg_response_time = VALUES(avg_response_time),
-                error_count = VALUES(error_count),
-                updated_at = VALUES(updated_at)
-            ''', (date_str, result['total_requests'], result['unique_visitors'], result['avg_response_time'], result['error_count'], current_time, current_time))
+                request_count = request_count + VALUES(request_count),
+                error_count = error_count + VALUES(error_count),
+                total_response_time = total_response_time + VALUES(total_response_time),
+                {', '.join(f'{c} = {c} + VALUES({c})' for c in HISTOGRAM_COLUMNS)}
+            ''', rollup_rows(rows))
+            
+            daily = {}
+            for date, _, _, _, ip_address, _, response_status, response_time, _ in rows:
+                summary = daily.setdefault(date, {'requests': 0, 'errors': 0, 'response_time': 0.0, 'visitors': HyperLogLog()})
+                summary['requests'] += 1
+                summary['errors'] += response_status >= 400
+                summary['response_time'] += response_time or 0
+                if ip_address:
+                    summary['visitors'].add(ip_address)
+            
+            now = int(time.time())
+            for date, summary in sorted(daily.items()):
+                # 先确保汇总行存在再加行锁，多个进程同时写入同一天时依次合并草图
+                cursor.execute(
+                    "INSERT IGNORE INTO daily_traffic_summary (date, created_at, updated_at) VALUES (%s, %s, %s)",
+                    (date, now, now)
+                )
+                cursor.execute(
+                    "SELECT visitor_sketch FROM daily_traffic_summary WHERE date = %s FOR UPDATE",
+                    (date,)
+                )
+                row = cursor.fetchone()
+                visitors = HyperLogLog(registers=row['visitor_sketch'] if row else None)
+                visitors.merge(summary['visitors'])
+                cursor.execute('''
+                UPDATE daily_traffic_summary SET
+                    total_requests = total_requests + %s,
+                    error_count = error_count + %s,
+                    total_response_time = total_response_time + %s,
+                    avg_response_time = total_response_time / total_requests,
+                    unique_visitors = %s,
+                    visitor_sketch = %s,
+                    updated_at = %s
+                WHERE date = %s
+                ''', (summary['requests'], summary['errors'], summary['response_time'],
+                      visitors.count(), visitors.to_bytes(), now, date))
             
             conn.commit()
+            return len(rows)
         except Exception as e:
-            print(f'更新每日流量汇总失败: {str(e)}')
+            conn.rollback()
+            raise Exception(f'记录访问流量失败: {str(e)}')
         finally:
             conn.close()
     
@@ -861,7 +1600,10 @@ class SQLDatabaseManager:
         cursor = conn.cursor()
         
         try:
-            query = 'SELECT * FROM daily_traffic_summary WHERE 1=1'
+            query = '''
+            SELECT id, date, total_requests, unique_visitors, avg_response_time, error_count, created_at, updated_at
+            FROM daily_traffic_summary WHERE 1=1
+            '''
             params = []
             
             if start_date:
@@ -883,39 +1625,102 @@ class SQLDatabaseManager:
             conn.close()
     
     def get_traffic_by_endpoint(self, start_date=None, end_date=None, limit=20):
-        """按端点获取流量统计"""
+        """按端点获取流量统计（读取按天汇总的数据），包含p50/p95/p99响应时间"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            query = '''
-            SELECT endpoint, method, 
-                   COUNT(*) as request_count,
-                   AVG(response_time) as avg_response_time,
-                   SUM(CASE WHEN response_status >= 400 THEN 1 ELSE 0 END) as error_count
-            FROM traffic_stats
-            WHERE 1=1
-            '''
+            histogram_sums = ', '.join(f'SUM({c}) as {c}' for c in HISTOGRAM_COLUMNS)
+            query = queries.TRAFFIC_BY_ENDPOINT_SELECT.format(histogram_sums=histogram_sums)
             params = []
             
             if start_date:
-                query += ' AND date >= %s'
-                params.append(start_date)
+                query += ' AND bucket_start >= %s'
+                params.append(date_to_timestamp(start_date))
             if end_date:
-                query += ' AND date <= %s'
-                params.append(end_date)
+                query += ' AND bucket_start <= %s'
+                params.append(date_to_timestamp(end_date))
             
-            query += ' GROUP BY endpoint, method ORDER BY request_count DESC LIMIT %s'
+            query += queries.TRAFFIC_BY_ENDPOINT_GROUP
             params.append(limit)
             
             cursor.execute(query, params)
-            stats = cursor.fetchall()
-            return [dict(stat) for stat in stats]
+            return [summarize(dict(stat)) for stat in cursor.fetchall()]
         except Exception as e:
             raise Exception(f'获取端点流量统计失败: {str(e)}')
         finally:
             conn.close()
     
+    def get_traffic_timeseries(self, granularity='hour', start_time=None, end_time=None, endpoint=None, method=None):
+        """按时间段获取流量趋势（请求数、错误数、平均和p50/p95/p99响应时间）"""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f'不支持的汇总粒度: {granularity}')
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            histogram_sums = ', '.join(f'SUM({c}) as {c}' for c in HISTOGRAM_COLUMNS)
+            query = f'''
+            SELECT bucket_start,
+                   SUM(request_count) as request_count,
+                   SUM(total_response_time) as total_response_time,
+                   SUM(error_count) as error_count,
+                   {histogram_sums}
+            FROM traffic_rollups
+            WHERE granularity = %s AND bucket_start >= %s AND bucket_start <= %s
+            '''
+            end_time = end_time or int(time.time())
+            start_time = start_time or end_time - 100 * GRANULARITIES[granularity]
+            params = [granularity, start_time, end_time]
+            
+            if endpoint:
+                query += ' AND endpoint = %s'
+                params.append(endpoint)
+            if method:
+                query += ' AND method = %s'
+                params.append(method)
+            
+            query += ' GROUP BY bucket_start ORDER BY bucket_start'
+            
+            cursor.execute(query, params)
+            return [summarize(dict(row)) for row in cursor.fetchall()]
+        except Exception as e:
+            raise Exception(f'获取流量趋势失败: {str(e)}')
+        finally:
+            conn.close()
+    
+    def prune_traffic_data(self, raw_retention_days=7, minute_retention_days=2, hour_retention_days=90, chunk_size=5000):
+        """删除超过保留期的原始访问记录和细粒度汇总（按天汇总永久保留），返回各表删除的行数
+        
+        分批删除，每批单独提交，避免长时间锁表。
+        """
+        now = int(time.time())
+        targets = [
+            ('traffic_stats', 'created_at < %s', (now - raw_retention_days * 86400,)),
+            ('traffic_rollups', "granularity = 'minute' AND bucket_start < %s", (now - minute_retention_days * 86400,)),
+            ('traffic_rollups', "granularity = 'hour' AND bucket_start < %s", (now - hour_retention_days * 86400,)),
+        ]
+        deleted = {}
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            for table, condition, params in targets:
+                total = 0
+                while True:
+                    cursor.execute(queries.PRUNE_CHUNK.format(table=table, condition=condition), params + (chunk_size,))
+                    conn.commit()
+                    total += cursor.rowcount
+                    if cursor.rowcount < chunk_size:
+                        break
+                deleted[table] = deleted.get(table, 0) + total
+            return deleted
+        except Exception as e:
+            conn.rollback()
+            raise Exception(f'清理流量数据失败: {str(e)}')
+        finally:
+            conn.close()
+    
     def record_server_status(self, metric_name, metric_value, unit=None, status='normal'):
         """记录服务器状态"""
         conn = self.get_connection()
@@ -1061,8 +1866,11 @@ class SQLDatabaseManager:
             
             cursor.execute('DELETE FROM user_roles WHERE user_id = %s', (user_id,))
             cursor.execute('INSERT INTO user_roles (user_id, role_id) VALUES (%s, %s)', (user_id, role_id))
+            # 与角色变更在同一事务中递增版本号，其他worker进程据此清空权限缓存
+            cursor.execute('UPDATE permission_version SET version = version + 1 WHERE id = 1')
             
             conn.commit()
+            self.invalidate_user_access(user_id)
             return True
         except Exception as e:
             conn.rollback()
@@ -1138,15 +1946,16 @@ class SQLDatabaseManager:
         finally:
             conn.close()
     
-    def get_user_recognition_history(self, user_id, limit=20, offset=0):
-        """获取用户历史识别记录（排除已删除的）"""
+    def get_user_recognition_history(self, user_id, limit=20, offset=0, page_cursor=None):
+        """获取用户历史识别记录（排除已删除的），传入page_cursor时从游标位置继续，忽略offset"""
+        keyset, keyset_params = keyset_condition(page_cursor)
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
             cursor.execute(
-                "SELECT * FROM recognition_results WHERE user_id = %s AND deleted_at IS NULL ORDER BY created_at DESC LIMIT %s OFFSET %s",
-                (user_id, limit, offset)
+                queries.RECOGNITION_HISTORY_PAGE.format(keyset=keyset),
+                (user_id, *keyset_params, limit, 0 if page_cursor else offset)
             )
             results = cursor.fetchall()
             
@@ -1207,15 +2016,9 @@ class SQLDatabaseManager:
         
         try:
             if category:
-                cursor.execute(
-                    "SELECT * FROM albums WHERE user_id = %s AND category = %s ORDER BY created_at DESC",
-                    (user_id, category)
-                )
+                cursor.execute(queries.USER_ALBUMS_BY_CATEGORY, (user_id, category))
             else:
-                cursor.execute(
-                    "SELECT * FROM albums WHERE user_id = %s ORDER BY created_at DESC",
-                    (user_id,)
-                )
+                cursor.execute(queries.USER_ALBUMS, (user_id,))
             return cursor.fetchall()
         except Exception as e:
             raise Exception(f'获取相册列表失败: {str(e)}')
@@ -1277,29 +2080,44 @@ class SQLDatabaseManager:
         cursor = conn.cursor()
         
         try:
+            # 相册中的图片随相册级联删除，需要先记下它们引用的图片文件
+            cursor.execute(
+                "SELECT ai.blob_hash FROM album_images ai JOIN albums a ON ai.album_id = a.id WHERE a.id = %s AND a.user_id = %s AND ai.blob_hash IS NOT NULL",
+                (album_id, user_id)
+            )
+            blob_hashes = [row['blob_hash'] for row in cursor.fetchall()]
+            
             cursor.execute(
                 "DELETE FROM albums WHERE id = %s AND user_id = %s",
                 (album_id, user_id)
             )
+            deleted = cursor.rowcount > 0
+            if deleted:
+                for blob_hash in blob_hashes:
+                    self._release_blob(conn, cursor, blob_hash)
             conn.commit()
-            return cursor.rowcount > 0
+            return deleted
         except Exception as e:
             conn.rollback()
             raise Exception(f'删除相册失败: {str(e)}')
         finally:
             conn.close()
     
-    def add_image_to_album(self, album_id, user_id, image_path, flower_name=None, confidence=None, recognition_result_id=None):
-        """添加图片到相册"""
+    def add_image_to_album(self, album_id, user_id, image_path, flower_name=None, confidence=None, recognition_result_id=None,
+                           blob_hash=None, blob_size=None):
+        """添加图片到相册，blob_hash不为空时登记对图片文件的引用（blob_size为空表示引用已存在的文件）"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
             now = int(time.time())
             cursor.execute(
-                "INSERT INTO album_images (album_id, recognition_result_id, image_path, flower_name, confidence, created_at) VALUES (%s, %s, %s, %s, %s, %s)",
-                (album_id, recognition_result_id, image_path, flower_name, confidence, now)
+                "INSERT INTO album_images (album_id, user_id, recognition_result_id, image_path, blob_hash, image_name, flower_name, confidence, created_at) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                (album_id, user_id, recognition_result_id, image_path, blob_hash, os.path.basename(image_path), flower_name, confidence, now)
             )
+            image_id = cursor.lastrowid
+            if blob_hash:
+                self._acquire_blob(cursor, blob_hash, image_path if blob_size is not None else None, blob_size)
             
             cursor.execute(
                 "UPDATE albums SET image_count = image_count + 1, updated_at = %s WHERE id = %s",
@@ -1307,22 +2125,47 @@ class SQLDatabaseManager:
             )
             
             conn.commit()
-            return cursor.lastrowid
+            return image_id
         except Exception as e:
             conn.rollback()
             raise Exception(f'添加图片到相册失败: {str(e)}')
         finally:
             conn.close()
     
-    def get_album_images(self, album_id, user_id, limit=50, offset=0):
-        """获取相册中的图片（排除已删除的）"""
+    def update_image_derivatives(self, thumbnail_path, medium_path, album_image_id=None, recognition_result_id=None):
+        """记录相册图片和识别记录的衍生图（缩略图、中等尺寸图）路径"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            if album_image_id:
+                cursor.execute(
+                    "UPDATE album_images SET thumbnail_path = %s, medium_path = %s WHERE id = %s",
+                    (thumbnail_path, medium_path, album_image_id)
+                )
+            if recognition_result_id:
+                cursor.execute(
+                    "UPDATE recognition_results SET thumbnail_path = %s, medium_path = %s WHERE id = %s",
+                    (thumbnail_path, medium_path, recognition_result_id)
+                )
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            raise Exception(f'更新衍生图路径失败: {str(e)}')
+        finally:
+            conn.close()
+    
+    def get_album_images(self, album_id, user_id, limit=50, offset=0, page_cursor=None):
+        """获取相册中的图片（排除已删除的），传入page_cursor时从游标位置继续，忽略offset"""
+        keyset, keyset_params = keyset_condition(page_cursor)
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
             cursor.execute(
-                "SELECT * FROM album_images WHERE album_id = %s AND deleted_at IS NULL ORDER BY created_at DESC LIMIT %s OFFSET %s",
-                (album_id, limit, offset)
+                queries.ALBUM_IMAGES_PAGE.format(keyset=keyset),
+                (album_id, *keyset_params, limit, 0 if page_cursor else offset)
             )
             images = cursor.fetchall()
             
@@ -1400,15 +2243,16 @@ class SQLDatabaseManager:
         finally:
             conn.close()
     
-    def get_user_feedback(self, user_id, limit=20, offset=0):
-        """获取用户反馈列表"""
+    def get_user_feedback(self, user_id, limit=20, offset=0, page_cursor=None):
+        """获取用户反馈列表，传入page_cursor时从游标位置继续，忽略offset"""
+        keyset, keyset_params = keyset_condition(page_cursor)
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
             cursor.execute(
-                "SELECT * FROM user_feedback WHERE user_id = %s ORDER BY created_at DESC LIMIT %s OFFSET %s",
-                (user_id, limit, offset)
+                queries.USER_FEEDBACK_PAGE.format(keyset=keyset),
+                (user_id, *keyset_params, limit, 0 if page_cursor else offset)
             )
             results = cursor.fetchall()
             
@@ -1608,22 +2452,24 @@ class SQLDatabaseManager:
         finally:
             conn.close()
     
-    def get_recycle_bin_items(self, user_id, item_type=None, limit=50, offset=0):
-        """获取回收站项目列表"""
+    def get_recycle_bin_items(self, user_id, item_type=None, limit=50, offset=0, page_cursor=None):
+        """获取回收站项目列表，按 (deleted_at, id) 的游标分页，传入page_cursor时忽略offset"""
+        keyset, keyset_params = keyset_condition(page_cursor, 'deleted_at')
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
             import json
+            offset = 0 if page_cursor else offset
             if item_type:
                 cursor.execute(
-                    "SELECT * FROM recycle_bin WHERE user_id = %s AND item_type = %s ORDER BY deleted_at DESC LIMIT %s OFFSET %s",
-                    (user_id, item_type, limit, offset)
+                    queries.RECYCLE_BIN_PAGE_BY_TYPE.format(keyset=keyset),
+                    (user_id, item_type, *keyset_params, limit, offset)
                 )
             else:
                 cursor.execute(
-                    "SELECT * FROM recycle_bin WHERE user_id = %s ORDER BY deleted_at DESC LIMIT %s OFFSET %s",
-                    (user_id, limit, offset)
+                    queries.RECYCLE_BIN_PAGE.format(keyset=keyset),
+                    (user_id, *keyset_params, limit, offset)
                 )
             results = cursor.fetchall()
             
@@ -1707,14 +2553,7 @@ class SQLDatabaseManager:
                 return False, "回收站项目不存在"
             
             item_type = item['item_type']
-            original_id = item['original_id']
-            
-            if item_type == 'post':
-                cursor.execute("DELETE FROM posts WHERE id = %s", (original_id,))
-            elif item_type == 'image':
-                cursor.execute("DELETE FROM album_images WHERE id = %s", (original_id,))
-            elif item_type == 'recognition':
-                cursor.execute("DELETE FROM recognition_results WHERE id = %s", (original_id,))
+            self._delete_item(conn, cursor, item_type, item['original_id'])
             
             cursor.execute(
                 "DELETE FROM recycle_bin WHERE id = %s",
@@ -1742,15 +2581,7 @@ class SQLDatabaseManager:
             items = cursor.fetchall()
             
             for item in items:
-                item_type = item['item_type']
-                original_id = item['original_id']
-                
-                if item_type == 'post':
-                    cursor.execute("DELETE FROM posts WHERE id = %s", (original_id,))
-                elif item_type == 'image':
-                    cursor.execute("DELETE FROM album_images WHERE id = %s", (original_id,))
-                elif item_type == 'recognition':
-                    cursor.execute("DELETE FROM recognition_results WHERE id = %s", (original_id,))
+                self._delete_item(conn, cursor, item['item_type'], item['original_id'])
             
             cursor.execute("DELETE FROM recycle_bin WHERE user_id = %s", (user_id,))
             
@@ -1787,8 +2618,44 @@ def get_user_permissions(user_id):
 def check_user_permission(user_id, permission_name):
     return db_manager.check_user_permission(user_id, permission_name)
 
-def save_recognition_result(user_id, image_path, result, confidence):
-    return db_manager.save_recognition_result(user_id, image_path, result, confidence)
+def get_user_access(user_id):
+    return db_manager.get_user_access(user_id)
+
+def get_permission_cache_stats():
+    return db_manager.permission_cache.get_stats()
+
+def save_recognition_result(user_id, image_path, result, confidence, blob_hash=None, blob_size=None):
+    return db_manager.save_recognition_result(user_id, image_path, result, confidence, blob_hash, blob_size)
+
+def begin_db_session():
+    return db_manager.begin_session()
+
+def end_db_session(token, commit=True):
+    return db_manager.end_session(token, commit)
+
+def db_session():
+    return db_manager.session()
+
+def after_db_commit(callback):
+    db_manager._after_commit(callback)
+
+def get_schema_version():
+    return db_manager.get_schema_version()
+
+def check_query_plans():
+    return db_manager.check_query_plans()
+
+def run_exclusive(lock_name, fn, *args, min_interval=None, **kwargs):
+    return db_manager.run_exclusive(lock_name, fn, *args, min_interval=min_interval, **kwargs)
+
+def get_db_pool_stats():
+    return db_manager.get_pool_stats()
+
+def set_blob_release_handler(handler):
+    db_manager.blob_release_handler = handler
+
+def get_blob_stats():
+    return db_manager.get_blob_stats()
 
 def get_user_recognition_results(user_id):
     return db_manager.get_user_recognition_results(user_id)
@@ -1797,8 +2664,17 @@ def get_user_recognition_results(user_id):
 def create_post(user_id, content, image_url=None):
     return db_manager.create_post(user_id, content, image_url)
 
-def get_posts(limit=20, offset=0):
-    return db_manager.get_posts(limit, offset)
+def get_posts(limit=20, offset=0, page_cursor=None):
+    return db_manager.get_posts(limit, offset, page_cursor)
+
+def get_feed(viewer_id=None, limit=20, offset=0, page_cursor=None, comments_per_post=3):
+    return db_manager.get_feed(viewer_id, limit, offset, page_cursor, comments_per_post)
+
+def get_home_timeline(user_id, limit=20, offset=0, page_cursor=None, comments_per_post=3):
+    return db_manager.get_home_timeline(user_id, limit, offset, page_cursor, comments_per_post)
+
+def rebuild_home_timelines(user_id=None, per_author=None):
+    return db_manager.rebuild_home_timelines(user_id, per_author)
 
 def get_post_by_id(post_id):
     return db_manager.get_post_by_id(post_id)
@@ -1851,15 +2727,24 @@ def test_connection():
 def create_system_log(log_level, module, message, user_id=None, username=None, ip_address=None, user_agent=None):
     return db_manager.create_system_log(log_level, module, message, user_id, username, ip_address, user_agent)
 
-def get_system_logs(limit=100, offset=0, log_level=None, module=None, start_time=None, end_time=None):
-    return db_manager.get_system_logs(limit, offset, log_level, module, start_time, end_time)
+def get_system_logs(limit=100, offset=0, log_level=None, module=None, start_time=None, end_time=None, page_cursor=None):
+    return db_manager.get_system_logs(limit, offset, log_level, module, start_time, end_time, page_cursor)
 
 def record_traffic(endpoint, method, ip_address=None, user_id=None, response_status=200, response_time=0):
     return db_manager.record_traffic(endpoint, method, ip_address, user_id, response_status, response_time)
 
+def record_traffic_batch(rows):
+    return db_manager.record_traffic_batch(rows)
+
 def get_traffic_stats(start_date=None, end_date=None, limit=100):
     return db_manager.get_traffic_stats(start_date, end_date, limit)
 
+def get_traffic_timeseries(granularity='hour', start_time=None, end_time=None, endpoint=None, method=None):
+    return db_manager.get_traffic_timeseries(granularity, start_time, end_time, endpoint, method)
+
+def prune_traffic_data(raw_retention_days=7, minute_retention_days=2, hour_retention_days=90):
+    return db_manager.prune_traffic_data(raw_retention_days, minute_retention_days, hour_retention_days)
+
 def get_traffic_by_endpoint(start_date=None, end_date=None, limit=20):
     return db_manager.get_traffic_by_endpoint(start_date, end_date, limit)
 
@@ -1890,8 +2775,8 @@ def get_system_summary():
 def update_user_profile(user_id, email=None, password_hash=None):
     return db_manager.update_user_profile(user_id, email, password_hash)
 
-def get_user_recognition_history(user_id, limit=20, offset=0):
-    return db_manager.get_user_recognition_history(user_id, limit, offset)
+def get_user_recognition_history(user_id, limit=20, offset=0, page_cursor=None):
+    return db_manager.get_user_recognition_history(user_id, limit, offset, page_cursor)
 
 def delete_recognition_result(result_id, user_id):
     return db_manager.delete_recognition_result(result_id, user_id)
@@ -1911,11 +2796,16 @@ def update_album(album_id, user_id, name=None, description=None):
 def delete_album(album_id, user_id):
     return db_manager.delete_album(album_id, user_id)
 
-def add_image_to_album(album_id, user_id, image_path, flower_name=None, confidence=None, recognition_result_id=None):
-    return db_manager.add_image_to_album(album_id, user_id, image_path, flower_name, confidence, recognition_result_id)
+def add_image_to_album(album_id, user_id, image_path, flower_name=None, confidence=None, recognition_result_id=None,
+                       blob_hash=None, blob_size=None):
+    return db_manager.add_image_to_album(album_id, user_id, image_path, flower_name, confidence, recognition_result_id,
+                                         blob_hash, blob_size)
+
+def update_image_derivatives(thumbnail_path, medium_path, album_image_id=None, recognition_result_id=None):
+    return db_manager.update_image_derivatives(thumbnail_path, medium_path, album_image_id, recognition_result_id)
 
-def get_album_images(album_id, user_id, limit=50, offset=0):
-    return db_manager.get_album_images(album_id, user_id, limit, offset)
+def get_album_images(album_id, user_id, limit=50, offset=0, page_cursor=None):
+    return db_manager.get_album_images(album_id, user_id, limit, offset, page_cursor)
 
 def delete_album_image(image_id, album_id, user_id):
     return db_manager.delete_album_image(image_id, album_id, user_id)
@@ -1926,8 +2816,8 @@ def get_album_categories(user_id):
 def create_feedback(user_id, title, content, feedback_type):
     return db_manager.create_feedback(user_id, title, content, feedback_type)
 
-def get_user_feedback(user_id, limit=20, offset=0):
-    return db_manager.get_user_feedback(user_id, limit, offset)
+def get_user_feedback(user_id, limit=20, offset=0, page_cursor=None):
+    return db_manager.get_user_feedback(user_id, limit, offset, page_cursor)
 
 def get_feedback_by_id(feedback_id, user_id):
     return db_manager.get_feedback_by_id(feedback_id, user_id)
@@ -1956,8 +2846,8 @@ def delete_announcement(announcement_id, admin_id):
 def move_to_recycle_bin(user_id, item_type, original_id, item_data=None):
     return db_manager.move_to_recycle_bin(user_id, item_type, original_id, item_data)
 
-def get_recycle_bin_items(user_id, item_type=None, limit=50, offset=0):
-    return db_manager.get_recycle_bin_items(user_id, item_type, limit, offset)
+def get_recycle_bin_items(user_id, item_type=None, limit=50, offset=0, page_cursor=None):
+    return db_manager.get_recycle_bin_items(user_id, item_type, limit, offset, page_cursor)
 
 def restore_from_recycle_bin(user_id, recycle_id):
     return db_manager.restore_from_recycle_bin(user_id, recycle_id)
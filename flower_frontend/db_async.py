@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+异步数据库访问
+
+ASGI模式下的接口通过aiomysql连接池访问MySQL，等待数据库时不占用线程。
+SQL语句与db.py中对应的同步方法保持一致（高频查询共用queries.py中的语句），返回结果格式相同。
+"""
+import asyncio
+
+import aiomysql
+
+import queries
+from db import DB_CONFIG
+from pagination import keyset_condition
+
+
+class AsyncDatabase:
+    """基于aiomysql连接池的异步数据库访问"""
+
+    def __init__(self, db_config=DB_CONFIG, minsize=1, maxsize=10):
+        self.db_config = db_config
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self._pool = None
+        self._pool_lock = None
+
+    async def _get_pool(self):
+        """在当前事件循环中按需创建连接池"""
+        if self._pool is None:
+            if self._pool_lock is None:
+                self._pool_lock = asyncio.Lock()
+            async with self._pool_lock:
+                if self._pool is None:
+                    self._pool = await aiomysql.create_pool(
+                        host=self.db_config['host'],
+                        port=self.db_config.get('port', 3306),
+                        user=self.db_config['user'],
+                        password=self.db_config['password'],
+                        db=self.db_config['database'],
+                        charset=self.db_config.get('charset', 'utf8mb4'),
+                        cursorclass=aiomysql.DictCursor,
+                        autocommit=True,
+                        minsize=self.minsize,
+                        maxsize=self.maxsize
+                    )
+        return self._pool
+
+    async def fetchall(self, sql, params=()):
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql, params)
+                return [dict(row) for row in await cursor.fetchall()]
+
+    async def fetchone(self, sql, params=()):
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql, params)
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    async def get_posts(self, limit=20, offset=0, page_cursor=None):
+        """获取帖子列表（排除已删除的），传入page_cursor时从游标位置继续，忽略offset"""
+        keyset, keyset_params = keyset_condition(page_cursor, 'p.created_at', 'p.id')
+        try:
+            return await self.fetchall(queries.POSTS_PAGE.format(keyset=keyset),
+                                       (*keyset_params, limit, 0 if page_cursor else offset))
+        except Exception as e:
+            raise Exception(f'获取帖子列表失败: {str(e)}')
+
+    async def get_post_by_id(self, post_id):
+        """获取单个帖子详情"""
+        try:
+            return await self.fetchone('''
+            SELECT p.*, u.username FROM posts p
+            JOIN users u ON p.user_id = u.id
+            WHERE p.id = %s
+            ''', (post_id,))
+        except Exception as e:
+            raise Exception(f'获取帖子详情失败: {str(e)}')
+
+    async def get_comments_by_post_id(self, post_id):
+        """获取帖子的评论列表"""
+        try:
+            return await self.fetchall('''
+            SELECT c.*, u.username FROM comments c
+            JOIN users u ON c.user_id = u.id
+            WHERE c.post_id = %s
+            ORDER BY c.created_at ASC
+            ''', (post_id,))
+        except Exception as e:
+            raise Exception(f'获取评论列表失败: {str(e)}')
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+MySQL连接池
+
+db.py中的方法仍按"get_connection() ... finally: conn.close()"的方式使用连接，
+get_connection()从连接池取出连接，close()时归还连接池而不是断开，
+不再为每次查询重新建立TCP连接和认证。
+
+- 连接数在 [min_size, max_size] 之间，连接全部被占用时最多等待timeout秒；
+- 取出空闲超过health_check_interval秒的连接时先ping检查，失效则重新连接；
+- 连接使用超过max_lifetime秒后关闭重建，避免被MySQL的wait_timeout断开；
+- 归还时回滚未提交的事务，下一个使用者不会读到旧的事务快照；
+- 连接池按进程创建，fork出的子进程（如gunicorn preload_app）中会重新建立连接。
+"""
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """等待可用连接超时"""
+
+
+class _PoolEntry:
+    __slots__ = ('conn', 'created_at', 'last_used', 'pid')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = self.last_used = time.time()
+        self.pid = os.getpid()  # 建立连接的进程
+
+
+class PooledConnection:
+    """从连接池取出的连接，close()时归还连接池"""
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+        self._after_commit = []
+
+    def after_commit(self, callback):
+        """本连接下一次commit()成功后调用callback，rollback()或归还连接时丢弃"""
+        self._after_commit.append(callback)
+
+    def commit(self):
+        self._entry.conn.commit()
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"事务提交后的回调执行失败: {e}")
+
+    def rollback(self):
+        self._after_commit = []
+        self._entry.conn.rollback()
+
+    def __getattr__(self, name):
+        entry = self.__dict__.get('_entry')
+        if entry is None:
+            raise AttributeError(f'连接已归还连接池，无法访问 {name}')
+        return getattr(entry.conn, name)
+
+    def close(self):
+        self._after_commit = []
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool.release(entry)
+
+    def __del__(self):
+        # 调用方忘记close时也归还连接，避免连接池计数泄漏
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """线程安全的数据库连接池，connect为创建新连接的函数"""
+
+    def __init__(self, connect, min_size=1, max_size=10, max_lifetime=3600, health_check_interval=30, timeout=10):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        """初始化当前进程的连接池状态（需持有锁或在构造时调用）"""
+        self._pid = os.getpid()
+        self._idle = []  # 后进先出，优先使用刚归还的连接
+        self._size = 0  # 已建立的连接数（空闲 + 使用中 + 正在建立）
+        self._in_use = 0
+        self._filled = False
+        self._stats = {
+            'created': 0, 'reused': 0, 'closed': 0, 'expired': 0, 'health_check_failures': 0,
+            'connect_errors': 0, 'waits': 0, 'wait_ms': 0.0, 'timeouts': 0, 'max_in_use': 0
+        }
+
+    def _check_pid(self):
+        """fork出的子进程不能复用父进程的连接，直接丢弃（需持有锁）"""
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _open(self):
+        try:
+            entry = _PoolEntry(self.connect())
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._stats['connect_errors'] += 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['created'] += 1
+        return entry
+
+    def _close(self, entry):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats['closed'] += 1
+
+    def _expired(self, entry, now):
+        return self.max_lifetime and now - entry.created_at > self.max_lifetime
+
+    def _fill(self):
+        """每个进程首次使用时预先建立min_size个连接（失败时不影响取连接）"""
+        with self._cond:
+            if self._filled:
+                return
+            self._filled = True
+            count = max(0, min(self.min_size, self.max_size) - self._size)
+            self._size += count
+        for _ in range(count):
+            try:
+                entry = self._open()
+            except Exception as e:
+                print(f"预建立数据库连接失败: {e}")
+                return
+            with self._cond:
+                self._idle.append(entry)
+                self._cond.notify()
+
+    def acquire(self):
+        """取出一个连接，返回PooledConnection"""
+        with self._cond:
+            self._check_pid()
+            filled = self._filled
+        if not filled:
+            self._fill()
+
+        deadline = None
+        entry = None
+        with self._cond:
+            while True:
+                self._check_pid()
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1  # 先占位，在锁外建立连接
+                    break
+                now = time.time()
+                if deadline is None:
+                    deadline = now + self.timeout
+                    self._stats['waits'] += 1
+                if now >= deadline:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f'等待数据库连接超时（连接池上限 {self.max_size}）')
+                started = now
+                self._cond.wait(deadline - now)
+                self._stats['wait_ms'] += (time.time() - started) * 1000
+            self._in_use += 1
+            self._stats['max_in_use'] = max(self._stats['max_in_use'], self._in_use)
+
+        try:
+            entry = self._validate(entry) if entry is not None else self._open()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+            raise
+        return PooledConnection(self, entry)
+
+    def _validate(self, entry):
+        """检查空闲连接是否可用，过期或失效时替换为新连接"""
+        now = time.time()
+        if self._expired(entry, now):
+            with self._cond:
+                self._stats['expired'] += 1
+            self._close(entry)
+            return self._open()
+        if now - entry.last_used > self.health_check_interval:
+            try:
+                entry.conn.ping(reconnect=False)
+            except Exception:
+                with self._cond:
+                    self._stats['health_check_failures'] += 1
+                self._close(entry)
+                return self._open()
+        with self._cond:
+            self._stats['reused'] += 1
+        return entry
+
+    def release(self, entry):
+        """归还连接：回滚未提交的事务，失效或过期的连接直接关闭"""
+        if entry.pid != os.getpid() or self._pid != entry.pid:
+            return  # 父进程的连接，不在子进程中使用，也不计入当前进程的连接池
+        keep = True
+        try:
+            entry.conn.rollback()
+        except Exception:
+            keep = False
+        now = time.time()
+        if keep and self._expired(entry, now):
+            keep = False
+            with self._cond:
+                self._stats['expired'] += 1
+
+        with self._cond:
+            self._in_use -= 1
+            if keep:
+                entry.last_used = now
+                self._idle.append(entry)
+            else:
+                self._size -= 1
+            self._cond.notify()
+        if not keep:
+            self._close(entry)
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        with self._cond:
+            self._check_pid()
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._filled = False
+        for entry in idle:
+            self._close(entry)
+
+    def get_stats(self):
+        with self._cond:
+            self._check_pid()
+            return dict(
+                self._stats,
+                wait_ms=round(self._stats['wait_ms'], 2),
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._in_use,
+                min_size=self.min_size,
+                max_size=self.max_size
+            )
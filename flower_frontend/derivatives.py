@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+相册图片衍生图生成
+
+保存到相册时只写入原图，缩略图（thumb）和中等尺寸图（medium）在后台线程池中生成，
+生成完成后通过回调把衍生图路径写回数据库。相册和历史记录列表返回衍生图URL，
+衍生图尚未生成时回退到原图。
+"""
+import io
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, features
+
+# 衍生图名称 -> 最长边像素
+DEFAULT_SIZES = {'thumb': 256, 'medium': 1024}
+
+FORMAT_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+def resolve_format(fmt):
+    """返回实际使用的输出格式，Pillow未编译WebP支持时回退为JPEG"""
+    fmt = fmt.upper()
+    if fmt == 'JPG':
+        fmt = 'JPEG'
+    if fmt not in FORMAT_EXTENSIONS:
+        raise ValueError(f'不支持的衍生图格式: {fmt}')
+    if fmt == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return fmt
+
+
+def render_derivatives(image_bytes, sizes, fmt='WEBP', quality=80):
+    """按sizes生成各尺寸的衍生图，返回 {名称: 编码后的字节}
+
+    从大到小依次缩放，小图在上一级缩放结果的基础上生成，只完整解码一次原图。
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    largest = max(sizes.values())
+    img.draft('RGB', (largest, largest))  # JPEG按1/2、1/4、1/8比例解码，减少大图的解码开销
+    img = ImageOps.exif_transpose(img)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    if fmt == 'WEBP':
+        save_options = {'quality': quality, 'method': 4}
+    else:
+        save_options = {'quality': quality, 'optimize': True, 'progressive': True}
+
+    outputs = {}
+    for name, max_side in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+        img.thumbnail((max_side, max_side), Image.LANCZOS)  # 只缩小不放大
+        buf = io.BytesIO()
+        img.save(buf, format=fmt, **save_options)
+        outputs[name] = buf.getvalue()
+    return outputs
+
+
+class DerivativeGenerator:
+    """在后台线程池中生成衍生图"""
+
+    def __init__(self, output_dir, url_prefix, sizes=None, fmt='webp', quality=80, max_workers=2):
+        self.output_dir = output_dir
+        self.url_prefix = url_prefix.rstrip('/')
+        self.sizes = dict(sizes or DEFAULT_SIZES)
+        self.format = resolve_format(fmt)
+        self.quality = quality
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'generated': 0, 'reused': 0, 'failed': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    def _get_executor(self):
+        """按需创建线程池（fork出的子进程中会重新创建）"""
+        pid = os.getpid()
+        if self._executor is None or self._executor_pid != pid:
+            with self._lock:
+                if self._executor is None or self._executor_pid != pid:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix='derivatives')
+                    self._executor_pid = pid
+        return self._executor
+
+    def filename(self, stem, name):
+        return f"{stem}_{name}.{FORMAT_EXTENSIONS[self.format]}"
+
+    def path(self, stem, name):
+        return os.path.join(self.output_dir, *self.filename(stem, name).split('/'))
+
+    def urls(self, stem):
+        return {name: f"{self.url_prefix}/{self.filename(stem, name)}" for name in self.sizes}
+
+    def submit(self, image_bytes, stem, callback=None):
+        """提交生成任务，stem为不含扩展名的相对路径（可包含分片目录）
+
+        生成成功后以 {名称: URL} 调用callback（在后台线程中执行），失败时只记录日志。
+        """
+        with self._lock:
+            self._stats['submitted'] += 1
+        return self._get_executor().submit(self._generate, image_bytes, stem, callback)
+
+    def _generate(self, image_bytes, stem, callback):
+        try:
+            urls = self.urls(stem)
+            if all(os.path.exists(self.path(stem, name)) for name in self.sizes):
+                # 内容相同的图片之前已生成过衍生图
+                with self._lock:
+                    self._stats['reused'] += 1
+            else:
+                outputs = render_derivatives(image_bytes, self.sizes, self.format, self.quality)
+                for name, data in outputs.items():
+                    path = self.path(stem, name)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+                    with open(tmp_path, 'wb') as f:
+                        f.write(data)
+                    os.replace(tmp_path, path)  # 写完再改名，避免读到不完整的文件
+                with self._lock:
+                    self._stats['generated'] += 1
+                    self._stats['bytes_in'] += len(image_bytes)
+                    self._stats['bytes_out'] += sum(len(data) for data in outputs.values())
+            if callback is not None:
+                callback(urls)
+            return urls
+        except Exception as e:
+            with self._lock:
+                self._stats['failed'] += 1
+            print(f"生成衍生图失败 ({stem}): {e}")
+            return None
+
+    def remove(self, stem):
+        """删除stem对应的所有衍生图"""
+        for name in self.sizes:
+            try:
+                os.remove(self.path(stem, name))
+            except FileNotFoundError:
+                pass
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats, format=self.format.lower(), sizes=dict(self.sizes))
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+逆地理编码缓存
+
+按网格量化经纬度作为缓存键，同一花园/同一地点拍摄的照片会命中同一条缓存。
+缓存分为两级：进程内LRU缓存 + SQLite持久化缓存，支持过期时间和负缓存
+（查不到地址或服务出错时也缓存一段时间，避免反复请求外部服务）。
+"""
+import base64
+import hashlib
+import hmac
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# 每纬度对应的大致距离（米）
+METERS_PER_DEGREE = 111320.0
+
+
+def quantize_coordinates(lat, lon, grid_meters=100):
+    """将经纬度量化到指定大小的网格，返回缓存键"""
+    lat_step = grid_meters / METERS_PER_DEGREE
+    lat_index = int(math.floor(lat / lat_step))
+    # 经度方向的网格宽度随纬度变化，按网格中心纬度计算
+    center_lat = (lat_index + 0.5) * lat_step
+    lon_step = grid_meters / (METERS_PER_DEGREE * max(math.cos(math.radians(center_lat)), 1e-6))
+    lon_index = int(math.floor(lon / lon_step))
+    return f"{int(grid_meters)}:{lat_index}:{lon_index}"
+
+
+class GeocoderUnavailable(Exception):
+    """地理编码服务暂时不可用（超时或服务错误）"""
+    pass
+
+
+class NominatimProvider:
+    """基于geopy和Nominatim服务的在线逆地理编码"""
+    name = 'nominatim'
+
+    def __init__(self, user_agent='flower_recognition_app', timeout=5, language='zh-CN'):
+        from geopy.geocoders import Nominatim
+        # 客户端只创建一次，所有请求复用
+        self.geolocator = Nominatim(user_agent=user_agent, timeout=timeout)
+        self.language = language
+
+    def reverse(self, lat, lon):
+        """返回地址字典，无结果时返回None，服务不可用时抛出GeocoderUnavailable"""
+        from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+        try:
+            location = self.geolocator.reverse((lat, lon), language=self.language)
+        except (GeocoderTimedOut, GeocoderServiceError) as e:
+            raise GeocoderUnavailable(str(e))
+        if location:
+            return location.raw.get('address', {})
+        return None
+
+
+class OfflineProvider:
+    """离线逆地理编码，从本地JSON文件中查找最近的已知地点
+
+    JSON格式: [{"lat": 39.9, "lon": 116.4, "address": {"country": "中国", ...}}, ...]
+    """
+    name = 'offline'
+
+    def __init__(self, places_file=None, max_distance_meters=1000):
+        self.max_distance_meters = max_distance_meters
+        self.places = []
+        if places_file and os.path.exists(places_file):
+            with open(places_file, 'r', encoding='utf-8') as f:
+                self.places = json.load(f)
+
+    def reverse(self, lat, lon):
+        """返回距离最近且在范围内的地点地址，找不到时返回None"""
+        best, best_distance = None, None
+        for place in self.places:
+            d_lat = (place['lat'] - lat) * METERS_PER_DEGREE
+            d_lon = (place['lon'] - lon) * METERS_PER_DEGREE * math.cos(math.radians(lat))
+            distance = math.hypot(d_lat, d_lon)
+            if distance <= self.max_distance_meters and (best_distance is None or distance < best_distance):
+                best, best_distance = place, distance
+        return dict(best['address']) if best else None
+
+
+def create_geocoding_provider(name='nominatim', **kwargs):
+    """根据名称创建逆地理编码服务"""
+    if name == 'offline':
+        return OfflineProvider(kwargs.get('places_file'))
+    return NominatimProvider(timeout=kwargs.get('timeout', 5))
+
+
+class MemoryGeocodeCache:
+    """线程安全的进程内LRU缓存，条目带过期时间"""
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """返回(是否命中, 地址)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            expires_at, address = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, address
+
+    def set(self, key, address, expires_at):
+        with self._lock:
+            self._data[key] = (expires_at, address)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+
+class SQLiteGeocodeCache:
+    """基于SQLite的持久化缓存，进程重启后缓存仍然有效"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._connection().execute('''
+        CREATE TABLE IF NOT EXISTS geocode_cache (
+            cache_key TEXT PRIMARY KEY,
+            address TEXT,
+            expires_at INTEGER NOT NULL
+        )
+        ''')
+        self._conn.commit()
+
+    def _connection(self):
+        """返回当前进程的连接，SQLite连接不能跨fork使用，子进程中重新连接"""
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def get(self, key):
+        """返回(是否命中, 地址, 过期时间)"""
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT address, expires_at FROM geocode_cache WHERE cache_key = ?', (key,)
+            ).fetchone()
+        if not row or row[1] < time.time():
+            return False, None, None
+        return True, json.loads(row[0]) if row[0] else None, row[1]
+
+    def set(self, key, address, expires_at):
+        with self._lock:
+            self._connection().execute(
+                'INSERT OR REPLACE INTO geocode_cache (cache_key, address, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(address, ensure_ascii=False) if address else None, int(expires_at))
+            )
+            self._conn.commit()
+
+    def purge_expired(self):
+        """清理已过期的缓存条目"""
+        with self._lock:
+            self._connection().execute('DELETE FROM geocode_cache WHERE expires_at < ?', (int(time.time()),))
+            self._conn.commit()
+
+
+class GeocodingCache:
+    """带两级缓存的逆地理编码器"""
+
+    def __init__(self, provider, grid_meters=100, ttl=30 * 86400, negative_ttl=86400, error_ttl=300,
+                 memory_size=4096, persistent_path=None):
+        self.provider = provider
+        self.grid_meters = grid_meters
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.error_ttl = error_ttl
+        self.memory = MemoryGeocodeCache(memory_size)
+        self.persistent = SQLiteGeocodeCache(persistent_path) if persistent_path else None
+        self._stats_lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'persistent_hits': 0, 'misses': 0, 'errors': 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def peek(self, lat, lon):
+        """只查询缓存，不访问外部服务，返回(是否命中, 地址)"""
+        key = quantize_coordinates(lat, lon, self.grid_meters)
+        hit, address = self.memory.get(key)
+        if hit:
+            self._count('memory_hits')
+            return True, address
+        if self.persistent:
+            try:
+                hit, address, expires_at = self.persistent.get(key)
+            except Exception as e:
+                print(f"读取地理编码持久化缓存失败: {e}")
+                hit = False
+            if hit:
+                self._count('persistent_hits')
+                # 回填到内存缓存
+                self.memory.set(key, address, expires_at)
+                return True, address
+        return False, None
+
+    def lookup(self, lat, lon):
+        """查询地址，缓存未命中时请求外部服务并写入缓存"""
+        hit, address = self.peek(lat, lon)
+        if hit:
+            return address
+
+        self._count('misses')
+        key = quantize_coordinates(lat, lon, self.grid_meters)
+        now = time.time()
+        try:
+            address = self.provider.reverse(lat, lon)
+            expires_at = now + (self.ttl if address else self.negative_ttl)
+        except GeocoderUnavailable as e:
+            print(f"地理编码服务不可用: {e}")
+            self._count('errors')
+            # 服务出错时短暂负缓存，同样写入持久化缓存，其他工作进程轮询时也能看到解析已结束
+            address, expires_at = None, now + self.error_ttl
+        except Exception as e:
+            print(f"获取地址信息时出错: {e}")
+            self._count('errors')
+            address, expires_at = None, now + self.error_ttl
+
+        self.memory.set(key, address, expires_at)
+        if self.persistent:
+            try:
+                self.persistent.set(key, address, expires_at)
+            except Exception as e:
+                print(f"写入地理编码持久化缓存失败: {e}")
+        return address
+
+    def purge_expired(self):
+        """清理持久化缓存中已过期的条目（内存缓存按LRU淘汰，不需要清理）"""
+        if self.persistent:
+            self.persistent.purge_expired()
+
+    def get_stats(self):
+        with self._stats_lock:
+            return dict(self.stats, provider=self.provider.name, grid_meters=self.grid_meters)
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode((text + '=' * (-len(text) % 4)).encode('ascii'))
+
+
+def _job_signature(raw, secret):
+    return hmac.new(secret.encode('utf-8'), raw, hashlib.sha256).digest()[:16]
+
+
+def encode_address_job_id(lat, lon, secret):
+    """将经纬度编码为带HMAC签名的地址解析任务ID，任何工作进程都能据此查询同一任务
+
+    客户端无法伪造任务ID，也就不能借轮询接口让服务器解析任意坐标。
+    """
+    raw = f"{lat:.7f},{lon:.7f}".encode('ascii')
+    return f"{_b64encode(raw)}.{_b64encode(_job_signature(raw, secret))}"
+
+
+def decode_address_job_id(job_id, secret):
+    """校验任务ID的签名并还原经纬度，格式或签名不正确时抛出ValueError"""
+    try:
+        payload, signature = job_id.split('.')
+        raw = _b64decode(payload)
+        if not hmac.compare_digest(_b64decode(signature), _job_signature(raw, secret)):
+            raise ValueError
+        lat, lon = raw.decode('ascii').split(',')
+        lat, lon = float(lat), float(lon)
+    except Exception:
+        raise ValueError('无效的地址解析任务ID')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('无效的地址解析任务ID')
+    return lat, lon
+
+
+class AddressResolver:
+    """在后台线程池中异步解析地址
+
+    识别接口只提交解析任务并立即返回任务ID，客户端再通过轮询接口获取地址。
+    任务状态不保存在进程内：结果写入地理编码缓存，轮询时直接查缓存，
+    因此多个工作进程之间不需要共享任务表。任务ID用secret签名，只有本服务签发的坐标才会被解析；
+    轮询落到没有该任务的工作进程且缓存中没有结果时（例如解析任务随进程重启丢失），会在本进程重新提交解析。
+    """
+
+    def __init__(self, geocoder, secret, max_workers=4):
+        self.geocoder = geocoder
+        self.secret = secret
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_pid = None
+        self._pending = set()  # 正在解析的缓存键
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        """按需创建线程池（fork出的子进程中会重新创建）"""
+        pid = os.getpid()
+        if self._executor is None or self._executor_pid != pid:
+            with self._lock:
+                if self._executor is None or self._executor_pid != pid:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix='address-resolver')
+                    self._executor_pid = pid
+                    self._pending = set()
+        return self._executor
+
+    def _schedule(self, lat, lon):
+        """提交后台解析，同一网格同时只解析一次"""
+        key = quantize_coordinates(lat, lon, self.geocoder.grid_meters)
+        executor = self._get_executor()
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        executor.submit(self._resolve, key, lat, lon)
+
+    def _resolve(self, key, lat, lon):
+        try:
+            self.geocoder.lookup(lat, lon)
+        except Exception as e:
+            print(f"后台解析地址失败: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def submit(self, lat, lon):
+        """提交解析任务，返回(任务ID, 是否已解析, 地址)；缓存命中时直接返回地址"""
+        job_id = encode_address_job_id(lat, lon, self.secret)
+        hit, address = self.geocoder.peek(lat, lon)
+        if hit:
+            return job_id, True, address
+        self._schedule(lat, lon)
+        return job_id, False, None
+
+    def poll(self, job_id):
+        """查询任务结果，返回(是否已解析, 地址)；任务ID无效时抛出ValueError"""
+        lat, lon = decode_address_job_id(job_id, self.secret)
+        hit, address = self.geocoder.peek(lat, lon)
+        if not hit:
+            # 同一网格已在解析时_schedule不会重复提交
+            self._schedule(lat, lon)
+        return hit, address
+
+    def get_stats(self):
+        with self._lock:
+            return {'pending': len(self._pending), 'max_workers': self.max_workers}
@@ -0,0 +1,24 @@
+# -*- coding: UTF-8 -*-
+"""
+gunicorn配置，在flower_frontend目录下运行：gunicorn -c gunicorn.conf.py app:app
+
+preload_app使master进程在fork之前导入app并加载识别模型，各worker以写时复制方式
+共享同一份模型权重，不再每个worker各自加载一遍。推理线程、地址解析线程池、
+SQLite连接和MySQL连接池都在worker中首次使用时按进程重新创建。
+"""
+import os
+
+bind = os.getenv('FLOWER_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('FLOWER_WORKERS', '2'))
+threads = int(os.getenv('FLOWER_THREADS', '8'))  # 每个worker的请求线程数，推理由微批处理线程统一执行
+timeout = 120
+preload_app = True
+
+# app按worker数分配每个进程的推理线程数（CPU核数/worker数）
+os.environ['FLOWER_WORKERS'] = str(workers)
+
+
+def post_fork(server, worker):
+    """fork后在worker进程中重新设置推理线程数"""
+    import app
+    app.inference_threads = app.configure_inference_threads()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+跨请求微批处理推理队列
+
+所有请求线程只负责把图片放入有界队列，由单独的推理工作线程在一个很短的
+时间窗口内收集多张图片，合并成一个批次执行一次前向推理，再把结果分发回
+各请求对应的Future。
+"""
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+
+# 停止信号，推理线程取到后退出
+_STOP = object()
+
+
+class InferenceQueueFull(Exception):
+    """推理队列已满，调用方应返回503让客户端稍后重试"""
+    pass
+
+
+class InferenceBatcherClosed(Exception):
+    """推理队列已关闭（模型已下线），调用方应重新选择模型后提交"""
+    pass
+
+
+class _InferenceItem:
+    """队列中的单个推理任务"""
+    __slots__ = ('image', 'future', 'enqueued_at')
+
+    def __init__(self, image):
+        self.image = image
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+def _bucket(value):
+    """将数值归入2的幂次区间，用于直方图统计"""
+    upper = 1
+    while upper < value:
+        upper *= 2
+    return upper
+
+
+class InferenceBatcher:
+    """微批处理推理器
+
+    infer_fn 接收图片列表，返回与之等长的结果列表（每张图片一个结果）。
+    """
+
+    def __init__(self, infer_fn, max_batch_size=16, batch_window_ms=10, max_queue_size=256):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.batch_window = max(0.0, batch_window_ms / 1000.0)
+        self.max_queue_size = max(1, int(max_queue_size))
+
+        # 队列本身不限长度，容量由submit_many在锁内检查，停止信号总能放入
+        self._queue = queue.Queue()
+        self._submit_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+        self.closed = False
+
+        self._batch_size_hist = Counter()    # 批次大小 -> 次数
+        self._queue_depth_hist = Counter()   # 提交时的队列深度区间 -> 次数
+        self._total_images = 0
+        self._total_batches = 0
+        self._rejected = 0
+        self._failed_batches = 0
+        self._total_wait_ms = 0.0
+        self._total_infer_ms = 0.0
+
+    def _ensure_worker(self):
+        """按需启动推理线程（fork出的子进程中会重新启动）"""
+        pid = os.getpid()
+        if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+            return
+        with self._submit_lock:
+            if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+                return
+            if self._worker_pid != pid:
+                # fork后父进程的队列和线程状态不可用，重新创建
+                self._queue = queue.Queue()
+            self._worker = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+            self._worker_pid = pid
+            self._worker.start()
+
+    def submit(self, image):
+        """提交单张图片，返回Future"""
+        return self.submit_many([image])[0]
+
+    def submit_many(self, images):
+        """提交多张图片，返回Future列表；队列容量不足时整体拒绝，队列已关闭时抛出InferenceBatcherClosed"""
+        if self.closed:
+            raise InferenceBatcherClosed('推理队列已关闭')
+        self._ensure_worker()
+        items = [_InferenceItem(image) for image in images]
+        with self._submit_lock:
+            # 与close()互斥：关闭后不会再有图片排在停止信号之后
+            if self.closed:
+                raise InferenceBatcherClosed('推理队列已关闭')
+            depth = self._queue.qsize()
+            with self._stats_lock:
+                self._queue_depth_hist[_bucket(depth)] += 1
+            if depth + len(items) > self.max_queue_size:
+                with self._stats_lock:
+                    self._rejected += len(items)
+                raise InferenceQueueFull(f'推理队列已满（{depth}/{self.max_queue_size}）')
+            for item in items:
+                self._queue.put_nowait(item)
+        return [item.future for item in items]
+
+    def close(self):
+        """关闭队列并停止推理线程，已入队的图片推理完成后线程退出（用于下线旧版本模型）
+
+        关闭后submit_many抛出InferenceBatcherClosed，不会再启动新的推理线程。
+        """
+        with self._submit_lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                self._queue.put_nowait(_STOP)
+                return
+        # 推理线程未运行时由当前线程处理完剩余的图片
+        self._drain()
+
+    def _collect_batch(self):
+        """阻塞等待第一张图片，然后在时间窗口内尽量凑满一个批次，返回(批次, 是否收到停止信号)"""
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        """推理工作线程主循环"""
+        while True:
+            batch, stop = self._collect_batch()
+            if batch:
+                self._process(batch)
+            if stop:
+                self._drain()
+                return
+
+    def _drain(self):
+        """处理停止信号之后仍留在队列中的图片，不让它们一直等到超时"""
+        while True:
+            batch = []
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    batch.append(item)
+            if not batch:
+                return
+            self._process(batch)
+
+    def _process(self, batch):
+        """对一个批次执行推理并把结果分发给各Future"""
+        start = time.monotonic()
+        try:
+            results = self.infer_fn([item.image for item in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f'推理结果数量不匹配: {len(results)} != {len(batch)}')
+            for item, result in zip(batch, results):
+                item.future.set_result(result)
+        except Exception as e:
+            print(f"批量推理失败: {e}")
+            with self._stats_lock:
+                self._failed_batches += 1
+            if len(batch) > 1:
+                # 逐张重试，一张有问题的图片不会让同一批次中其他请求的图片一起失败；
+                # 批次大小、图片数等统计由每次重试各自记录，失败的这一批不再计入
+                for item in batch:
+                    if not item.future.done():
+                        self._process([item])
+                return
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+        self._record_batch(batch, start)
+
+    def _record_batch(self, batch, start):
+        """记录一次推理调用的批次大小、排队等待和推理耗时"""
+        infer_ms = (time.monotonic() - start) * 1000
+        with self._stats_lock:
+            self._total_batches += 1
+            self._total_images += len(batch)
+            self._batch_size_hist[len(batch)] += 1
+            self._total_infer_ms += infer_ms
+            self._total_wait_ms += sum((start - item.enqueued_at) * 1000 for item in batch)
+
+    def get_stats(self):
+        """返回队列深度、批次大小直方图等运行指标"""
+        with self._stats_lock:
+            batches = self._total_batches
+            images = self._total_images
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_size': self.max_queue_size,
+                'max_batch_size': self.max_batch_size,
+                'batch_window_ms': self.batch_window * 1000,
+                'total_batches': batches,
+                'total_images': images,
+                'rejected_images': self._rejected,
+                'failed_batches': self._failed_batches,
+                'avg_batch_size': round(images / batches, 2) if batches else 0,
+                'avg_queue_wait_ms': round(self._total_wait_ms / images, 2) if images else 0,
+                'avg_batch_infer_ms': round(self._total_infer_ms / batches, 2) if batches else 0,
+                'batch_size_histogram': {str(k): v for k, v in sorted(self._batch_size_hist.items())},
+                'queue_depth_histogram': {f'<={k}': v for k, v in sorted(self._queue_depth_hist.items())},
+            }
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+数据库结构迁移
+
+database.sql 只负责创建不存在的表，已有数据库中的表结构变更（新增字段、索引）在这里按版本号登记，
+由 SQLDatabaseManager.apply_migrations() 在启动时按顺序执行，已执行的版本记录在 schema_migrations 表中。
+每个操作执行前都会检查字段/索引是否已存在，重复执行不会出错。
+
+操作格式：
+    ('column', 表名, 字段名, 字段定义)
+    ('index', 表名, 索引名, 字段列表)
+    ('sql', 语句)                      # 数据修正，语句本身需要可以重复执行
+
+每个功能的结构变更单独登记一个版本。由于每个操作都可以重复执行，已执行过旧版本（其中包含了
+后来拆分出去的字段）的数据库再执行拆分出的新版本时不会有任何变化。
+
+HOT_QUERIES 登记了db.py中的高频查询（SQL取自queries.py，与对应方法共用，参数为示例值），
+SQLDatabaseManager.check_query_plans() 对它们执行 EXPLAIN，报告全表扫描、全索引扫描、文件排序和临时表。
+数据量很小的表上优化器可能直接选择全表扫描，检查结果以生产规模的数据为准。
+
+在flower_frontend目录下运行：
+    python migrations.py           # 执行未完成的迁移
+    python migrations.py --check   # 执行迁移后检查查询计划
+"""
+import queries
+from pagination import encode_cursor, keyset_condition
+from traffic_rollup import HISTOGRAM_COLUMNS
+
+MIGRATIONS = [
+    (1, '相册衍生图：缩略图和中图路径，以及添加相册图片时写入的识别结果字段', [
+        ('column', 'album_images', 'recognition_result_id', 'INT'),
+        ('column', 'album_images', 'flower_name', 'VARCHAR(100)'),
+        ('column', 'album_images', 'confidence', 'FLOAT'),
+        ('column', 'album_images', 'thumbnail_path', 'TEXT'),
+        ('column', 'album_images', 'medium_path', 'TEXT'),
+        ('column', 'recognition_results', 'thumbnail_path', 'TEXT'),
+        ('column', 'recognition_results', 'medium_path', 'TEXT'),
+    ]),
+    (2, '为高频查询添加二级索引', [
+        ('index', 'posts', 'idx_posts_deleted_created', ('deleted_at', 'created_at')),
+        ('index', 'recognition_results', 'idx_recognition_results_user_created', ('user_id', 'created_at')),
+        ('index', 'traffic_stats', 'idx_traffic_stats_date_endpoint', ('date', 'endpoint')),
+        ('index', 'system_logs', 'idx_system_logs_created_level_module', ('created_at', 'log_level', 'module')),
+        ('index', 'album_images', 'idx_album_images_album_created', ('album_id', 'created_at')),
+        ('index', 'albums', 'idx_albums_user_category', ('user_id', 'category')),
+        ('index', 'recycle_bin', 'idx_recycle_bin_user_type_deleted', ('user_id', 'item_type', 'deleted_at')),
+        ('index', 'user_feedback', 'idx_user_feedback_user_created', ('user_id', 'created_at')),
+    ]),
+    (3, '首页时间线：用户粉丝数和按作者查询帖子的索引', [
+        ('column', 'users', 'followers_count', 'INT NOT NULL DEFAULT 0'),
+        ('sql', 'UPDATE users u SET followers_count = (SELECT COUNT(*) FROM follows f WHERE f.following_id = u.id)'),
+        ('index', 'posts', 'idx_posts_user_created', ('user_id', 'created_at')),
+    ]),
+    (4, '首页时间线：在帖子上记录发帖时是否已写扩散', [
+        ('column', 'posts', 'fanned_out', 'TINYINT NOT NULL DEFAULT 1'),
+        ('index', 'posts', 'idx_posts_user_fanout', ('user_id', 'fanned_out', 'created_at')),
+    ]),
+    (5, '图片去重：按内容哈希存储的image_blobs表和引用它的字段', [
+        ('sql', 'CREATE TABLE IF NOT EXISTS image_blobs ('
+                'sha256 CHAR(64) PRIMARY KEY, '
+                'blob_path VARCHAR(255) NOT NULL, '
+                'size_bytes BIGINT NOT NULL DEFAULT 0, '
+                'ref_count INT NOT NULL DEFAULT 0, '
+                'created_at INT NOT NULL, '
+                'updated_at INT NOT NULL'
+                ') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4'),
+        ('column', 'album_images', 'blob_hash', 'CHAR(64)'),
+        ('column', 'recognition_results', 'blob_hash', 'CHAR(64)'),
+        ('index', 'album_images', 'idx_album_images_blob', ('blob_hash',)),
+        ('index', 'recognition_results', 'idx_recognition_results_blob', ('blob_hash',)),
+    ]),
+    (6, '每日流量汇总：增量维护的总响应时间和独立访客HyperLogLog草图', [
+        ('column', 'daily_traffic_summary', 'total_response_time', 'DOUBLE DEFAULT 0'),
+        ('column', 'daily_traffic_summary', 'visitor_sketch', 'BLOB'),
+    ]),
+    (7, '按创建时间清理过期访问记录使用的索引', [
+        ('index', 'traffic_stats', 'idx_traffic_stats_created', ('created_at',)),
+    ]),
+    (8, '权限缓存：修改角色时递增的共享版本号', [
+        ('sql', 'CREATE TABLE IF NOT EXISTS permission_version ('
+                'id INT PRIMARY KEY, '
+                'version BIGINT NOT NULL DEFAULT 0'
+                ') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4'),
+        ('sql', 'INSERT IGNORE INTO permission_version (id, version) VALUES (1, 0)'),
+    ]),
+    (9, '定期维护任务：记录各任务最近一次执行时间', [
+        ('sql', 'CREATE TABLE IF NOT EXISTS maintenance_runs ('
+                'name VARCHAR(100) PRIMARY KEY, '
+                'last_run_at INT NOT NULL'
+                ') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4'),
+    ]),
+]
+
+# 执行计划中需要关注的情况：EXPLAIN的type列和Extra列 -> 说明
+PLAN_TYPE_ISSUES = {
+    'ALL': '全表扫描',
+    'index': '全索引扫描',
+}
+PLAN_EXTRA_ISSUES = {
+    'Using filesort': '文件排序',
+    'Using temporary': '临时表',
+}
+
+_FEED_POST_MARKS = ', '.join(['%s'] * 3)
+
+# 查询名（对应db.py中的方法） -> (SQL, 示例参数)；SQL取自queries.py，与db.py执行的语句相同
+HOT_QUERIES = {
+    'get_posts': (queries.POSTS_PAGE.format(keyset=''), (20, 0)),
+    'get_posts_cursor': (
+        queries.POSTS_PAGE.format(keyset=keyset_condition(encode_cursor(0, 1), 'p.created_at', 'p.id')[0]),
+        (0, 0, 1, 20, 0)
+    ),
+    'get_feed_liked_posts': (queries.FEED_LIKED_POSTS.format(post_marks=_FEED_POST_MARKS), (1, 1, 2, 3)),
+    'get_feed_followed_authors': (queries.FEED_FOLLOWED_AUTHORS.format(author_marks=_FEED_POST_MARKS), (1, 1, 2, 3)),
+    'get_feed_first_comments': (queries.FEED_FIRST_COMMENTS.format(post_marks=_FEED_POST_MARKS), (1, 2, 3, 3)),
+    'get_home_timeline': (queries.HOME_TIMELINE_MATERIALIZED.format(keyset=''), (1, 20)),
+    'get_home_timeline_pull': (queries.HOME_TIMELINE_PULLED.format(keyset=''), (1, 20)),
+    'get_user_recognition_history': (queries.RECOGNITION_HISTORY_PAGE.format(keyset=''), (1, 20, 0)),
+    'get_album_images': (queries.ALBUM_IMAGES_PAGE.format(keyset=''), (1, 50, 0)),
+    'get_user_albums': (queries.USER_ALBUMS_BY_CATEGORY, (1, 'rose')),
+    'get_user_feedback': (queries.USER_FEEDBACK_PAGE.format(keyset=''), (1, 20, 0)),
+    'get_recycle_bin_items': (queries.RECYCLE_BIN_PAGE_BY_TYPE.format(keyset=''), (1, 'image', 50, 0)),
+    'get_system_logs': (
+        queries.SYSTEM_LOGS_SELECT + ' AND created_at >= %s' + queries.SYSTEM_LOGS_ORDER,
+        (0, 100, 0)
+    ),
+    'get_traffic_by_endpoint': (
+        queries.TRAFFIC_BY_ENDPOINT_SELECT.format(
+            histogram_sums=', '.join(f'SUM({c}) as {c}' for c in HISTOGRAM_COLUMNS)
+        ) + ' AND bucket_start >= %s' + queries.TRAFFIC_BY_ENDPOINT_GROUP,
+        (0, 20)
+    ),
+    'prune_traffic_data': (
+        queries.PRUNE_CHUNK.format(table='traffic_stats', condition='created_at < %s'),
+        (0, 5000)
+    ),
+}
+
+
+def analyze_plan(plan):
+    """从EXPLAIN结果中找出需要关注的表，返回 [(表名, 说明), ...]"""
+    issues = []
+    for row in plan:
+        table = row.get('table')
+        if row.get('type') in PLAN_TYPE_ISSUES:
+            issues.append((table, PLAN_TYPE_ISSUES[row['type']]))
+        extra = row.get('Extra') or ''
+        for marker, description in PLAN_EXTRA_ISSUES.items():
+            if marker in extra:
+                issues.append((table, description))
+    return issues
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='执行数据库结构迁移并检查高频查询的执行计划')
+    parser.add_argument('--check', action='store_true', help='执行迁移后对高频查询执行EXPLAIN')
+    opt = parser.parse_args()
+
+    from db import db_manager  # 导入时会执行未完成的迁移
+    print(f"当前数据库结构版本: {db_manager.get_schema_version()}")
+    if opt.check:
+        flagged = 0
+        for report in db_manager.check_query_plans():
+            flagged += bool(report['issues'])
+            status = '; '.join(f"{table}: {issue}" for table, issue in report['issues']) or '正常'
+            print(f"{report['name']:<32} {status}")
+        print(f"\n共 {len(HOT_QUERIES)} 个查询，{flagged} 个需要检查执行计划")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+识别模型注册表
+
+直接使用DetectMultiBackend加载权重（.pt权重通过attempt_load加载并融合Conv+BN），
+再包装为AutoShape，不经过torch.hub，也不会在每次启动时重新加载hub仓库。
+除PyTorch权重外，也可以直接加载export.py导出的ONNX、OpenVINO、TorchScript等格式，
+在只有CPU的服务器上用ONNX Runtime或OpenVINO推理，预处理和后处理与PyTorch模型完全相同。
+模型加载后用一张空白图片预热一次，并记录加载和预热耗时。
+
+模型在导入app模块时加载，配合gunicorn的preload_app，master进程加载一次后
+fork出的各worker以写时复制方式共享同一份权重内存。
+
+ModelManager在注册表之上管理当前版本和候选版本：新权重在后台线程加载预热后
+原子替换，可按比例把请求分流给候选版本，或以影子模式把流量镜像给候选版本，
+并分别统计各版本的推理耗时和置信度。
+"""
+import json
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+# DetectMultiBackend的后端类型标志 -> 后端名称
+BACKEND_NAMES = (
+    ('pt', 'pytorch'),
+    ('jit', 'torchscript'),
+    ('onnx', 'onnxruntime'),
+    ('xml', 'openvino'),
+    ('engine', 'tensorrt'),
+    ('coreml', 'coreml'),
+    ('saved_model', 'tensorflow'),
+    ('pb', 'tensorflow-pb'),
+    ('tflite', 'tflite'),
+    ('paddle', 'paddle'),
+    ('triton', 'triton'),
+)
+
+
+def model_version(weights):
+    """模型版本标识：权重文件名 + 修改时间（OpenVINO等目录格式取目录内文件的最新修改时间）"""
+    weights = weights.rstrip('/\\')
+    if os.path.isdir(weights):
+        mtime = max([os.path.getmtime(os.path.join(weights, f)) for f in os.listdir(weights)] or
+                    [os.path.getmtime(weights)])
+    else:
+        mtime = os.path.getmtime(weights)
+    return f"{os.path.basename(weights)}@{int(mtime)}"
+
+
+def static_input_shape(backend):
+    """返回导出模型固定的输入批大小和(高, 宽)，动态维度返回None"""
+    batch, size = None, None
+    if backend.onnx and not backend.dnn:
+        shape = backend.session.get_inputs()[0].shape
+    elif backend.xml:
+        shape = [d.get_length() if d.is_static else None for d in backend.ov_model.get_parameters()[0].get_partial_shape()]
+    elif backend.engine and not backend.dynamic:
+        shape = backend.bindings['images'].shape
+    elif backend.dnn:
+        return 1, None  # OpenCV DNN只支持单张推理
+    else:
+        return None, None
+    if isinstance(shape[0], int):
+        batch = shape[0]
+    if len(shape) == 4 and all(isinstance(d, int) for d in shape[2:]):
+        size = tuple(shape[2:])
+    return batch, size
+
+
+class RegisteredModel:
+    """已加载的模型及其加载信息"""
+
+    def __init__(self, name, model, weights, backend, load_ms, warmup_ms, version=None, fixed_batch_size=None):
+        self.name = name
+        self.model = model            # AutoShape包装后的模型
+        self.weights = weights
+        self.version = version or model_version(weights)
+        self.backend = backend
+        self.fixed_batch_size = fixed_batch_size  # 导出时固定的批大小，None表示支持任意批大小
+        self.load_ms = load_ms
+        self.warmup_ms = warmup_ms
+        self.loaded_at = time.time()
+        self.retired = False  # 下线后置为True，不再接受新的推理请求
+
+        self._stats_lock = threading.Lock()
+        self._images = 0
+        self._batches = 0
+        self._detected = 0
+        self._total_infer_ms = 0.0
+        self._total_confidence = 0.0
+        self._shadow_compared = 0
+        self._shadow_agreed = 0
+
+    def record_batch(self, infer_ms, detections):
+        """记录一个批次的推理耗时和每张图片的识别结果"""
+        confidences = [d[0]['confidence'] for d in detections if d]
+        with self._stats_lock:
+            self._batches += 1
+            self._images += len(detections)
+            self._detected += len(confidences)
+            self._total_infer_ms += infer_ms
+            self._total_confidence += sum(confidences)
+
+    def record_shadow_comparison(self, agreed):
+        """记录影子推理结果与线上版本是否一致"""
+        with self._stats_lock:
+            self._shadow_compared += 1
+            self._shadow_agreed += int(agreed)
+
+    def get_stats(self):
+        with self._stats_lock:
+            return {
+                'images': self._images,
+                'batches': self._batches,
+                'avg_batch_infer_ms': round(self._total_infer_ms / self._batches, 2) if self._batches else 0,
+                'avg_image_infer_ms': round(self._total_infer_ms / self._images, 2) if self._images else 0,
+                'detection_rate': round(self._detected / self._images, 4) if self._images else 0,
+                'avg_confidence': round(self._total_confidence / self._detected, 4) if self._detected else 0,
+                'shadow_compared': self._shadow_compared,
+                'shadow_agreement': round(self._shadow_agreed / self._shadow_compared, 4) if self._shadow_compared else 0
+            }
+
+    def get_info(self):
+        return {
+            'name': self.name,
+            'weights': os.path.basename(self.weights) if self.weights else None,
+            'version': self.version,
+            'backend': self.backend,
+            'fixed_batch_size': self.fixed_batch_size,
+            'load_ms': round(self.load_ms, 1),
+            'warmup_ms': round(self.warmup_ms, 1),
+            'loaded_at': int(self.loaded_at),
+            'pid': os.getpid(),
+            'stats': self.get_stats()
+        }
+
+
+class ModelRegistry:
+    """按名称管理已加载的识别模型"""
+
+    def __init__(self, img_size=640, device=''):
+        self.img_size = img_size
+        self.device = device
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def load(self, name, weights, conf=0.25, iou=0.45, warmup=True):
+        """加载权重并注册为name，返回RegisteredModel"""
+        from models.common import AutoShape, DetectMultiBackend
+        from utils.torch_utils import select_device
+
+        start = time.perf_counter()
+        backend = DetectMultiBackend(weights, device=select_device(self.device), fuse=True)
+        fixed_batch_size, fixed_size = static_input_shape(backend)
+        if fixed_size and fixed_size != (self.img_size, self.img_size):
+            raise ValueError(f'{os.path.basename(weights)} 的输入尺寸为 {fixed_size}，'
+                             f'与识别配置的 {self.img_size} 不一致，请使用 --imgsz {self.img_size} 重新导出')
+        model = AutoShape(backend, verbose=False)
+        model.conf = conf
+        model.iou = iou
+        load_ms = (time.perf_counter() - start) * 1000
+
+        warmup_ms = self.warmup(model, fixed_batch_size or 1) if warmup else 0.0
+        backend_name = next((label for flag, label in BACKEND_NAMES if getattr(backend, flag, False)), 'unknown')
+        entry = RegisteredModel(name, model, weights, backend_name, load_ms, warmup_ms,
+                                fixed_batch_size=fixed_batch_size)
+        with self._lock:
+            self._models[name] = entry
+        return entry
+
+    def warmup(self, model, batch_size=1):
+        """用空白图片完整跑一次预处理、推理和NMS，返回耗时（毫秒）"""
+        start = time.perf_counter()
+        model([np.zeros((self.img_size, self.img_size, 3), dtype=np.uint8)] * batch_size, size=self.img_size)
+        return (time.perf_counter() - start) * 1000
+
+    def get(self, name):
+        with self._lock:
+            return self._models.get(name)
+
+    def remove(self, name):
+        """移除已下线的模型，释放对其权重的引用"""
+        with self._lock:
+            return self._models.pop(name, None)
+
+    def get_stats(self):
+        with self._lock:
+            return {name: entry.get_info() for name, entry in self._models.items()}
+
+
+class ModelManager:
+    """管理当前版本（active）和候选版本（candidate）的识别模型
+
+    路由配置保存在JSON文件中，格式：
+    {"active": "权重路径", "candidate": "权重路径或null", "candidate_percent": 10, "shadow": false}
+    各工作进程定期检查配置文件和当前权重文件的修改时间，发现变化后在后台加载新模型，
+    预热完成后再原子替换，替换期间的请求继续由旧模型处理。
+    """
+
+    def __init__(self, registry, conf=0.25, iou=0.45, warmup=True, routing_file=None, check_interval=5):
+        self.registry = registry
+        self.conf = conf
+        self.iou = iou
+        self.warmup = warmup
+        self.routing_file = routing_file
+        self.check_interval = check_interval
+
+        self.active = None
+        self.candidate = None
+        self.candidate_percent = 0
+        self.shadow = False
+
+        self._desired = {'active': None, 'candidate': None}  # 各角色期望的权重路径
+        self._loading = set()  # 正在后台加载的(角色, 权重路径)
+        self._retire_callbacks = []
+        self._lock = threading.Lock()
+        self._routing_mtime = None
+        self._next_check = 0.0
+
+    def _load(self, weights):
+        return self.registry.load(model_version(weights), weights, conf=self.conf, iou=self.iou, warmup=self.warmup)
+
+    def start(self, weights):
+        """启动时同步加载模型，路由配置文件中指定的版本优先于默认权重"""
+        config = self._read_routing() or {}
+        if config:
+            self._routing_mtime = os.path.getmtime(self.routing_file)
+        active_weights = config.get('active') or weights
+        self.active = self._load(active_weights)
+        self._desired['active'] = active_weights
+        self._apply_routing(config, background=False)
+        return self.active
+
+    def set_active(self, entry):
+        """直接指定当前版本（模型加载失败时用于设置模拟模型）"""
+        with self._lock:
+            self.active = entry
+
+    def on_retire(self, callback):
+        """注册模型下线回调，例如关闭该版本的推理队列"""
+        self._retire_callbacks.append(callback)
+
+    def _retire(self, entry):
+        if entry is None:
+            return
+        entry.retired = True
+        for callback in self._retire_callbacks:
+            try:
+                callback(entry)
+            except Exception as e:
+                print(f"下线模型 {entry.version} 时出错: {e}")
+        self.registry.remove(entry.name)
+
+    def route(self):
+        """为一次请求选择模型，返回(处理请求的模型, 影子模型或None)"""
+        self._maybe_refresh()
+        with self._lock:
+            active, candidate = self.active, self.candidate
+            percent, shadow = self.candidate_percent, self.shadow
+        if candidate is None:
+            return active, None
+        if shadow:
+            return active, candidate
+        if random.random() * 100 < percent:
+            return candidate, None
+        return active, None
+
+    @staticmethod
+    def _is_current(entry, weights):
+        """entry是否就是weights当前的版本（权重文件被覆盖后版本会变化）"""
+        if entry is None or not weights:
+            return False
+        try:
+            return os.path.abspath(entry.weights) == os.path.abspath(weights) and entry.version == model_version(weights)
+        except OSError:
+            return False
+
+    def _maybe_refresh(self, force=False):
+        """按检查间隔查看路由配置和权重文件是否有变化"""
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+
+        if self.routing_file:
+            try:
+                mtime = os.path.getmtime(self.routing_file)
+            except OSError:
+                mtime = None
+            if mtime is not None and (force or mtime != self._routing_mtime):
+                self._routing_mtime = mtime
+                config = self._read_routing()
+                if config is not None:
+                    self._apply_routing(config)
+
+        # 权重文件被新训练的模型覆盖时自动重新加载
+        for role in ('active', 'candidate'):
+            entry, weights = getattr(self, role), self._desired[role]
+            if entry is not None and weights and not self._is_current(entry, weights) and os.path.exists(weights):
+                self._load_role(role, weights)
+
+    def _read_routing(self):
+        if not self.routing_file or not os.path.exists(self.routing_file):
+            return None
+        try:
+            with open(self.routing_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取模型路由配置失败: {e}")
+            return None
+
+    def _apply_routing(self, config, background=True):
+        """应用路由配置，需要的新模型在后台加载"""
+        active_weights = config.get('active') or self._desired['active']
+        candidate_weights = config.get('candidate') or None
+        if candidate_weights and active_weights and os.path.abspath(candidate_weights) == os.path.abspath(active_weights):
+            candidate_weights = None  # 候选版本与当前版本相同，无需分流
+        with self._lock:
+            self.candidate_percent = min(max(float(config.get('candidate_percent', 0) or 0), 0.0), 100.0)
+            self.shadow = bool(config.get('shadow', False))
+            self._desired['active'] = active_weights
+            self._desired['candidate'] = candidate_weights
+            promote = (not self._is_current(self.active, active_weights)
+                       and self._is_current(self.candidate, active_weights))
+            if promote:
+                # 候选版本被提升为当前版本，直接切换，不需要重新加载
+                retired, self.active, self.candidate = self.active, self.candidate, None
+            else:
+                retired = None
+            drop = self.candidate if candidate_weights is None else None
+            if drop is not None:
+                self.candidate = None
+        self._retire(retired)
+        self._retire(drop)
+
+        if not self._is_current(self.active, active_weights):
+            self._load_role('active', active_weights, background)
+        if candidate_weights and not self._is_current(self.candidate, candidate_weights):
+            self._load_role('candidate', candidate_weights, background)
+
+    def _load_role(self, role, weights, background=True):
+        with self._lock:
+            if (role, weights) in self._loading:
+                return
+            self._loading.add((role, weights))
+        if background:
+            threading.Thread(target=self._load_and_swap, args=(role, weights),
+                             name=f'model-loader-{role}', daemon=True).start()
+        else:
+            self._load_and_swap(role, weights)
+
+    def _load_and_swap(self, role, weights):
+        """加载并预热新模型，完成后原子替换对应角色"""
+        try:
+            entry = self._load(weights)
+        except Exception as e:
+            print(f"加载模型 {weights} 失败: {e}")
+            entry = None
+        with self._lock:
+            self._loading.discard((role, weights))
+            if entry is None:
+                return
+            if self._desired[role] != weights:
+                # 加载期间配置已经变化，丢弃本次加载结果
+                retired, swapped = entry, False
+            else:
+                retired, swapped = getattr(self, role), True
+                setattr(self, role, entry)
+        self._retire(retired)
+        if swapped:
+            print(f"模型 {entry.version} 已切换为{role}版本（加载 {entry.load_ms:.0f}ms，预热 {entry.warmup_ms:.0f}ms）")
+
+    def update_routing(self, **changes):
+        """修改路由配置并写入配置文件，其他工作进程在下次检查时生效"""
+        with self._lock:
+            config = {
+                'active': self._desired['active'],
+                'candidate': self._desired['candidate'],
+                'candidate_percent': self.candidate_percent,
+                'shadow': self.shadow
+            }
+        config.update(changes)
+        if self.routing_file:
+            tmp_path = f"{self.routing_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(config, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.routing_file)
+            self._routing_mtime = os.path.getmtime(self.routing_file)
+        self._apply_routing(config)
+        return config
+
+    def get_stats(self):
+        with self._lock:
+            active, candidate = self.active, self.candidate
+            loading = sorted(weights for _, weights in self._loading)
+            return {
+                'active': active.get_info() if active else None,
+                'candidate': candidate.get_info() if candidate else None,
+                'candidate_percent': self.candidate_percent,
+                'shadow': self.shadow,
+                'loading': [os.path.basename(w) for w in loading]
+            }
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+游标分页
+
+列表按 (时间, id) 倒序排列，下一页从上一页最后一条记录之后开始查询
+（WHERE 时间 < t OR (时间 = t AND id < i)），可以直接利用索引定位，
+不像 OFFSET 那样需要扫描并丢弃前面所有的行。游标对客户端是不透明的字符串。
+"""
+import base64
+
+# 游标中的时间和id都是非负的BIGINT
+_MAX_VALUE = 1 << 63
+
+
+def encode_cursor(timestamp, row_id):
+    """把 (时间, id) 编码为不透明的游标字符串"""
+    raw = f"{int(timestamp)}:{int(row_id)}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (时间, id)；游标无效时抛出ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, row_id = base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii').split(':')
+        timestamp, row_id = int(timestamp), int(row_id)
+    except Exception:
+        raise ValueError('无效的分页游标')
+    # 篡改的游标可能带有超出BIGINT范围的数值，不能让它进入SQL后变成500
+    if not (0 <= timestamp < _MAX_VALUE and 0 <= row_id < _MAX_VALUE):
+        raise ValueError('无效的分页游标')
+    return timestamp, row_id
+
+
+def keyset_condition(cursor, time_column='created_at', id_column='id'):
+    """返回游标对应的WHERE条件片段（以 AND 开头）和参数；cursor为空时返回空条件"""
+    if not cursor:
+        return '', []
+    timestamp, row_id = decode_cursor(cursor)
+    return (f' AND ({time_column} < %s OR ({time_column} = %s AND {id_column} < %s))',
+            [timestamp, timestamp, row_id])
+
+
+def next_cursor(rows, limit, time_key='created_at', id_key='id'):
+    """本页已取满时返回下一页的游标，否则返回None"""
+    if not rows or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(last[time_key], last[id_key])
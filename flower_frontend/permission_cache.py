@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+用户权限缓存
+
+permission_required 和 admin_required 每次鉴权都需要用户的角色和权限集合，
+这里按用户ID在进程内缓存（角色集合, 权限集合），条目在ttl秒后过期，
+update_user_role 修改角色后立即使该用户的条目失效。
+缓存只在当前进程内有效；传入version_fn时每隔version_check_interval秒读取一次共享的版本号
+（db.py中为permission_version表，修改角色时在同一事务中递增），版本号变化说明其他进程修改过角色，
+清空本进程的缓存。未传入或读取失败时，其他worker进程中的旧条目最多保留ttl秒。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class PermissionCache:
+    """用户ID -> {'roles': frozenset, 'permissions': frozenset} 的LRU缓存"""
+
+    def __init__(self, ttl=30, max_entries=10000, version_fn=None, version_check_interval=1.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version_fn = version_fn
+        self.version_check_interval = version_check_interval
+        self._data = OrderedDict()  # user_id -> (expires_at, 角色和权限)
+        self._generation = 0  # 每次失效时递增，失效前开始的加载结果不再写入缓存
+        self._version = None  # 最近一次读取的共享版本号
+        self._next_version_check = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'remote_invalidations': 0, 'evictions': 0}
+
+    def _sync_version(self, now):
+        """到检查时间时读取共享版本号，与上次不同则清空缓存"""
+        if self.version_fn is None:
+            return
+        with self._lock:
+            if now < self._next_version_check:
+                return
+            self._next_version_check = now + self.version_check_interval
+        try:
+            version = self.version_fn()
+        except Exception as e:
+            # 读取失败时保留缓存，旧条目仍在ttl后过期
+            print(f"读取权限缓存版本号失败: {e}")
+            return
+        with self._lock:
+            if self._version is not None and version != self._version:
+                self._generation += 1
+                self._data.clear()
+                self._stats['remote_invalidations'] += 1
+            self._version = version
+
+    def get_or_load(self, user_id, loader):
+        """返回用户的角色和权限，未命中或已过期时调用loader(user_id)从数据库加载"""
+        now = time.monotonic()
+        self._sync_version(now)
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry and entry[0] > now:
+                self._data.move_to_end(user_id)
+                self._stats['hits'] += 1
+                return entry[1]
+            self._stats['misses'] += 1
+            generation = self._generation
+        access = loader(user_id)
+        if self.ttl <= 0:
+            return access
+        with self._lock:
+            if generation == self._generation:
+                self._data[user_id] = (time.monotonic() + self.ttl, access)
+                self._data.move_to_end(user_id)
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+                    self._stats['evictions'] += 1
+        return access
+
+    def invalidate(self, user_id=None):
+        """使指定用户（user_id为None时为全部用户）的缓存失效"""
+        with self._lock:
+            self._generation += 1
+            self._stats['invalidations'] += 1
+            if user_id is None:
+                self._data.clear()
+            else:
+                self._data.pop(user_id, None)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._data), ttl=self.ttl)
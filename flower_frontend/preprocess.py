@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+识别前的图片预处理
+
+JPEG图片利用PIL的draft模式在解码阶段直接按接近目标尺寸的比例缩小解码，
+避免完整解码几千万像素的手机照片；随后按照与detect.py相同的letterbox逻辑
+等比缩放并填充，识别框再映射回原图坐标。
+"""
+import io
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from utils.augmentations import letterbox
+
+# EXIF方向标签，取值5~8时图片需要旋转90度，宽高互换
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+class PreprocessedImage:
+    """预处理后的图片及其坐标映射信息"""
+
+    def __init__(self, array, orig_width, orig_height, decoded_width, decoded_height, ratio, pad):
+        self.array = array                    # letterbox后的HWC RGB数组
+        self.orig_width = orig_width          # 原图宽（已按EXIF方向校正）
+        self.orig_height = orig_height        # 原图高（已按EXIF方向校正）
+        self.decoded_width = decoded_width    # draft解码后的宽
+        self.decoded_height = decoded_height  # draft解码后的高
+        self.ratio = ratio                    # letterbox缩放比例
+        self.pad = pad                        # letterbox填充 (dw, dh)
+
+    @property
+    def width(self):
+        return self.orig_width
+
+    @property
+    def height(self):
+        return self.orig_height
+
+    def scale_box(self, box):
+        """将letterbox坐标系下的xyxy框映射回原图坐标"""
+        gain_x = self.orig_width / self.decoded_width
+        gain_y = self.orig_height / self.decoded_height
+        x1, y1, x2, y2 = box
+        x1 = (x1 - self.pad[0]) / self.ratio[0] * gain_x
+        x2 = (x2 - self.pad[0]) / self.ratio[0] * gain_x
+        y1 = (y1 - self.pad[1]) / self.ratio[1] * gain_y
+        y2 = (y2 - self.pad[1]) / self.ratio[1] * gain_y
+        return [
+            min(max(x1, 0), self.orig_width),
+            min(max(y1, 0), self.orig_height),
+            min(max(x2, 0), self.orig_width),
+            min(max(y2, 0), self.orig_height)
+        ]
+
+
+def preprocess_image(image_bytes, img_size=640, stride=32):
+    """解码并预处理图片，返回PreprocessedImage"""
+    image = Image.open(io.BytesIO(image_bytes))
+    orig_width, orig_height = image.size
+    if image.getexif().get(EXIF_ORIENTATION_TAG, 1) in (5, 6, 7, 8):
+        orig_width, orig_height = orig_height, orig_width
+
+    if image.format == 'JPEG':
+        # draft模式按1/2、1/4、1/8比例解码，得到不小于目标尺寸的最小图片
+        image.draft('RGB', (img_size, img_size))
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    array = np.asarray(image)
+    decoded_height, decoded_width = array.shape[:2]
+
+    # 固定输出为img_size的正方形，保证同一批次内图片形状一致
+    array, ratio, pad = letterbox(array, img_size, auto=False, stride=stride)
+    return PreprocessedImage(array, orig_width, orig_height, decoded_width, decoded_height, ratio, pad)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+高频查询的SQL
+
+db.py 中对应的方法和 migrations.py 中的 HOT_QUERIES（EXPLAIN检查）共用这里的语句，
+修改查询时两边自动保持一致。语句中的 {keyset} 为 pagination.keyset_condition() 返回的游标条件，
+{post_marks}、{author_marks} 为 IN 列表的占位符，使用前用 str.format 填入。
+"""
+
+# 帖子列表（get_posts、get_feed），按 (created_at, id) 倒序
+POSTS_PAGE = '''
+SELECT p.*, u.username FROM posts p
+JOIN users u ON p.user_id = u.id
+WHERE p.deleted_at IS NULL{keyset}
+ORDER BY p.created_at DESC, p.id DESC
+LIMIT %s OFFSET %s
+'''
+
+# 帖子流附加状态（_attach_feed_state）：当前用户点赞过的帖子
+FEED_LIKED_POSTS = 'SELECT post_id FROM likes WHERE user_id = %s AND post_id IN ({post_marks})'
+
+# 帖子流附加状态：当前用户关注的作者
+FEED_FOLLOWED_AUTHORS = 'SELECT following_id FROM follows WHERE follower_id = %s AND following_id IN ({author_marks})'
+
+# 帖子流附加状态：每个帖子最早的若干条评论（需要MySQL 8.0的窗口函数）
+FEED_FIRST_COMMENTS = '''
+SELECT id, post_id, user_id, username, content, created_at FROM (
+    SELECT c.*, u.username,
+           ROW_NUMBER() OVER (PARTITION BY c.post_id ORDER BY c.created_at ASC, c.id ASC) as row_num
+    FROM comments c
+    JOIN users u ON c.user_id = u.id
+    WHERE c.post_id IN ({post_marks})
+) ranked
+WHERE row_num <= %s
+ORDER BY post_id, row_num
+'''
+
+# 首页时间线中已写扩散的帖子
+HOME_TIMELINE_MATERIALIZED = '''
+SELECT p.*, u.username FROM home_timeline ht
+JOIN posts p ON ht.post_id = p.id
+JOIN users u ON p.user_id = u.id
+WHERE ht.user_id = %s AND p.deleted_at IS NULL{keyset}
+ORDER BY ht.created_at DESC, ht.post_id DESC
+LIMIT %s
+'''
+
+# 首页时间线中关注用户未扩散的帖子，读取时合并
+HOME_TIMELINE_PULLED = '''
+SELECT p.*, u.username FROM follows f
+JOIN posts p ON p.user_id = f.following_id
+JOIN users u ON p.user_id = u.id
+WHERE f.follower_id = %s AND p.fanned_out = 0 AND p.deleted_at IS NULL{keyset}
+ORDER BY p.created_at DESC, p.id DESC
+LIMIT %s
+'''
+
+RECOGNITION_HISTORY_PAGE = (
+    'SELECT * FROM recognition_results WHERE user_id = %s AND deleted_at IS NULL{keyset} '
+    'ORDER BY created_at DESC, id DESC LIMIT %s OFFSET %s'
+)
+
+ALBUM_IMAGES_PAGE = (
+    'SELECT * FROM album_images WHERE album_id = %s AND deleted_at IS NULL{keyset} '
+    'ORDER BY created_at DESC, id DESC LIMIT %s OFFSET %s'
+)
+
+USER_ALBUMS = 'SELECT * FROM albums WHERE user_id = %s ORDER BY created_at DESC'
+
+USER_ALBUMS_BY_CATEGORY = 'SELECT * FROM albums WHERE user_id = %s AND category = %s ORDER BY created_at DESC'
+
+USER_FEEDBACK_PAGE = (
+    'SELECT * FROM user_feedback WHERE user_id = %s{keyset} '
+    'ORDER BY created_at DESC, id DESC LIMIT %s OFFSET %s'
+)
+
+RECYCLE_BIN_PAGE = (
+    'SELECT * FROM recycle_bin WHERE user_id = %s{keyset} '
+    'ORDER BY deleted_at DESC, id DESC LIMIT %s OFFSET %s'
+)
+
+RECYCLE_BIN_PAGE_BY_TYPE = (
+    'SELECT * FROM recycle_bin WHERE user_id = %s AND item_type = %s{keyset} '
+    'ORDER BY deleted_at DESC, id DESC LIMIT %s OFFSET %s'
+)
+
+# 系统日志：在SELECT和ORDER之间按筛选条件拼接 AND ... 条件
+SYSTEM_LOGS_SELECT = 'SELECT * FROM system_logs WHERE 1=1'
+SYSTEM_LOGS_ORDER = ' ORDER BY created_at DESC, id DESC LIMIT %s OFFSET %s'
+
+# 按端点汇总的流量：{histogram_sums} 为各直方图列的 SUM，在WHERE和GROUP之间拼接时间条件
+TRAFFIC_BY_ENDPOINT_SELECT = '''
+SELECT endpoint, method,
+       SUM(request_count) as request_count,
+       SUM(total_response_time) as total_response_time,
+       SUM(error_count) as error_count,
+       {histogram_sums}
+FROM traffic_rollups
+WHERE granularity = 'day'
+'''
+TRAFFIC_BY_ENDPOINT_GROUP = ' GROUP BY endpoint, method ORDER BY request_count DESC LIMIT %s'
+
+# 分批删除过期的流量数据
+PRUNE_CHUNK = 'DELETE FROM {table} WHERE {condition} LIMIT %s'
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+识别结果缓存
+
+以图片内容哈希 + 模型版本 + 置信度/IOU阈值作为缓存键，用户重复上传同一张照片时
+直接返回缓存的识别结果和EXIF信息，不再解码图片和调用模型。
+内存缓存按占用字节数做LRU淘汰，可选SQLite持久化缓存。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_result_cache_key(image_bytes, model_version, conf, iou):
+    """根据图片内容和模型参数生成缓存键"""
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return f"{digest}:{model_version}:{conf}:{iou}"
+
+
+class RecognitionResultCache:
+    """识别结果缓存（内存LRU + 可选SQLite持久化）"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, persistent_path=None, ttl=7 * 86400):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, 序列化后的结果, UTF-8编码后的字节数)
+        self._size = 0
+        self._lock = threading.Lock()  # 保护内存缓存和统计
+        self._db_lock = threading.Lock()  # 保护共享的SQLite连接，持久化读写不占用内存缓存的锁
+        self._stats = {'hits': 0, 'misses': 0, 'persistent_hits': 0, 'evictions': 0}
+
+        self.persistent_path = persistent_path
+        self._conn = None
+        self._conn_pid = None
+        if persistent_path:
+            with self._db_lock:
+                self._connection().execute('''
+                CREATE TABLE IF NOT EXISTS recognition_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    expires_at INTEGER NOT NULL
+                )
+                ''')
+                self._conn.commit()
+
+    def _connection(self):
+        """返回当前进程的持久化缓存连接（fork出的子进程中重新连接），未启用时返回None（需持有_db_lock）"""
+        if not self.persistent_path:
+            return None
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.persistent_path, check_same_thread=False)
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _remove_memory(self, key):
+        """从内存缓存删除条目（需持有锁）"""
+        entry = self._data.pop(key, None)
+        if entry:
+            self._size -= entry[2]
+
+    def _set_memory(self, key, payload, expires_at):
+        """写入内存缓存并按字节数淘汰最久未使用的条目（需持有锁）"""
+        nbytes = len(payload.encode('utf-8'))
+        if nbytes > self.max_bytes:
+            return
+        self._remove_memory(key)
+        self._data[key] = (expires_at, payload, nbytes)
+        self._size += nbytes
+        while self._size > self.max_bytes and self._data:
+            _, (_, _, evicted) = self._data.popitem(last=False)
+            self._size -= evicted
+            self._stats['evictions'] += 1
+
+    def get(self, key):
+        """查询缓存，命中时返回结果字典的新副本，未命中返回None"""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[0] >= now:
+                self._data.move_to_end(key)
+                self._stats['hits'] += 1
+                return json.loads(entry[1])
+            if entry:
+                self._remove_memory(key)
+
+        row = None
+        if self.persistent_path:
+            try:
+                with self._db_lock:
+                    row = self._connection().execute(
+                        'SELECT payload, expires_at FROM recognition_cache WHERE cache_key = ?', (key,)
+                    ).fetchone()
+            except Exception as e:
+                print(f"读取识别结果持久化缓存失败: {e}")
+
+        with self._lock:
+            if row and row[1] >= now:
+                self._set_memory(key, row[0], row[1])
+                self._stats['hits'] += 1
+                self._stats['persistent_hits'] += 1
+                return json.loads(row[0])
+            self._stats['misses'] += 1
+            return None
+
+    def set(self, key, value):
+        """写入缓存，value需可JSON序列化"""
+        payload = json.dumps(value, ensure_ascii=False)
+        expires_at = int(time.time() + self.ttl)
+        with self._lock:
+            self._set_memory(key, payload, expires_at)
+        if self.persistent_path:
+            try:
+                with self._db_lock:
+                    conn = self._connection()
+                    conn.execute(
+                        'INSERT OR REPLACE INTO recognition_cache (cache_key, payload, expires_at) VALUES (?, ?, ?)',
+                        (key, payload, expires_at)
+                    )
+                    conn.commit()
+            except Exception as e:
+                print(f"写入识别结果持久化缓存失败: {e}")
+
+    def purge_expired(self):
+        """清理内存和持久化缓存中已过期的条目，返回删除的持久化条目数"""
+        now = time.time()
+        with self._lock:
+            for key in [key for key, entry in self._data.items() if entry[0] < now]:
+                self._remove_memory(key)
+        if not self.persistent_path:
+            return 0
+        with self._db_lock:
+            conn = self._connection()
+            deleted = conn.execute('DELETE FROM recognition_cache WHERE expires_at < ?', (int(now),)).rowcount
+            conn.commit()
+        return deleted
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(
+                self._stats,
+                entries=len(self._data),
+                size_bytes=self._size,
+                max_bytes=self.max_bytes,
+                hit_rate=round(self._stats['hits'] / lookups, 4) if lookups else 0,
+                persistent=bool(self.persistent_path)
+            )
@@ -0,0 +1,6 @@
+# -*- coding: UTF-8 -*-
+"""flower_frontend 的模块以顶层模块名互相导入，测试时把该目录加入sys.path"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,179 @@
+# -*- coding: UTF-8 -*-
+import pytest
+
+import db_pool
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class StubConnection:
+    """记录调用的假连接"""
+
+    def __init__(self, number, log):
+        self.number = number
+        self.log = log
+        self.closed = False
+        self.healthy = True
+        self.pings = 0
+
+    def ping(self, reconnect=True):
+        assert reconnect is False
+        self.pings += 1
+        if not self.healthy:
+            raise ConnectionError('连接已断开')
+
+    def commit(self):
+        self.log.append(('commit', self.number))
+
+    def rollback(self):
+        self.log.append(('rollback', self.number))
+
+    def close(self):
+        self.closed = True
+
+
+class Factory:
+    def __init__(self):
+        self.connections = []
+        self.log = []
+
+    def __call__(self):
+        conn = StubConnection(len(self.connections) + 1, self.log)
+        self.connections.append(conn)
+        return conn
+
+
+class Env:
+    """可控制的时间和进程号"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.pid = 100
+
+    def time(self):
+        return self.now
+
+    def getpid(self):
+        return self.pid
+
+
+@pytest.fixture
+def env(monkeypatch):
+    env = Env()
+    monkeypatch.setattr(db_pool.time, 'time', env.time)
+    monkeypatch.setattr(db_pool.os, 'getpid', env.getpid)
+    return env
+
+
+def make_pool(**kwargs):
+    factory = Factory()
+    options = dict(min_size=0, max_size=2, max_lifetime=3600, health_check_interval=30, timeout=0)
+    options.update(kwargs)
+    return ConnectionPool(factory, **options), factory
+
+
+def test_reuses_released_connection(env):
+    pool, factory = make_pool()
+    conn = pool.acquire()
+    conn.close()
+    conn = pool.acquire()
+    assert conn.number == 1
+    assert len(factory.connections) == 1
+    assert pool.get_stats()['reused'] == 1
+
+
+def test_timeout_when_exhausted(env):
+    pool, _ = make_pool(max_size=1)
+    held = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    held.close()
+    assert pool.get_stats()['timeouts'] == 1
+
+
+def test_forked_child_opens_its_own_connections(env):
+    pool, factory = make_pool()
+    inherited = pool.acquire()
+    idle = pool.acquire()
+    idle.close()
+
+    env.pid = 200  # fork之后的子进程
+    conn = pool.acquire()
+    assert conn.number == 3
+    stats = pool.get_stats()
+    assert stats['size'] == 1 and stats['in_use'] == 1
+
+    # 子进程关闭继承自父进程的连接时不能把它放进自己的连接池
+    inherited.close()
+    stats = pool.get_stats()
+    assert stats['idle'] == 0 and stats['in_use'] == 1
+    conn.close()
+    assert pool.get_stats()['idle'] == 1
+    assert not factory.connections[0].closed  # 父进程的连接只由父进程关闭
+
+
+def test_expired_connection_is_recycled(env):
+    pool, factory = make_pool(max_lifetime=60)
+    pool.acquire().close()
+    env.now += 61
+    conn = pool.acquire()
+    assert conn.number == 2
+    assert factory.connections[0].closed
+    assert pool.get_stats()['expired'] == 1
+
+    # 使用中过期的连接归还时直接关闭
+    env.now += 61
+    conn.close()
+    assert factory.connections[1].closed
+    stats = pool.get_stats()
+    assert stats['size'] == 0 and stats['expired'] == 2
+
+
+def test_health_check_pings_only_idle_connections(env):
+    pool, factory = make_pool(health_check_interval=30)
+    pool.acquire().close()
+    env.now += 10
+    pool.acquire().close()
+    assert factory.connections[0].pings == 0
+
+    env.now += 31
+    pool.acquire().close()
+    assert factory.connections[0].pings == 1
+
+    factory.connections[0].healthy = False
+    env.now += 31
+    conn = pool.acquire()
+    assert conn.number == 2
+    assert factory.connections[0].closed
+    assert pool.get_stats()['health_check_failures'] == 1
+    conn.close()
+
+
+def test_after_commit_runs_in_order_after_commit(env):
+    pool, factory = make_pool()
+    conn = pool.acquire()
+    conn.after_commit(lambda: factory.log.append('first'))
+    conn.after_commit(lambda: 1 / 0)  # 回调失败不影响后面的回调
+    conn.after_commit(lambda: factory.log.append('second'))
+    conn.commit()
+    assert factory.log == [('commit', 1), 'first', 'second']
+
+    # 回调只执行一次
+    conn.commit()
+    assert factory.log[-1] == ('commit', 1)
+    conn.close()
+
+
+def test_after_commit_discarded_on_rollback_and_close(env):
+    pool, factory = make_pool()
+    conn = pool.acquire()
+    conn.after_commit(lambda: factory.log.append('rolled back'))
+    conn.rollback()
+    conn.commit()
+    conn.after_commit(lambda: factory.log.append('closed'))
+    conn.close()
+
+    conn = pool.acquire()
+    conn.commit()
+    assert 'rolled back' not in factory.log
+    assert 'closed' not in factory.log
+    conn.close()
@@ -0,0 +1,56 @@
+# -*- coding: UTF-8 -*-
+import os
+import sys
+
+import pytest
+
+torch = pytest.importorskip('torch')
+import numpy as np  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from models.common import Detections  # noqa: E402
+
+NAMES = {0: 'rose', 1: 'tulip', 2: 'daisy'}
+
+
+def detections(rows):
+    pred = torch.tensor(rows, dtype=torch.float32).reshape(-1, 6)
+    im = np.zeros((32, 32, 3), dtype=np.uint8)
+    return Detections([im], [pred], ['a.jpg'], times=(), names=NAMES, shape=(1, 3, 32, 32))
+
+
+def box(n, conf, cls):
+    return [n, n, n + 1, n + 1, conf, cls]
+
+
+def test_topk_sorted_by_confidence():
+    results = detections([box(0, 0.5, 0), box(1, 0.9, 1), box(2, 0.7, 2)])
+    assert results.topk(2)[:, 4].tolist() == pytest.approx([0.9, 0.7])
+
+
+def test_topk_ties_keep_original_order():
+    results = detections([box(0, 0.8, 0), box(1, 0.8, 1), box(2, 0.8, 2), box(3, 0.9, 0)])
+    assert results.topk(None)[:, 0].tolist() == [3, 0, 1, 2]
+    assert results.topk(2)[:, 0].tolist() == [3, 0]
+
+
+def test_topk_larger_than_detections():
+    results = detections([box(0, 0.5, 0), box(1, 0.6, 1)])
+    assert results.topk(10).shape == (2, 6)
+    assert results.numpy(0, k=10)['name'] == ['tulip', 'rose']
+
+
+def test_empty_predictions():
+    results = detections([])
+    assert results.topk(1).shape == (0, 6)
+    assert results.best_per_class().shape == (0, 6)
+    r = results.numpy(0, k=1)
+    assert r['xyxy'].shape == (0, 4) and r['name'] == []
+
+
+def test_best_per_class_with_ties():
+    results = detections([box(0, 0.6, 0), box(1, 0.9, 1), box(2, 0.6, 0), box(3, 0.9, 0), box(4, 0.3, 2)])
+    best = results.best_per_class()
+    # 每类取置信度最高的一个，同分时取原顺序中靠前的一个，结果按置信度排序
+    assert best[:, 0].tolist() == [1, 3, 4]
+    assert best[:, 5].tolist() == [1, 0, 2]
@@ -0,0 +1,51 @@
+# -*- coding: UTF-8 -*-
+import pytest
+
+from hyperloglog import HyperLogLog
+
+
+def filled(values, p=12):
+    sketch = HyperLogLog(p)
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def test_empty_and_duplicates():
+    assert HyperLogLog().count() == 0
+    sketch = filled(['1.2.3.4'] * 100)
+    assert sketch.count() == 1
+
+
+@pytest.mark.parametrize('cardinality', [100, 1000, 10000, 100000])
+def test_error_bound(cardinality):
+    sketch = filled(f'10.0.{i // 256}.{i % 256}-{i}' for i in range(cardinality))
+    # p=12时标准误差约1.6%，取4倍标准误差作为上限
+    assert abs(sketch.count() - cardinality) <= 0.065 * cardinality
+
+
+def test_merge_equals_union():
+    a = filled(f'ip-{i}' for i in range(0, 6000))
+    b = filled(f'ip-{i}' for i in range(4000, 10000))
+    union = filled(f'ip-{i}' for i in range(0, 10000))
+    a.merge(b)
+    assert a.registers == union.registers
+    assert abs(a.count() - 10000) <= 650
+
+
+def test_merge_rejects_different_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(12).merge(HyperLogLog(10))
+
+
+def test_serialize_round_trip():
+    sketch = filled(f'ip-{i}' for i in range(5000))
+    restored = HyperLogLog(registers=sketch.to_bytes())
+    assert restored.to_bytes() == sketch.to_bytes()
+    assert restored.count() == sketch.count()
+    restored.add('ip-5000')
+    assert restored.count() >= sketch.count()
+
+
+def test_wrong_register_length_starts_empty():
+    assert HyperLogLog(registers=b'\x01' * 10).count() == 0
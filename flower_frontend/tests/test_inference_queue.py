@@ -0,0 +1,49 @@
+# -*- coding: UTF-8 -*-
+import pytest
+
+from inference_queue import InferenceBatcher, InferenceBatcherClosed
+
+
+def infer_upper(images):
+    if 'bad' in images:
+        raise ValueError('无法识别的图片')
+    return [image.upper() for image in images]
+
+
+def test_bad_image_fails_alone_and_stats_count_each_call_once():
+    batcher = InferenceBatcher(infer_upper, max_batch_size=8, batch_window_ms=50)
+    futures = batcher.submit_many(['a', 'bad', 'c'])
+
+    assert futures[0].result(timeout=5) == 'A'
+    assert futures[2].result(timeout=5) == 'C'
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=5)
+    batcher.close()
+
+    stats = batcher.get_stats()
+    # 失败的3张批次不计入，逐张重试的3次推理各计一次
+    assert stats['total_batches'] == 3
+    assert stats['total_images'] == 3
+    assert stats['batch_size_histogram'] == {'1': 3}
+    assert stats['failed_batches'] == 2
+    assert stats['avg_batch_size'] == 1
+
+
+def test_successful_batch_stats():
+    batcher = InferenceBatcher(infer_upper, max_batch_size=8, batch_window_ms=50)
+    futures = batcher.submit_many(['a', 'b'])
+    assert [f.result(timeout=5) for f in futures] == ['A', 'B']
+    batcher.close()
+
+    stats = batcher.get_stats()
+    assert stats['total_batches'] == 1
+    assert stats['total_images'] == 2
+    assert stats['batch_size_histogram'] == {'2': 1}
+    assert stats['failed_batches'] == 0
+
+
+def test_submit_after_close_raises():
+    batcher = InferenceBatcher(infer_upper)
+    batcher.close()
+    with pytest.raises(InferenceBatcherClosed):
+        batcher.submit('a')
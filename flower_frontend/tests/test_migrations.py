@@ -0,0 +1,31 @@
+# -*- coding: UTF-8 -*-
+from migrations import HOT_QUERIES, MIGRATIONS, analyze_plan
+
+
+def test_analyze_plan_flags_scans_filesort_and_temporary():
+    plan = [
+        {'table': 'p', 'type': 'index', 'Extra': 'Using where'},
+        {'table': 'u', 'type': 'eq_ref', 'Extra': None},
+        {'table': 'traffic_rollups', 'type': 'ALL', 'Extra': 'Using where; Using temporary; Using filesort'},
+    ]
+    assert analyze_plan(plan) == [
+        ('p', '全索引扫描'),
+        ('traffic_rollups', '全表扫描'),
+        ('traffic_rollups', '文件排序'),
+        ('traffic_rollups', '临时表'),
+    ]
+
+
+def test_analyze_plan_accepts_clean_plan():
+    assert analyze_plan([{'table': 'p', 'type': 'range', 'Extra': 'Using index condition'}]) == []
+
+
+def test_hot_queries_have_no_unfilled_placeholders():
+    for name, (sql, params) in HOT_QUERIES.items():
+        assert '{' not in sql, name
+        assert sql.count('%s') == len(params), name
+
+
+def test_migration_versions_are_unique():
+    versions = [version for version, _, _ in MIGRATIONS]
+    assert len(versions) == len(set(versions))
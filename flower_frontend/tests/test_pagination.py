@@ -0,0 +1,72 @@
+# -*- coding: UTF-8 -*-
+import base64
+
+import pytest
+
+from pagination import decode_cursor, encode_cursor, keyset_condition, next_cursor
+
+
+def raw_cursor(text):
+    return base64.urlsafe_b64encode(text.encode('ascii')).decode('ascii').rstrip('=')
+
+
+def test_round_trip():
+    for timestamp, row_id in [(0, 0), (1700000000, 1), (1700000000, 987654321)]:
+        cursor = encode_cursor(timestamp, row_id)
+        assert '=' not in cursor
+        assert decode_cursor(cursor) == (timestamp, row_id)
+
+
+@pytest.mark.parametrize('cursor', [
+    'garbage!!',
+    '游标',
+    encode_cursor(1700000000, 5)[:-3],
+    raw_cursor('1700000000'),
+    raw_cursor('1700000000:5:6'),
+    raw_cursor('abc:5'),
+    raw_cursor('-1:5'),
+    raw_cursor(f'1700000000:{1 << 63}'),
+])
+def test_tampered_cursor_raises_value_error(cursor):
+    # 接口把ValueError转换为400
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+    with pytest.raises(ValueError):
+        keyset_condition(cursor)
+
+
+def test_keyset_condition():
+    assert keyset_condition(None) == ('', [])
+    condition, params = keyset_condition(encode_cursor(100, 7), 'p.created_at', 'p.id')
+    assert condition == ' AND (p.created_at < %s OR (p.created_at = %s AND p.id < %s))'
+    assert params == [100, 100, 7]
+
+
+def page(rows, limit, cursor=None):
+    """按keyset_condition的语义在内存中取一页，rows已按 (created_at, id) 倒序排列"""
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        rows = [r for r in rows if r['created_at'] < timestamp
+                or (r['created_at'] == timestamp and r['id'] < row_id)]
+    return rows[:limit]
+
+
+def test_equal_timestamps_are_split_by_id():
+    rows = [{'id': i, 'created_at': 1000 if i <= 7 else 2000} for i in range(1, 11)]
+    rows.sort(key=lambda r: (r['created_at'], r['id']), reverse=True)
+
+    seen, cursor = [], None
+    while True:
+        current = page(rows, 3, cursor)
+        seen.extend(r['id'] for r in current)
+        cursor = next_cursor(current, 3)
+        if cursor is None:
+            break
+    assert seen == [r['id'] for r in rows]
+
+
+def test_next_cursor_only_for_full_pages():
+    rows = [{'id': 2, 'created_at': 10}, {'id': 1, 'created_at': 10}]
+    assert next_cursor(rows, 3) is None
+    assert next_cursor([], 3) is None
+    assert decode_cursor(next_cursor(rows, 2)) == (10, 1)
@@ -0,0 +1,116 @@
+# -*- coding: UTF-8 -*-
+import pytest
+
+import permission_cache
+from permission_cache import PermissionCache
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(permission_cache.time, 'monotonic', clock)
+    return clock
+
+
+class Roles:
+    """模拟数据库中的用户角色，记录加载次数"""
+
+    def __init__(self):
+        self.roles = {1: 'user'}
+        self.version = 0
+        self.loads = 0
+
+    def load(self, user_id):
+        self.loads += 1
+        return {'roles': frozenset([self.roles[user_id]]), 'permissions': frozenset()}
+
+    def update_role(self, user_id, role):
+        self.roles[user_id] = role
+        self.version += 1
+
+
+def roles_of(cache, db, user_id=1):
+    return cache.get_or_load(user_id, db.load)['roles']
+
+
+def test_invalidate_stops_serving_stale_entry(clock):
+    db = Roles()
+    cache = PermissionCache(ttl=30)
+    assert roles_of(cache, db) == {'user'}
+    assert roles_of(cache, db) == {'user'}
+    assert db.loads == 1
+
+    db.update_role(1, 'admin')
+    cache.invalidate(1)
+    assert roles_of(cache, db) == {'admin'}
+    assert cache.get_stats()['invalidations'] == 1
+
+
+def test_load_started_before_invalidation_is_not_cached(clock):
+    db = Roles()
+    cache = PermissionCache(ttl=30)
+
+    def slow_load(user_id):
+        access = db.load(user_id)
+        # 加载期间角色被修改并使缓存失效
+        db.update_role(1, 'admin')
+        cache.invalidate(1)
+        return access
+
+    assert cache.get_or_load(1, slow_load)['roles'] == {'user'}
+    assert roles_of(cache, db) == {'admin'}
+
+
+def test_other_instance_clears_on_shared_version_change(clock):
+    db = Roles()
+    worker_a = PermissionCache(ttl=30, version_fn=lambda: db.version, version_check_interval=1.0)
+    worker_b = PermissionCache(ttl=30, version_fn=lambda: db.version, version_check_interval=1.0)
+    assert roles_of(worker_a, db) == {'user'}
+    assert roles_of(worker_b, db) == {'user'}
+
+    # worker_a所在进程修改角色：本进程立即失效，共享版本号递增
+    db.update_role(1, 'admin')
+    worker_a.invalidate(1)
+    assert roles_of(worker_a, db) == {'admin'}
+
+    # worker_b在下一次检查版本号之前仍使用旧条目，检查后清空
+    assert roles_of(worker_b, db) == {'user'}
+    clock.now += 1.0
+    assert roles_of(worker_b, db) == {'admin'}
+    assert worker_b.get_stats()['remote_invalidations'] == 1
+
+
+def test_without_version_source_other_instance_expires_after_ttl(clock):
+    db = Roles()
+    worker_a = PermissionCache(ttl=30)
+    worker_b = PermissionCache(ttl=30)
+    roles_of(worker_a, db)
+    roles_of(worker_b, db)
+
+    db.update_role(1, 'admin')
+    worker_a.invalidate(1)
+    assert roles_of(worker_a, db) == {'admin'}
+    clock.now += 29
+    assert roles_of(worker_b, db) == {'user'}
+    clock.now += 2
+    assert roles_of(worker_b, db) == {'admin'}
+
+
+def test_version_source_failure_keeps_cache(clock):
+    db = Roles()
+
+    def broken():
+        raise RuntimeError('数据库不可用')
+
+    cache = PermissionCache(ttl=30, version_fn=broken, version_check_interval=0)
+    roles_of(cache, db)
+    roles_of(cache, db)
+    assert db.loads == 1
@@ -0,0 +1,97 @@
+# -*- coding: UTF-8 -*-
+import json
+
+import pytest
+
+import result_cache
+from result_cache import RecognitionResultCache
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache.time, 'time', clock)
+    return clock
+
+
+def payload_size(value):
+    return len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
+
+def test_size_counts_utf8_bytes(clock):
+    cache = RecognitionResultCache(max_bytes=1000)
+    value = {'name': '玫瑰'}
+    cache.set('a', value)
+    assert cache.get_stats()['size_bytes'] == payload_size(value)
+    assert payload_size(value) > len(json.dumps(value, ensure_ascii=False))
+
+
+def test_byte_budget_evicts_least_recently_used(clock):
+    value = {'name': 'x' * 20}
+    size = payload_size(value)
+    cache = RecognitionResultCache(max_bytes=size * 2)
+    cache.set('a', value)
+    cache.set('b', value)
+    assert cache.get('a') == value  # a变为最近使用
+    cache.set('c', value)
+
+    stats = cache.get_stats()
+    assert stats['evictions'] == 1
+    assert stats['entries'] == 2
+    assert stats['size_bytes'] == size * 2
+    assert cache.get('b') is None
+    assert cache.get('a') == value
+    assert cache.get('c') == value
+
+
+def test_entry_larger_than_budget_is_not_kept(clock):
+    cache = RecognitionResultCache(max_bytes=10)
+    cache.set('big', {'name': 'x' * 50})
+    assert cache.get('big') is None
+    assert cache.get_stats()['size_bytes'] == 0
+
+
+def test_ttl_expiry_in_memory(clock):
+    cache = RecognitionResultCache(ttl=60)
+    cache.set('a', {'n': 1})
+    clock.now += 59
+    assert cache.get('a') == {'n': 1}
+    clock.now += 2
+    assert cache.get('a') is None
+    assert cache.get_stats()['entries'] == 0
+
+
+def test_ttl_expiry_and_purge_in_persistent_cache(clock, tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = RecognitionResultCache(ttl=60, persistent_path=path)
+    cache.set('old', {'n': 1})
+    clock.now += 30
+    cache.set('new', {'n': 2})
+
+    # 另一个进程（新实例）从持久化缓存读取
+    other = RecognitionResultCache(ttl=60, persistent_path=path)
+    assert other.get('old') == {'n': 1}
+    assert other.get_stats()['persistent_hits'] == 1
+
+    clock.now += 31
+    assert RecognitionResultCache(ttl=60, persistent_path=path).get('old') is None
+
+    assert cache.purge_expired() == 1
+    assert cache.get_stats()['entries'] == 1
+    assert RecognitionResultCache(ttl=60, persistent_path=path).get('new') == {'n': 2}
+    assert cache.purge_expired() == 0
+
+
+def test_get_returns_independent_copy(clock):
+    cache = RecognitionResultCache()
+    cache.set('a', {'detections': []})
+    cache.get('a')['detections'].append('x')
+    assert cache.get('a') == {'detections': []}
@@ -0,0 +1,57 @@
+# -*- coding: UTF-8 -*-
+from traffic_rollup import HISTOGRAM_COLUMNS, LATENCY_BUCKETS_MS, bucket_index, percentiles, rollup_rows, summarize
+
+
+def histogram(**counts):
+    values = [0] * len(HISTOGRAM_COLUMNS)
+    for column, count in counts.items():
+        values[HISTOGRAM_COLUMNS.index(column)] = count
+    return values
+
+
+def test_bucket_index():
+    assert bucket_index(0) == 0
+    assert bucket_index(5) == 0
+    assert bucket_index(6) == 1
+    assert bucket_index(10000) == len(LATENCY_BUCKETS_MS) - 1
+    assert bucket_index(10001) == len(LATENCY_BUCKETS_MS)
+
+
+def test_percentiles_interpolate_within_bucket():
+    # 100个请求都在 (50, 100] 毫秒区间
+    result = percentiles(histogram(h4=100))
+    assert result['p50'] == 75.0
+    assert result['p99'] == 99.5
+    assert result['percentiles_lower_bound'] == []
+
+
+def test_open_top_bucket_reported_as_lower_bound():
+    result = percentiles(histogram(h0=90, h11=10))
+    assert result['p50'] == 2.8
+    assert result['p95'] == 10000
+    assert result['p99'] == 10000
+    assert result['percentiles_lower_bound'] == ['p95', 'p99']
+
+
+def test_empty_histogram():
+    result = percentiles(histogram())
+    assert result == {'p50': None, 'p95': None, 'p99': None, 'percentiles_lower_bound': []}
+
+
+def test_rollup_rows_and_summarize():
+    created_at = 1_700_000_000
+    rows = [
+        ('2023-11-14', 22, '/api/detect', 'POST', '1.1.1.1', None, 200, 40, created_at),
+        ('2023-11-14', 22, '/api/detect', 'POST', '1.1.1.2', None, 500, 20000, created_at + 1),
+    ]
+    rollups = rollup_rows(rows)
+    minute = [r for r in rollups if r[0] == 'minute']
+    assert len(minute) == 2  # 状态码不同，分两组
+    ok = next(r for r in minute if r[4] == 200)
+    assert ok[5:8] == (1, 0, 40)
+
+    summary = summarize(dict(request_count=2, error_count=1, total_response_time=20040,
+                             **dict(zip(HISTOGRAM_COLUMNS, histogram(h3=1, h11=1)))))
+    assert summary['avg_response_time'] == 10020
+    assert summary['p99'] == 10000
+    assert summary['percentiles_lower_bound'] == ['p95', 'p99']
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+首页时间线重建
+
+重新统计用户的粉丝数，并按当前的写扩散阈值为用户重新写入自己和关注用户的最近帖子。
+上线时间线功能时用于回填已有数据，调整 FLOWER_TIMELINE_FANOUT_THRESHOLD 后也需要执行一次。
+
+在flower_frontend目录下运行：
+    python timeline.py                          # 重建所有用户的时间线
+    python timeline.py --user-id 42             # 只重建一个用户的时间线
+    python timeline.py --per-author 500         # 每个作者最多写入的帖子数
+"""
+import argparse
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='重建首页时间线')
+    parser.add_argument('--user-id', type=int, default=None, help='只重建指定用户的时间线')
+    parser.add_argument('--per-author', type=int, default=None, help='每个作者最多写入的帖子数')
+    opt = parser.parse_args()
+
+    from db import rebuild_home_timelines
+
+    start = time.time()
+    result = rebuild_home_timelines(opt.user_id, opt.per_author)
+    print(f"已重建 {result['users']} 个用户的时间线，写入 {result['rows']} 条记录，耗时 {time.time() - start:.1f} 秒")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+访问流量缓冲写入
+
+请求线程只把访问记录追加到内存缓冲区，由后台线程定时（或缓冲区达到批量大小时）
+一次性批量写入数据库并增量更新每日汇总，记录访问日志不再占用请求的响应时间。
+缓冲区满时丢弃新记录并计数，数据库故障不会拖垮请求。
+写入线程还会按maintenance_interval定期执行maintenance_fn（如清理过期的访问记录）。
+"""
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+
+class TrafficBuffer:
+    """访问记录缓冲区，flush_fn接收记录列表并批量写入"""
+
+    def __init__(self, flush_fn, batch_size=500, flush_interval=2.0, max_buffer=50000,
+                 maintenance_fn=None, maintenance_interval=3600):
+        self.flush_fn = flush_fn
+        self.maintenance_fn = maintenance_fn
+        self.maintenance_interval = maintenance_interval
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()  # 保证同一时间只有一个线程在写数据库
+        self._worker = None
+        self._worker_pid = None
+        self._stats = {'recorded': 0, 'flushed': 0, 'dropped': 0, 'batches': 0, 'failed_batches': 0, 'flush_ms': 0.0}
+        atexit.register(self.flush)
+
+    def _ensure_worker(self):
+        """按需启动写入线程（fork出的子进程中会重新启动，父进程缓冲区中的记录由父进程负责写入）"""
+        pid = os.getpid()
+        if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+                return
+            if self._worker_pid != pid:
+                self._buffer = deque()
+                self._wakeup = threading.Event()
+                self._flush_lock = threading.Lock()
+            self._worker = threading.Thread(target=self._run, name='traffic-flusher', daemon=True)
+            self._worker_pid = pid
+            self._worker.start()
+
+    def record(self, endpoint, method, ip_address=None, user_id=None, response_status=200, response_time=0):
+        """追加一条访问记录，不访问数据库"""
+        self._ensure_worker()
+        now = time.time()
+        local = time.localtime(now)
+        row = (time.strftime('%Y-%m-%d', local), local.tm_hour, endpoint or '', method, ip_address, user_id,
+               response_status, response_time, int(now))
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self._stats['dropped'] += 1
+                return
+            self._buffer.append(row)
+            self._stats['recorded'] += 1
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def _run(self):
+        next_maintenance = time.monotonic() + self.maintenance_interval
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            if self.maintenance_fn is not None and time.monotonic() >= next_maintenance:
+                next_maintenance = time.monotonic() + self.maintenance_interval
+                try:
+                    self.maintenance_fn()
+                except Exception as e:
+                    print(f"访问记录维护任务失败: {e}")
+
+    def flush(self):
+        """把缓冲区中的记录分批写入数据库，返回写入的条数"""
+        if self._worker_pid is not None and self._worker_pid != os.getpid():
+            return 0
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                if not batch:
+                    return written
+                start = time.perf_counter()
+                try:
+                    self.flush_fn(batch)
+                    written += len(batch)
+                    with self._lock:
+                        self._stats['flushed'] += len(batch)
+                        self._stats['batches'] += 1
+                except Exception as e:
+                    # 写入失败的批次直接丢弃，避免数据库故障时缓冲区无限堆积
+                    with self._lock:
+                        self._stats['failed_batches'] += 1
+                        self._stats['dropped'] += len(batch)
+                    print(f"批量写入访问记录失败: {e}")
+                with self._lock:
+                    self._stats['flush_ms'] += (time.perf_counter() - start) * 1000
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats, flush_ms=round(self._stats['flush_ms'], 2), buffered=len(self._buffer))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+访问流量汇总
+
+访问记录批量写入时，同时按分钟、小时、天三种粒度累加到 traffic_rollups 表
+（按端点、请求方法、状态码分组），响应时间记录为固定区间的直方图，
+管理后台从汇总表读取请求数和p50/p95/p99响应时间，不再扫描原始访问记录。
+"""
+import time
+
+# 汇总粒度 -> 时间段长度（秒）
+GRANULARITIES = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+# 响应时间直方图各区间的上界（毫秒），最后一个区间为超过10秒的请求
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+HISTOGRAM_COLUMNS = tuple(f'h{i}' for i in range(len(LATENCY_BUCKETS_MS) + 1))
+
+
+def bucket_index(response_time):
+    """返回响应时间（毫秒）所在的直方图区间"""
+    for i, upper in enumerate(LATENCY_BUCKETS_MS):
+        if response_time <= upper:
+            return i
+    return len(LATENCY_BUCKETS_MS)
+
+
+def bucket_start(created_at, granularity):
+    """返回时间戳所在时间段的起始时间戳（小时和天按本地时间对齐）"""
+    if granularity == 'minute':
+        return created_at - created_at % 60
+    local = time.localtime(created_at)
+    if granularity == 'hour':
+        return int(time.mktime((local.tm_year, local.tm_mon, local.tm_mday, local.tm_hour, 0, 0, 0, 0, -1)))
+    return int(time.mktime((local.tm_year, local.tm_mon, local.tm_mday, 0, 0, 0, 0, 0, -1)))
+
+
+def date_to_timestamp(date_str):
+    """将 'YYYY-MM-DD' 转换为当天0点的时间戳"""
+    return int(time.mktime(time.strptime(date_str, '%Y-%m-%d')))
+
+
+def rollup_rows(rows):
+    """把一批访问记录汇总为 traffic_rollups 的upsert参数列表
+
+    rows中每一项为 (date, hour, endpoint, method, ip_address, user_id, response_status, response_time, created_at)，
+    返回的每一项为 (granularity, bucket_start, endpoint, method, response_status,
+    request_count, error_count, total_response_time, h0, h1, ...)。
+    """
+    groups = {}
+    for _, _, endpoint, method, _, _, response_status, response_time, created_at in rows:
+        response_time = response_time or 0
+        index = bucket_index(response_time)
+        for granularity in GRANULARITIES:
+            key = (granularity, bucket_start(created_at, granularity), endpoint, method, response_status)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = [0, 0, 0.0] + [0] * len(HISTOGRAM_COLUMNS)
+            group[0] += 1
+            group[1] += response_status >= 400
+            group[2] += response_time
+            group[3 + index] += 1
+    return [key + tuple(values) for key, values in sorted(groups.items())]
+
+
+def percentiles(histogram, quantiles=(50, 95, 99)):
+    """根据直方图估计响应时间分位数（区间内线性插值），返回 {'p50': 毫秒, ..., 'percentiles_lower_bound': [...]}
+
+    最后一个区间没有上界，落在其中的分位数无法估计，取值为该区间的下界，
+    并在 percentiles_lower_bound 中列出（表示实际值 >= 该值）。
+    """
+    total = sum(histogram)
+    result = {'percentiles_lower_bound': []}
+    for q in quantiles:
+        key = f'p{q}'
+        if not total:
+            result[key] = None
+            continue
+        target = total * q / 100.0
+        seen = 0
+        for i, count in enumerate(histogram):
+            if count and seen + count >= target:
+                lower = LATENCY_BUCKETS_MS[i - 1] if i > 0 else 0
+                if i == len(LATENCY_BUCKETS_MS):
+                    result[key] = lower
+                    result['percentiles_lower_bound'].append(key)
+                else:
+                    upper = LATENCY_BUCKETS_MS[i]
+                    result[key] = round(lower + (upper - lower) * (target - seen) / count, 1)
+                break
+            seen += count
+    return result
+
+
+def summarize(row):
+    """把汇总查询的结果行（含h0...列）转换为带平均值和分位数的字典"""
+    histogram = [int(row.pop(column) or 0) for column in HISTOGRAM_COLUMNS]
+    request_count = int(row.get('request_count') or 0)
+    total_response_time = float(row.pop('total_response_time') or 0)
+    row['request_count'] = request_count
+    row['error_count'] = int(row.get('error_count') or 0)
+    row['avg_response_time'] = round(total_response_time / request_count, 2) if request_count else 0
+    row.update(percentiles(histogram))
+    return row
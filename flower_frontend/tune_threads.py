@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+推理线程数自动调优
+
+在样例图片上对不同的 (worker进程数, 每个进程的推理线程数) 组合做吞吐测试，
+每个组合启动对应数量的进程同时推理，统计总吞吐（张/秒），推荐吞吐最高的配置。
+
+在flower_frontend目录下运行：
+    python tune_threads.py --weights ../testflowers.pt --source ../data/images --duration 20
+"""
+import argparse
+import glob
+import multiprocessing as mp
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+YOLO_ROOT = os.path.dirname(BASE_DIR)
+for path in (BASE_DIR, YOLO_ROOT):
+    if path not in sys.path:
+        sys.path.append(path)
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def find_images(source):
+    """返回source目录（或单个文件）中的图片路径"""
+    if os.path.isfile(source):
+        return [source]
+    return sorted(p for p in glob.glob(os.path.join(source, '*')) if p.lower().endswith(IMAGE_SUFFIXES))
+
+
+def candidate_configs(cpu_count, max_workers=None):
+    """生成候选组合：worker数取1、2、4…，每个worker的线程数取 CPU核数/worker数 及其一半"""
+    configs = []
+    workers = 1
+    while workers <= (max_workers or cpu_count):
+        threads = max(1, cpu_count // workers)
+        for t in sorted({threads, max(1, threads // 2)}, reverse=True):
+            configs.append((workers, t))
+        workers *= 2
+    return configs
+
+
+def _benchmark_worker(weights, image_paths, img_size, batch_size, threads, duration, barrier, results):
+    """单个测试进程：按指定线程数加载模型，与其他进程同时开始推理，返回推理张数和耗时"""
+    from utils.torch_utils import set_inference_threads
+    set_inference_threads(intra_op=threads, inter_op=1, opencv=1)
+
+    from model_registry import ModelRegistry
+    from preprocess import preprocess_image
+
+    model = ModelRegistry(img_size=img_size, device='cpu').load('tune', weights).model
+    arrays = []
+    for path in image_paths:
+        with open(path, 'rb') as f:
+            arrays.append(preprocess_image(f.read(), img_size).array)
+    batches = [arrays[i:i + batch_size] for i in range(0, len(arrays), batch_size)]
+
+    barrier.wait()
+    start = time.perf_counter()
+    count, i = 0, 0
+    while time.perf_counter() - start < duration:
+        batch = batches[i % len(batches)]
+        model(batch, size=img_size)
+        count += len(batch)
+        i += 1
+    results.put((count, time.perf_counter() - start))
+
+
+def benchmark(weights, image_paths, workers, threads, img_size=640, batch_size=1, duration=10):
+    """测试一个组合，返回所有进程的总吞吐（张/秒）"""
+    ctx = mp.get_context('spawn')
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=_benchmark_worker,
+                    args=(weights, image_paths, img_size, batch_size, threads, duration, barrier, results))
+        for _ in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    throughput = 0.0
+    for _ in procs:
+        count, elapsed = results.get()
+        throughput += count / elapsed
+    for p in procs:
+        p.join()
+    return throughput
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description='测试不同worker数和推理线程数组合的识别吞吐')
+    parser.add_argument('--weights', default=os.path.join(YOLO_ROOT, 'testflowers.pt'), help='模型权重')
+    parser.add_argument('--source', default=os.path.join(YOLO_ROOT, 'data', 'images'), help='样例图片目录')
+    parser.add_argument('--img-size', type=int, default=640, help='模型输入尺寸')
+    parser.add_argument('--batch-size', type=int, default=1, help='每次推理的图片数')
+    parser.add_argument('--duration', type=float, default=10, help='每个组合的测试时长（秒）')
+    parser.add_argument('--cpus', type=int, default=os.cpu_count() or 1, help='可用CPU核数')
+    parser.add_argument('--max-workers', type=int, default=None, help='最多测试的worker数')
+    return parser.parse_args()
+
+
+def main(opt):
+    image_paths = find_images(opt.source)
+    if not image_paths:
+        sys.exit(f'{opt.source} 中没有找到图片')
+
+    results = []
+    print(f"样例图片 {len(image_paths)} 张，CPU {opt.cpus} 核，每个组合测试 {opt.duration:g} 秒")
+    print(f"{'workers':>8} {'threads':>8} {'images/s':>10}")
+    for workers, threads in candidate_configs(opt.cpus, opt.max_workers):
+        throughput = benchmark(opt.weights, image_paths, workers, threads,
+                               opt.img_size, opt.batch_size, opt.duration)
+        results.append((throughput, workers, threads))
+        print(f"{workers:>8} {threads:>8} {throughput:>10.2f}")
+
+    throughput, workers, threads = max(results)
+    print(f"\n推荐配置：{workers} 个worker，每个worker {threads} 个推理线程（{throughput:.2f} 张/秒）")
+    print(f"FLOWER_WORKERS={workers} FLOWER_INTRA_OP_THREADS={threads} gunicorn -c gunicorn.conf.py app:app")
+
+
+if __name__ == '__main__':
+    main(parse_opt())
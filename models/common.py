@@ -15,7 +15,6 @@ from urllib.parse import urlparse
 
 import cv2
 import numpy as np
-import pandas as pd
 import requests
 import torch
 import torch.nn as nn
@@ -1026,6 +1025,9 @@ class Detections:
 
         Example: print(results.pandas().xyxy[0]).
         """
+        import pandas as pd  # imported lazily, only needed for DataFrame output
+
+        pd.options.display.max_columns = 10
         new = copy(self)  # return copy
         ca = "xmin", "ymin", "xmax", "ymax", "confidence", "class", "name"  # xyxy columns
         cb = "xcenter", "ycenter", "width", "height", "confidence", "class", "name"  # xywh columns
@@ -1034,6 +1036,34 @@ class Detections:
             setattr(new, k, [pd.DataFrame(x, columns=c) for x in a])
         return new
 
+    def topk(self, k=1, i=0):
+        """Returns the k highest-confidence detections of image i as an (n, 6) tensor (xyxy, conf, cls), k=None for all.
+
+        Ties keep their original (NMS) order, so results are deterministic. Example: best = results.topk(1, i=0)
+        """
+        pred = self.pred[i]
+        k = pred.shape[0] if k is None else min(k, pred.shape[0])
+        order = np.argsort(-pred[:, 4].cpu().numpy(), kind="stable")[:k]  # stable descending sort, torch>=1.8 compatible
+        return pred[torch.from_numpy(order).to(pred.device)]
+
+    def best_per_class(self, i=0):
+        """Returns the highest-confidence detection of each class in image i as an (n, 6) tensor sorted by confidence.
+
+        Example: for *xyxy, conf, cls in results.best_per_class(0):
+        """
+        pred = self.topk(None, i)
+        _, first = np.unique(pred[:, 5].cpu().numpy(), return_index=True)  # first (best) row of each class
+        return pred[torch.from_numpy(np.sort(first)).to(pred.device)]
+
+    def numpy(self, i=0, k=None):
+        """Returns detections of image i as numpy arrays sorted by confidence, optionally limited to the top k.
+
+        Example: r = results.numpy(0, k=5); r['xyxy'], r['confidence'], r['class'], r['name']
+        """
+        pred = self.topk(k, i).cpu().numpy()
+        cls = pred[:, 5].astype(int)
+        return {"xyxy": pred[:, :4], "confidence": pred[:, 4], "class": cls, "name": [self.names[c] for c in cls]}
+
     def tolist(self):
         """Converts a Detections object into a list of individual detection results for iteration.
 
@@ -146,6 +146,45 @@ def select_device(device="", batch_size=0, newline=True):
     return torch.device(arg)
 
 
+def set_inference_threads(intra_op=None, inter_op=None, opencv=None, omp=None):
+    """Sets per-process CPU thread counts for torch intra/inter-op, OpenCV and OpenMP; returns the effective settings.
+
+    Running several inference processes with default thread counts oversubscribes the cores, so each process should get
+    roughly cpu_count / processes intra-op threads. None falls back to the YOLOv5_INTRA_OP_THREADS,
+    YOLOv5_INTER_OP_THREADS, YOLOv5_OPENCV_THREADS and YOLOv5_OMP_THREADS environment variables, and leaves the
+    setting unchanged if those are unset. OMP_NUM_THREADS only affects OpenMP runtimes initialized afterwards.
+
+    Example: set_inference_threads(intra_op=4, inter_op=1, opencv=1)
+    """
+    import cv2
+
+    def from_env(value, name):
+        return value if value is not None else (int(os.environ[name]) if os.getenv(name) else None)
+
+    intra_op = from_env(intra_op, "YOLOv5_INTRA_OP_THREADS")
+    inter_op = from_env(inter_op, "YOLOv5_INTER_OP_THREADS")
+    opencv = from_env(opencv, "YOLOv5_OPENCV_THREADS")
+    omp = from_env(omp, "YOLOv5_OMP_THREADS")
+
+    if omp is not None or intra_op is not None:
+        os.environ["OMP_NUM_THREADS"] = str(omp if omp is not None else intra_op)
+    if intra_op is not None:
+        torch.set_num_threads(max(1, intra_op))
+    if inter_op is not None and torch.get_num_interop_threads() != inter_op:
+        try:
+            torch.set_num_interop_threads(max(1, inter_op))
+        except RuntimeError as e:  # can only be set once, before any inter-op parallel work has started
+            LOGGER.warning(f"WARNING ⚠️ could not set inter-op threads to {inter_op}: {e}")
+    if opencv is not None:
+        cv2.setNumThreads(opencv)
+    return {
+        "intra_op": torch.get_num_threads(),
+        "inter_op": torch.get_num_interop_threads(),
+        "opencv": cv2.getNumThreads(),
+        "omp": os.getenv("OMP_NUM_THREADS"),
+    }
+
+
 def time_sync():
     """Synchronizes PyTorch for accurate timing, leveraging CUDA if available, and returns the current time."""
     if torch.cuda.is_available():